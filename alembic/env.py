@@ -12,6 +12,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Импорт базы и моделей
 from app.database.db import Base
 from app.models.ticket import Ticket
+from app.models.country_stats import CountryStats
+from app.models.draw import Draw
+from app.models.archived_ticket import ArchivedTicket
+from app.models.job import Job
+from app.models.ticket_change import TicketChange
+from app.models.activity_rollup import ActivityRollup
 
 # Это объект конфигурации Alembic, который предоставляет доступ к .ini настройкам
 config = context.config
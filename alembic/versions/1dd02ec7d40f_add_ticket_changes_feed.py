@@ -0,0 +1,50 @@
+"""Add ticket_changes table for the change feed
+
+Revision ID: 1dd02ec7d40f
+Revises: 352153a7909f
+Create Date: 2026-10-19 17:02:11.286430
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1dd02ec7d40f'
+down_revision: Union[str, None] = '352153a7909f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ticket_changes',
+        sa.Column('seq', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('ticket_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ticket_number', sa.String(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index(op.f('ix_ticket_changes_ticket_id'), 'ticket_changes', ['ticket_id'], unique=False)
+
+    # Уже существующие билеты попадают в журнал первыми событиями:
+    # клиент с курсором 0 получает полное состояние, дальше - только дельты
+    op.execute(
+        "INSERT INTO ticket_changes (ticket_id, ticket_number, action) "
+        "SELECT id, ticket_number, 'created' FROM tickets ORDER BY created_at"
+    )
+    op.execute(
+        "INSERT INTO ticket_changes (ticket_id, ticket_number, action) "
+        "SELECT id, ticket_number, 'archived' FROM archived_tickets ORDER BY archived_at"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ticket_changes_ticket_id'), table_name='ticket_changes')
+    op.drop_table('ticket_changes')
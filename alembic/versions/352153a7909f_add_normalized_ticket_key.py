@@ -0,0 +1,78 @@
+"""Add normalized ticket_key with unique indexes
+
+Revision ID: 352153a7909f
+Revises: d2a7c94e1f38
+Create Date: 2026-10-19 16:21:47.803512
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '352153a7909f'
+down_revision: Union[str, None] = 'd2a7c94e1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# Копия app.utils.ticket_number на момент миграции: её результат не должен меняться
+# вместе с модулем приложения
+PREFIX_RE = re.compile(r"^\s*baylot:", re.IGNORECASE)
+
+
+def normalize_ticket_number(number: str) -> str:
+    if number is None:
+        return None
+    cleaned = PREFIX_RE.sub("", unicodedata.normalize("NFKC", number)).strip()
+    return "".join(cleaned.split()).upper()
+
+
+def _backfill(table_name: str) -> None:
+    # Ключ считается в Python (NFKC в SQL не посчитать), поэтому заполняем пачками.
+    # Пачки идут по id (keyset), в памяти только одна пачка, а не вся таблица
+    bind = op.get_bind()
+    table = sa.table(table_name, sa.column('id'), sa.column('ticket_number'), sa.column('ticket_key'))
+    update = sa.update(table).where(table.c.id == sa.bindparam('row_id')).values(ticket_key=sa.bindparam('key'))
+    last_id = None
+    while True:
+        query = sa.select(table.c.id, table.c.ticket_number).order_by(table.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = bind.execute(query).all()
+        if not rows:
+            break
+        bind.execute(update, [
+            {'row_id': row_id, 'key': normalize_ticket_number(number)}
+            for row_id, number in rows
+        ])
+        last_id = rows[-1][0]
+
+    # Номера, совпадающие после нормализации, уникальный индекс не пропустит - чинятся вручную
+    duplicates = bind.execute(
+        sa.select(table.c.ticket_key).group_by(table.c.ticket_key).having(sa.func.count() > 1).limit(20)
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"{table_name}: ticket numbers collide after normalization: {duplicates}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table_name in ('tickets', 'archived_tickets'):
+        op.add_column(table_name, sa.Column('ticket_key', sa.String(), nullable=True))
+        _backfill(table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.alter_column('ticket_key', existing_type=sa.String(), nullable=False)
+        op.create_index(op.f(f'ix_{table_name}_ticket_key'), table_name, ['ticket_key'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name in ('archived_tickets', 'tickets'):
+        op.drop_index(op.f(f'ix_{table_name}_ticket_key'), table_name=table_name)
+        op.drop_column(table_name, 'ticket_key')
@@ -0,0 +1,48 @@
+"""Add country_stats rollup and country_code index
+
+Revision ID: 3c1f7a9b2d4e
+Revises: 094f5a90a461
+Create Date: 2026-10-19 10:12:41.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f7a9b2d4e'
+down_revision: Union[str, None] = '094f5a90a461'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_tickets_country_code'), 'tickets', ['country_code'], unique=False)
+    op.create_table(
+        'country_stats',
+        sa.Column('country_code', sa.String(), nullable=False),
+        sa.Column('total_tickets', sa.Integer(), nullable=False),
+        sa.Column('winner_tickets', sa.Integer(), nullable=False),
+        sa.Column('archived_tickets', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('country_code')
+    )
+    # Заполняем счётчики по уже существующим билетам
+    op.execute("""
+        INSERT INTO country_stats (country_code, total_tickets, winner_tickets, archived_tickets)
+        SELECT upper(trim(country_code)),
+               count(*),
+               sum(CASE WHEN is_winner THEN 1 ELSE 0 END),
+               sum(CASE WHEN is_archived THEN 1 ELSE 0 END)
+        FROM tickets
+        WHERE country_code IS NOT NULL AND trim(country_code) <> ''
+        GROUP BY upper(trim(country_code))
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('country_stats')
+    op.drop_index(op.f('ix_tickets_country_code'), table_name='tickets')
@@ -0,0 +1,29 @@
+"""Add eligible set snapshot to draws
+
+Revision ID: 5b9e2d7c4f1a
+Revises: f01291f69996
+Create Date: 2026-10-19 21:17:42.360915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9e2d7c4f1a'
+down_revision: Union[str, None] = 'f01291f69996'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # У прошлых розыгрышей снимка нет - поля остаются пустыми
+    op.add_column('draws', sa.Column('eligible_digest', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('draws', 'eligible_digest')
@@ -0,0 +1,56 @@
+"""Add draw_key to tickets and draws table
+
+Revision ID: 7e2b5c8d1a90
+Revises: 3c1f7a9b2d4e
+Create Date: 2026-10-19 12:03:17.554120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2b5c8d1a90'
+down_revision: Union[str, None] = '3c1f7a9b2d4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tickets', sa.Column('draw_key', sa.BigInteger(), nullable=True))
+
+    # Нумеруем существующие билеты, новые получают ключ через default модели
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE SEQUENCE tickets_draw_key_seq")
+        op.execute("UPDATE tickets SET draw_key = nextval('tickets_draw_key_seq')")
+    else:
+        op.execute("UPDATE tickets SET draw_key = rowid")
+    op.create_index(op.f('ix_tickets_draw_key'), 'tickets', ['draw_key'], unique=True)
+
+    op.create_table(
+        'draws',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('seed', sa.String(), nullable=False),
+        sa.Column('winners_requested', sa.Integer(), nullable=False),
+        sa.Column('country_code', sa.String(), nullable=True),
+        sa.Column('prize_description', sa.String(), nullable=True),
+        sa.Column('method', sa.String(), nullable=False),
+        sa.Column('key_space', sa.BigInteger(), nullable=False),
+        sa.Column('eligible_count', sa.Integer(), nullable=False),
+        sa.Column('winner_ids', sa.Text(), nullable=False),
+        sa.Column('winner_numbers', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('draws')
+    op.drop_index(op.f('ix_tickets_draw_key'), table_name='tickets')
+    op.drop_column('tickets', 'draw_key')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP SEQUENCE tickets_draw_key_seq")
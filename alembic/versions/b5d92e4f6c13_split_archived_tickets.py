@@ -0,0 +1,75 @@
+"""Move archived tickets to archived_tickets table
+
+Revision ID: b5d92e4f6c13
+Revises: 7e2b5c8d1a90
+Create Date: 2026-10-19 13:41:05.210874
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d92e4f6c13'
+down_revision: Union[str, None] = '7e2b5c8d1a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, ticket_number, country_code, image_url, status, is_winner, is_featured, "
+    "is_archived, holder_info, prize_description, created_at, archived_at, "
+    "social_link, wallet_address, draw_key"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'archived_tickets',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ticket_number', sa.String(), nullable=False),
+        sa.Column('country_code', sa.String(), nullable=True),
+        sa.Column('image_url', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('is_winner', sa.Boolean(), nullable=True),
+        sa.Column('is_featured', sa.Boolean(), nullable=True),
+        sa.Column('is_archived', sa.Boolean(), nullable=True),
+        sa.Column('holder_info', sa.String(), nullable=True),
+        sa.Column('prize_description', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('social_link', sa.String(), nullable=True),
+        sa.Column('wallet_address', sa.String(), nullable=True),
+        sa.Column('draw_key', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_tickets_ticket_number'), 'archived_tickets', ['ticket_number'], unique=True)
+    op.create_index(op.f('ix_archived_tickets_country_code'), 'archived_tickets', ['country_code'], unique=False)
+    op.create_index(op.f('ix_archived_tickets_archived_at'), 'archived_tickets', ['archived_at'], unique=False)
+
+    # Переносим архив одной транзакцией миграции: копия + удаление из горячей таблицы
+    op.execute(
+        f"INSERT INTO archived_tickets ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM tickets WHERE is_archived = true"
+    )
+    op.execute("DELETE FROM tickets WHERE is_archived = true")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Возвращаем архив в tickets; ключ розыгрыша нужен уникальный, поэтому выдаём новый
+    if op.get_bind().dialect.name == 'postgresql':
+        draw_key = "nextval('tickets_draw_key_seq')"
+    else:
+        draw_key = "(SELECT coalesce(max(draw_key), 0) FROM tickets) + rowid"
+    op.execute(
+        f"INSERT INTO tickets ({COLUMNS}) "
+        f"SELECT {COLUMNS.replace('draw_key', draw_key)} FROM archived_tickets"
+    )
+    op.drop_index(op.f('ix_archived_tickets_archived_at'), table_name='archived_tickets')
+    op.drop_index(op.f('ix_archived_tickets_country_code'), table_name='archived_tickets')
+    op.drop_index(op.f('ix_archived_tickets_ticket_number'), table_name='archived_tickets')
+    op.drop_table('archived_tickets')
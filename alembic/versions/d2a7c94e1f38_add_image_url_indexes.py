@@ -0,0 +1,29 @@
+"""Add image_url indexes for upload reconciliation
+
+Revision ID: d2a7c94e1f38
+Revises: c8e41f0a7b25
+Create Date: 2026-10-19 15:08:33.419027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7c94e1f38'
+down_revision: Union[str, None] = 'c8e41f0a7b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_tickets_image_url'), 'tickets', ['image_url'], unique=False)
+    op.create_index(op.f('ix_archived_tickets_image_url'), 'archived_tickets', ['image_url'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_archived_tickets_image_url'), table_name='archived_tickets')
+    op.drop_index(op.f('ix_tickets_image_url'), table_name='tickets')
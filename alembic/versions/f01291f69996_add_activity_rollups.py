@@ -0,0 +1,96 @@
+"""Add activity_rollups for hourly and daily ticket activity
+
+Revision ID: f01291f69996
+Revises: 1dd02ec7d40f
+Create Date: 2026-10-19 19:41:05.118204
+
+"""
+import json
+from collections import Counter
+from datetime import timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f01291f69996'
+down_revision: Union[str, None] = '1dd02ec7d40f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+# Копия на момент миграции: её результат не должен меняться вместе с app.utils.timeseries
+BUCKETS = ('hour', 'day')
+COUNTERS = ('tickets_created', 'winners', 'archived', 'unarchived')
+
+
+def bucket_start(moment, bucket: str):
+    # Начало часа или дня в UTC без таймзоны
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _backfill() -> None:
+    # История восстанавливается по датам, которые есть в таблицах: created_at обеих таблиц билетов,
+    # archived_at архива и время розыгрышей. Ручные назначения победителей и разархивации
+    # нигде не датированы - они считаются только с этой миграции
+    bind = op.get_bind()
+    counts = Counter()
+
+    def add(counter, events):
+        # events - пары (время, сколько событий)
+        for moment, amount in events:
+            if moment is None:
+                continue
+            for bucket in BUCKETS:
+                counts[bucket, bucket_start(moment, bucket), counter] += amount
+
+    # Тип колонки нужен, чтобы SQLite отдавал datetime, а не строку
+    for table_name in ('tickets', 'archived_tickets'):
+        table = sa.table(table_name, sa.column('created_at', sa.DateTime()))
+        add('tickets_created', ((moment, 1) for moment in bind.execute(sa.select(table.c.created_at)).scalars()))
+    archived = sa.table('archived_tickets', sa.column('archived_at', sa.DateTime()))
+    add('archived', ((moment, 1) for moment in bind.execute(sa.select(archived.c.archived_at)).scalars()))
+    draws = sa.table('draws', sa.column('created_at', sa.DateTime()), sa.column('winner_ids'))
+    add('winners', (
+        (moment, len(json.loads(winner_ids)))
+        for moment, winner_ids in bind.execute(sa.select(draws.c.created_at, draws.c.winner_ids))
+    ))
+
+    rollups = {}
+    for (bucket, begins, counter), amount in counts.items():
+        row = rollups.setdefault((bucket, begins), {'bucket': bucket, 'bucket_start': begins, **dict.fromkeys(COUNTERS, 0)})
+        row[counter] = amount
+    rows = list(rollups.values())
+    table = sa.table(
+        'activity_rollups',
+        sa.column('bucket'), sa.column('bucket_start', sa.DateTime()), *(sa.column(name) for name in COUNTERS),
+    )
+    for start in range(0, len(rows), BATCH_SIZE):
+        bind.execute(sa.insert(table), rows[start:start + BATCH_SIZE])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'activity_rollups',
+        sa.Column('bucket', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('tickets_created', sa.Integer(), nullable=False),
+        sa.Column('winners', sa.Integer(), nullable=False),
+        sa.Column('archived', sa.Integer(), nullable=False),
+        sa.Column('unarchived', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket', 'bucket_start')
+    )
+    _backfill()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('activity_rollups')
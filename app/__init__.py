@@ -0,0 +1,2 @@
+# .env загружается один раз, до любого модуля, читающего переменные окружения при импорте
+from app import config  # noqa: F401
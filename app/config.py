@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 
+# Единственное место загрузки .env: модуль импортируется из app/__init__.py,
+# поэтому переменные готовы раньше, чем их прочитает любой другой модуль.
 # Попробуем загрузить из разных мест
 env_paths = [
     Path(__file__).parent.parent / '.env',  # Локальная разработка
@@ -1,20 +1,83 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from fastapi import Request
+import itertools
+import logging
+import math
 import os
-from dotenv import load_dotenv
+import time
 
-# Загружаем переменные из .env
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Получаем URL базы данных из переменной окружения
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Реплики для читающих страниц через запятую; пусто - всё идёт в основную базу
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Сколько секунд не трогать реплику после ошибки подключения
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", "30"))
+# Сколько секунд после изменения клиент читает с основной базы (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_PRIMARY_COOKIE = "read_primary_until"
 
-# Подключение к базе
-engine = create_engine(DATABASE_URL)
+# Настройки SQLite для установки на одном сервере (PRAGMA на каждое соединение)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _tune_sqlite(engine, begin: str):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # Транзакции открываем сами в событии begin, а не модулем sqlite3
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        # WAL: читатели не ждут писателя и видят последний закоммиченный снимок
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # В WAL режим NORMAL не портит базу при сбое, теряется максимум последний коммит
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql(begin)
+
+
+def _create_engine(url: str, sqlite_begin: str = "BEGIN", **kwargs):
+    # В SQLite draw_key считается подзапросом max() + 1,
+    # поэтому строки вставляются по одной, без многострочного INSERT ... VALUES
+    engine = create_engine(url, use_insertmanyvalues=not url.startswith("sqlite"), **kwargs)
+    if engine.dialect.name == "sqlite":
+        _tune_sqlite(engine, sqlite_begin)
+    return engine
+
+
+# Подключение к основной базе. Транзакции обычные (в SQLite - отложенный BEGIN):
+# чтение в WAL не блокирует запись и не ждёт её
+engine = _create_engine(DATABASE_URL)
+read_engine = engine
+
+# SQLite пишет только одной транзакцией за раз. Сессии, которые будут писать, открываются
+# BEGIN IMMEDIATE на отдельном движке: очередь на запись сразу ждёт busy_timeout, а не падает
+# с "database is locked" посреди транзакции при попытке чтение -> запись. Блокировка держится
+# всю транзакцию, поэтому такие сессии - только для изменений.
+# In-memory база у каждого движка своя - там движок один
+if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+    write_engine = _create_engine(DATABASE_URL, sqlite_begin="BEGIN IMMEDIATE")
+else:
+    write_engine = engine
 
 # Создание сессии
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# writer: в Postgres такие сессии в начале транзакции берут лок журнала изменений (app.utils.change_feed)
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=write_engine, info={"writer": True})
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -26,3 +89,79 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Сессия для обработчиков, которые изменяют данные
+def get_write_db():
+    db = WriteSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ReplicaSet:
+    # Реплики по кругу. pool_pre_ping проверяет соединение при выдаче из пула,
+    # а реплика, к которой не удалось подключиться, пропускается REPLICA_RETRY_INTERVAL секунд
+    def __init__(self, urls: list, retry_interval: float = REPLICA_RETRY_INTERVAL):
+        self.engines = [_create_engine(url, pool_pre_ping=True) for url in urls]
+        self.retry_interval = retry_interval
+        self._down_until = [0.0] * len(self.engines)
+        self._turn = itertools.count()
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def connect(self):
+        # Соединение с очередной живой репликой; None - все недоступны
+        now = time.monotonic()
+        start = next(self._turn)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self._down_until[index] > now:
+                continue
+            try:
+                return self.engines[index].connect()
+            except DBAPIError as e:
+                logger.warning(f"Replica {index} is unavailable for {self.retry_interval}s: {str(e)}")
+                self._down_until[index] = now + self.retry_interval
+        return None
+
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS)
+
+
+def reads_own_writes(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def mark_read_primary(response):
+    # Ставится после успешного изменения: свои записи клиент сразу увидит, даже если реплика,
+    # снимок в памяти или статический файл отстают
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        str(time.time() + READ_YOUR_WRITES_SECONDS),
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+        httponly=True,
+        samesite="lax",
+    )
+
+
+# Сессия для обработчиков, которые только читают: реплика, если она есть и доступна, иначе основная база
+def get_read_db(request: Request):
+    connection = None
+    if replicas and not reads_own_writes(request):
+        connection = replicas.connect()
+    db = ReadSessionLocal(bind=connection) if connection is not None else ReadSessionLocal()
+    db.info["route"] = "replica" if connection is not None else "primary"
+    # Клиент недавно писал: снимки в памяти, отставшие от записей, ему не отдаём (app.utils.hot_snapshot)
+    db.info["own_writes"] = reads_own_writes(request)
+    try:
+        yield db
+    finally:
+        db.close()
+        if connection is not None:
+            connection.close()
@@ -0,0 +1,453 @@
+"""Запуск в продакшене: python -m app.launcher
+
+Мастер один раз импортирует приложение и открывает сокет, воркеры - его fork'и:
+импорт не повторяется, память под код общая (copy-on-write). Пулы соединений
+с базой каждый воркер открывает свои после fork. Число воркеров - по ядрам и
+загрузке, воркер перезапускается после WORKER_MAX_REQUESTS запросов.
+
+SIGHUP - плавный перезапуск: мастер перечитывает код (exec в том же PID, сокет
+остаётся открытым) и меняет воркеров по одному: новый поднимается, и только
+после его прогрева старый перестаёт принимать соединения и дорабатывает начатые.
+SIGTERM/SIGINT - остановка с тем же дожиданием начатых запросов.
+"""
+import logging
+import os
+import random
+import selectors
+import signal
+import socket
+import sys
+import time
+from typing import Optional
+
+import uvicorn
+
+# При запуске через -m __name__ - "__main__"
+logger = logging.getLogger("app.launcher")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Фиксированное число воркеров; 0 - по ядрам и загрузке в пределах WORKERS_MIN..WORKERS_MAX
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+WORKERS_MIN = int(os.getenv("WORKERS_MIN", "1"))
+# 0 - по числу доступных ядер: обработчики упираются в CPU (GIL), больше воркеров, чем ядер, не быстрее
+WORKERS_MAX = int(os.getenv("WORKERS_MAX", "0"))
+# Раз в столько секунд мастер смотрит загрузку воркеров и добавляет или убирает одного; 0 - не менять
+WORKER_SCALE_INTERVAL = float(os.getenv("WORKER_SCALE_INTERVAL", "30"))
+# Перезапуск воркера после стольких запросов (плюс случайно до JITTER, чтобы не все сразу); 0 - без перезапуска
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000"))
+# Сколько ждать начатые запросы останавливаемого воркера, потом SIGKILL
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Воркер, не прогревшийся за это время, убивается
+WORKER_BOOT_TIMEOUT = float(os.getenv("WORKER_BOOT_TIMEOUT", "60"))
+
+# Средняя загрузка воркера (доля ядра), выше которой добавляем воркера,
+# и ниже которой (если нагрузку потянет на одного меньше) убираем
+SCALE_UP_CPU = 0.75
+SCALE_DOWN_CPU = 0.25
+
+# Сообщения воркера мастеру по его каналу
+READY = b"r"
+RETIRE = b"m"
+
+# Через эти переменные мастер передаёт себе после exec сокет и живых воркеров
+LISTEN_FD_ENV = "LAUNCHER_LISTEN_FD"
+WORKERS_ENV = "LAUNCHER_WORKERS"
+
+
+def usable_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def initial_workers(cores: int, minimum: int, maximum: int) -> int:
+    # Ядра, уже занятые другими процессами (load average за минуту), воркерам не достанутся
+    try:
+        busy = int(os.getloadavg()[0])
+    except OSError:
+        busy = 0
+    return max(minimum, min(maximum, cores - busy))
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    # utime + stime процесса из /proc; None - нет /proc (не Linux) или процесса
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Имя процесса в скобках может содержать пробелы - поля считаем после него
+            fields = f.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _dispose_engines():
+    # Соединения, открытые до fork, принадлежат мастеру: закрывать их нельзя, а пул воркера начинается пустым
+    from app.database.db import engine, read_engine, write_engine, replicas
+
+    for pooled in {engine, read_engine, write_engine, *replicas.engines}:
+        pooled.dispose(close=False)
+
+
+class WorkerServer(uvicorn.Server):
+    # uvicorn в воркере: сообщает мастеру о готовности и о достижении лимита запросов.
+    # По лимиту не выходит сам, а ждёт SIGTERM - мастер пришлёт его, когда замена прогреется
+    def __init__(self, config: uvicorn.Config, channel: int, master_pid: int, max_requests: int):
+        super().__init__(config)
+        self.channel = channel
+        self.master_pid = master_pid
+        self.max_requests = max_requests
+        self.retiring = False
+
+    def _tell(self, message: bytes):
+        try:
+            os.write(self.channel, message)
+        except OSError:
+            pass
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started:
+            self._tell(READY)
+
+    async def on_tick(self, counter: int) -> bool:
+        if os.getppid() != self.master_pid:
+            # Мастера нет - заменить или остановить воркер больше некому
+            logger.warning(f"Worker {os.getpid()}: master is gone, shutting down")
+            self.should_exit = True
+        elif self.max_requests and not self.retiring and self.server_state.total_requests >= self.max_requests:
+            self.retiring = True
+            logger.info(f"Worker {os.getpid()} served {self.server_state.total_requests} requests, asking for a replacement")
+            self._tell(RETIRE)
+        return await super().on_tick(counter)
+
+
+class Worker:
+    # Воркер глазами мастера
+    def __init__(self, pid: int, channel: int, ready: bool = False):
+        self.pid = pid
+        self.channel = channel
+        self.ready = ready
+        self.started_at = time.monotonic()
+        # Нужна замена: SIGHUP или лимит запросов
+        self.retire = False
+        # PID воркера, которого этот сменит, когда прогреется
+        self.replaces = None
+        self.stop_at = None
+        self.killed = False
+        self.cpu = None
+
+
+class Master:
+    def __init__(self, config: uvicorn.Config):
+        self.config = config
+        self.pid = os.getpid()
+        self.cores = usable_cores()
+        self.minimum = max(1, WORKERS_MIN)
+        self.maximum = max(self.minimum, WORKERS_MAX or self.cores)
+        self.autoscale = not WEB_CONCURRENCY and WORKER_SCALE_INTERVAL > 0
+        self.workers = {}
+        self.selector = selectors.DefaultSelector()
+        self.sock = None
+        self.wake = None
+        self.loaded = False
+        self.stopping = False
+        self.exit_code = 0
+        # Воркеры падают при старте - новых не поднимаем до этого момента
+        self.backoff_until = 0.0
+        self.boot_failures = 0
+        self.ever_ready = False
+        self.scaled_at = time.monotonic()
+        self.target = 0
+
+    def setup(self):
+        inherited_fd = os.environ.pop(LISTEN_FD_ENV, None)
+        inherited = os.environ.pop(WORKERS_ENV, "")
+        if inherited_fd is not None:
+            self.sock = socket.socket(fileno=int(inherited_fd))
+            self._adopt(inherited)
+        else:
+            self.sock = self.config.bind_socket()
+            # Соединения копятся в очереди ядра, пока воркеры прогреваются
+            self.sock.listen(self.config.backlog)
+
+        try:
+            # Импорт приложения один раз, до fork
+            self.config.load()
+            self.loaded = True
+        except (Exception, SystemExit):
+            if not self.workers:
+                raise
+            logger.exception("Failed to load the application, keeping the running workers; fix it and send SIGHUP again")
+
+        if self.workers:
+            # После перезапуска мастера число воркеров не меняем
+            self.target = len([w for w in self.workers.values() if w.stop_at is None]) or self.minimum
+        elif WEB_CONCURRENCY:
+            self.target = WEB_CONCURRENCY
+        else:
+            self.target = initial_workers(self.cores, self.minimum, self.maximum)
+        logger.info(f"Master {self.pid}: {self.target} worker(s), {self.cores} core(s)")
+
+    def _adopt(self, inherited: str):
+        # Воркеры прошлого мастера работают на старом коде - все идут на замену
+        for item in filter(None, inherited.split(",")):
+            pid, channel, state = item.split(":")
+            worker = Worker(int(pid), int(channel), ready=state != "booting")
+            worker.retire = True
+            if state == "stopping":
+                worker.stop_at = time.monotonic()
+            self._watch(worker)
+
+    def _watch(self, worker: Worker):
+        self.workers[worker.pid] = worker
+        os.set_blocking(worker.channel, False)
+        self.selector.register(worker.channel, selectors.EVENT_READ, worker)
+
+    def _forget(self, worker: Worker):
+        self.workers.pop(worker.pid, None)
+        self.selector.unregister(worker.channel)
+        os.close(worker.channel)
+        for other in self.workers.values():
+            if other.replaces == worker.pid:
+                # Заменять некого - новый воркер просто занимает место
+                other.replaces = None
+
+    def spawn(self, replaces: Optional[int] = None):
+        read_fd, write_fd = os.pipe()
+        max_requests = WORKER_MAX_REQUESTS + random.randint(0, WORKER_MAX_REQUESTS_JITTER) if WORKER_MAX_REQUESTS else 0
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_worker(write_fd, max_requests)
+        os.close(write_fd)
+        worker = Worker(pid, read_fd)
+        worker.replaces = replaces
+        self._watch(worker)
+        if replaces:
+            logger.info(f"Started worker {pid} to replace {replaces}")
+        else:
+            logger.info(f"Started worker {pid}")
+
+    def _run_worker(self, channel: int, max_requests: int):
+        code = 0
+        try:
+            signal.set_wakeup_fd(-1)
+            for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(sig, signal.SIG_DFL)
+            # Каналы других воркеров и selector мастера воркеру не нужны
+            for key in list(self.selector.get_map().values()):
+                os.close(key.fd)
+            self.selector.close()
+            os.close(self.wake)
+            _dispose_engines()
+            WorkerServer(self.config, channel, self.pid, max_requests).run(sockets=[self.sock])
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, worker: Worker):
+        if worker.stop_at is not None:
+            return
+        worker.stop_at = time.monotonic()
+        self._signal(worker, signal.SIGTERM)
+
+    def _signal(self, worker: Worker, sig: int):
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def run(self) -> int:
+        wake_read, wake_write = os.pipe()
+        os.set_blocking(wake_read, False)
+        os.set_blocking(wake_write, False)
+        # Номера сигналов приходят байтами в этот канал, обработчики ничего не делают
+        signal.set_wakeup_fd(wake_write)
+        self.wake = wake_write
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, lambda *_: None)
+        self.selector.register(wake_read, selectors.EVENT_READ, None)
+
+        while True:
+            self._maintain()
+            if self.stopping and not self.workers:
+                return self.exit_code
+            for key, _ in self.selector.select(timeout=1.0):
+                if key.data is None:
+                    for sig in os.read(wake_read, 64):
+                        self._on_signal(sig)
+                else:
+                    self._on_message(key.data)
+            self._reap()
+
+    def _on_signal(self, sig: int):
+        if sig == signal.SIGHUP and not self.stopping:
+            self.restart()
+        elif sig in (signal.SIGTERM, signal.SIGINT):
+            if self.stopping:
+                # Повторный сигнал - не ждём начатые запросы
+                for worker in self.workers.values():
+                    self._signal(worker, signal.SIGKILL)
+                return
+            logger.info(f"Master {self.pid}: shutting down")
+            self.stopping = True
+            for worker in list(self.workers.values()):
+                self.stop(worker)
+
+    def _on_message(self, worker: Worker):
+        try:
+            data = os.read(worker.channel, 64)
+        except BlockingIOError:
+            return
+        for message in (data[i:i + 1] for i in range(len(data))):
+            if message == READY:
+                worker.ready = True
+                self.ever_ready = True
+                self.boot_failures = 0
+                logger.info(f"Worker {worker.pid} is ready")
+                old = self.workers.get(worker.replaces)
+                worker.replaces = None
+                if old is not None:
+                    self.stop(old)
+            elif message == RETIRE:
+                worker.retire = True
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.get(pid)
+            if worker is None:
+                continue
+            self._forget(worker)
+            if worker.stop_at is not None:
+                continue
+            if os.WIFSIGNALED(status):
+                reason = f"signal {os.WTERMSIG(status)}"
+            else:
+                reason = f"code {os.waitstatus_to_exitcode(status)}"
+            if worker.ready:
+                logger.warning(f"Worker {pid} exited with {reason}")
+                continue
+            self.boot_failures += 1
+            logger.error(f"Worker {pid} failed to boot ({reason})")
+            if not self.ever_ready and not self.workers:
+                # Ни один воркер так и не поднялся - повторять бесполезно
+                logger.error(f"Master {self.pid}: workers cannot boot, shutting down")
+                self.stopping = True
+                self.exit_code = 1
+            self.backoff_until = time.monotonic() + min(30, 2 ** self.boot_failures)
+
+    def _maintain(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.stop_at is not None and not worker.killed and now - worker.stop_at > GRACEFUL_TIMEOUT + 5:
+                logger.warning(f"Worker {worker.pid} did not stop in time, killing")
+                worker.killed = True
+                self._signal(worker, signal.SIGKILL)
+            elif not worker.ready and worker.stop_at is None and now - worker.started_at > WORKER_BOOT_TIMEOUT:
+                logger.error(f"Worker {worker.pid} did not boot in {WORKER_BOOT_TIMEOUT}s, killing")
+                worker.stop_at = now
+                worker.killed = True
+                self._signal(worker, signal.SIGKILL)
+                self.boot_failures += 1
+                self.backoff_until = now + min(30, 2 ** self.boot_failures)
+        if self.stopping or not self.loaded:
+            return
+
+        if self.autoscale and now - self.scaled_at >= WORKER_SCALE_INTERVAL:
+            self._scale(now)
+
+        live = [w for w in self.workers.values() if w.stop_at is None]
+        # Место занимают все живые, кроме новых, которые ещё только меняют старых
+        slots = [w for w in live if w.replaces is None]
+        if len(slots) > self.target:
+            # Лишних убираем: сначала ждущих замены, потом не прогретых, потом самых старых
+            extra = sorted(slots, key=lambda w: (not w.retire, w.ready, w.started_at))
+            for worker in extra[:len(slots) - self.target]:
+                self.stop(worker)
+            return
+        if now < self.backoff_until:
+            return
+        if len(slots) < self.target:
+            for _ in range(self.target - len(slots)):
+                self.spawn()
+            return
+        if any(not w.ready for w in live):
+            # Меняем по одному: следующего, когда предыдущая замена прогрелась
+            return
+        for worker in live:
+            if worker.retire:
+                self.spawn(replaces=worker.pid)
+                return
+
+    def _scale(self, now: float):
+        elapsed = now - self.scaled_at
+        self.scaled_at = now
+        busy = 0.0
+        ready = [w for w in self.workers.values() if w.ready and w.stop_at is None]
+        for worker in ready:
+            cpu = cpu_seconds(worker.pid)
+            if cpu is None:
+                logger.info("Worker CPU usage is not available, autoscaling is off")
+                self.autoscale = False
+                return
+            if worker.cpu is not None:
+                busy += (cpu - worker.cpu) / elapsed
+            worker.cpu = cpu
+        if not ready or len(ready) < self.target:
+            return
+        try:
+            load = os.getloadavg()[0]
+        except OSError:
+            load = 0.0
+        # Добавлять есть смысл, только пока на машине остаются свободные ядра
+        if busy / len(ready) > SCALE_UP_CPU and self.target < self.maximum and load < self.cores:
+            self.target += 1
+            logger.info(f"Workers are {busy / len(ready):.0%} busy on average, scaling up to {self.target}")
+        elif self.target > self.minimum and busy / (len(ready) - 1) < SCALE_DOWN_CPU:
+            self.target -= 1
+            logger.info(f"Workers are {busy / len(ready):.0%} busy on average, scaling down to {self.target}")
+
+    def restart(self):
+        # exec в том же PID: новый код и настройки, сокет и воркеры переходят новому мастеру
+        logger.info(f"Master {self.pid}: reloading")
+        self.sock.set_inheritable(True)
+        workers = []
+        for worker in self.workers.values():
+            os.set_inheritable(worker.channel, True)
+            state = "stopping" if worker.stop_at is not None else "ready" if worker.ready else "booting"
+            workers.append(f"{worker.pid}:{worker.channel}:{state}")
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[WORKERS_ENV] = ",".join(workers)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, "-m", "app.launcher"])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    config = uvicorn.Config(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    master = Master(config)
+    master.setup()
+    sys.exit(master.run())
+
+
+if __name__ == "__main__":
+    main()
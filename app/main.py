@@ -1,26 +1,50 @@
 from fastapi import FastAPI, Request, Depends, HTTPException, status
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.utils.template_engine import templates
-from app.database.db import Base, engine, get_db
+from app.utils.streaming import stream_template, stream_query, stream_json
+from app.utils.single_flight import coalesce
+from app.utils.rate_limit import AdmissionControlMiddleware
+from app.database.db import Base, engine, get_db, get_read_db, mark_read_primary
 from app.models.ticket import Ticket
+from app.models.archived_ticket import ArchivedTicket
 from app.routers import ticket
 from app.utils.country_names import country_name_map
+from app.utils.archive import archive_summary
+from app.utils.country_stats import get_country_stats, normalize_country_code
+from app.utils.timeseries import get_timeseries, TimeseriesError
+from app.utils.ticket_number import normalize_ticket_number
+from app.utils.solana import close_client as close_solana_client
+from app.utils.jobs import runner as job_runner, JOBS_ENABLED
+from app.utils.ticket_index import keep_index_fresh, ticket_numbers
+from app.utils.fuzzy_index import fuzzy_numbers
+from app.utils.hot_snapshot import hot_tickets, keep_snapshot_fresh
+from app.utils.static_snapshot import (
+    StaticSnapshot, StaticSnapshotMiddleware, keep_static_fresh, STATIC_SNAPSHOT_ENABLED
+)
+from app.utils.warmup import warm_up, WARMUP_TIMEOUT
+from app.utils.deadlines import RequestDeadlineMiddleware
+from app.utils.memory_profile import (
+    RequestMemoryMiddleware, MemoryProfilingError, MEMORY_TRACKING_ENABLED, MEMORY_TRACE_FRAMES,
+    start_tracing, stop_tracing, memory_status, take_snapshot, diff_snapshot
+)
+from app.utils.traffic_capture import TrafficCaptureMiddleware, TRAFFIC_CAPTURE_ENABLED, start_capture, stop_capture
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
+from datetime import datetime
+import asyncio
 import secrets
 import logging
 import os
-from dotenv import load_dotenv
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Загружаем переменные из .env
-load_dotenv()
-
 # Переменные окружения с значениями по умолчанию
 DOCS_USERNAME = os.getenv("DOCS_USERNAME", "admin")
 DOCS_PASSWORD = os.getenv("DOCS_PASSWORD", "secre123")
@@ -42,7 +66,41 @@ def protect_docs(credentials: HTTPBasicCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Basic"},
         )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    if TRAFFIC_CAPTURE_ENABLED:
+        start_capture()
+    if MEMORY_TRACKING_ENABLED:
+        start_tracing()
+    # Папки для StaticFiles создаём при старте, а не при импорте модулей
+    os.makedirs(ticket.UPLOAD_DIR, exist_ok=True)
+    # Соединения, шаблоны и кэши греем до приёма запросов, чтобы первый запрос их не ждал
+    try:
+        await asyncio.wait_for(run_in_threadpool(warm_up), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up did not finish in {WARMUP_TIMEOUT}s, starting anyway")
+    if JOBS_ENABLED:
+        await job_runner.start()
+    # Индексы номеров для /tickets/suggest и /tickets/search/fuzzy строятся в фоне, старт не ждёт
+    index_task = asyncio.create_task(keep_index_fresh([ticket_numbers, fuzzy_numbers]))
+    # Избранные, победители и последний билет в памяти; первый снимок собран в warm_up
+    snapshot_task = asyncio.create_task(keep_snapshot_fresh(hot_tickets))
+    # Главная, списки и их JSON-версии файлами на диске; перерисовка после коммитов
+    static_task = asyncio.create_task(keep_static_fresh(static_pages)) if STATIC_SNAPSHOT_ENABLED else None
+    app.state.ready = True
+    yield
+    index_task.cancel()
+    snapshot_task.cancel()
+    if static_task:
+        static_task.cancel()
+    await job_runner.stop()
+    # Закрываем общий пул соединений к Solana RPC
+    await close_solana_client()
+    stop_capture()
+
 app = FastAPI(
+    lifespan=lifespan,
     docs_url=None,
     redoc_url=None,
     openapi_url="/api/openapi.json",
@@ -61,13 +119,42 @@ async def log_errors(request: Request, call_next):
         logger.error(f"Error processing request {request.url}: {str(e)}")
         raise
 
+# После успешного изменения клиент какое-то время читает с основной базы, а не с реплики,
+# и мимо отставших снимков (hot_snapshot, static_snapshot)
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_read_primary(response)
+    return response
+
+# Дедлайны и отмена по уходу клиента для GET; прерывает запросы к базе брошенных страниц
+app.add_middleware(RequestDeadlineMiddleware)
+
+# Пик памяти по тяжёлым маршрутам, пока включён tracemalloc
+app.add_middleware(RequestMemoryMiddleware)
+
+# Готовые файлы публичных страниц; внутри лимитов, но до остальных middleware и обработчиков
+static_pages = StaticSnapshot(app, admin_key=ticket.ADMIN_KEY)
+if STATIC_SNAPSHOT_ENABLED:
+    app.add_middleware(StaticSnapshotMiddleware, snapshot=static_pages)
+
+# Лимиты по IP и общий лимит одновременных запросов; запросы с ADMIN_KEY идут в приоритете
+app.add_middleware(AdmissionControlMiddleware, admin_key=ticket.ADMIN_KEY)
+
+# Запись выборки запросов для scripts/replay_traffic.py; снаружи всех слоёв,
+# чтобы в файл попадали и отказы лимитов (429/503) с полным временем ответа
+if TRAFFIC_CAPTURE_ENABLED:
+    app.add_middleware(TrafficCaptureMiddleware)
+
 def get_country_name(code: str):
     return country_name_map.get(code.upper(), code)
 templates.env.filters["country_name"] = get_country_name
 
 app.include_router(ticket.router)
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploaded_tickets", StaticFiles(directory="uploaded_tickets"), name="uploaded_tickets")
+# Папка может появиться только в lifespan, поэтому не проверяем её при импорте
+app.mount(f"/{ticket.UPLOAD_DIR}", StaticFiles(directory=ticket.UPLOAD_DIR, check_dir=False), name="uploaded_tickets")
 
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui(credentials: HTTPBasicCredentials = Depends(protect_docs)):
@@ -92,10 +179,25 @@ async def get_openapi(credentials: HTTPBasicCredentials = Depends(protect_docs))
 async def health_check():
     return {"status": "healthy", "message": "Metabase API is running"}
 
+@app.get("/ready")
+async def readiness_check(request: Request):
+    # 200 только после прогрева в lifespan; индексы номеров могут ещё достраиваться в фоне
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {
+        "status": "ready",
+        "suggest_index": ticket_numbers.ready,
+        "fuzzy_index": fuzzy_numbers.ready,
+        # version < tickets_version - снимок ещё не видит последние коммиты этого процесса с билетами
+        "hot_snapshot": hot_tickets.status(),
+        "static_snapshot": static_pages.status() if STATIC_SNAPSHOT_ENABLED else None,
+    }
+
 @app.get("/")
+@coalesce
 async def read_root(
     request: Request, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     status: bool = False,
     support: bool = False,
     about: bool = False,
@@ -103,15 +205,24 @@ async def read_root(
     prizes: bool = False
 ):
     try:
-        tickets = db.query(Ticket).filter(Ticket.is_archived == False).order_by(Ticket.created_at.desc()).all()
-        featured_tickets = db.query(Ticket).filter(Ticket.is_featured == True, Ticket.is_archived == False).all()
-        archived_tickets = db.query(Ticket).filter(Ticket.is_archived == True).order_by(Ticket.archived_at.desc()).all()
-        
-        return templates.TemplateResponse("all_tickets.html", {
+        tickets_count = db.query(Ticket).count()
+        tickets = stream_query(db.query(Ticket).order_by(Ticket.created_at.desc()))
+        featured_tickets = hot_tickets.featured(db)
+        # Архив нужен только на странице архива
+        archived_tickets = []
+        archive_stats = None
+        if archiv:
+            archived_tickets = stream_query(db.query(ArchivedTicket).order_by(ArchivedTicket.archived_at.desc()))
+            archive_stats = archive_summary(db)
+
+        return stream_template("all_tickets.html", {
             "request": request,
             "tickets": tickets,
+            "tickets_count": tickets_count,
+            "total_tickets_count": tickets_count,
             "featured_tickets": featured_tickets,
             "archived_tickets": archived_tickets,
+            "archive_stats": archive_stats,
             "number": None,
             "winners_only": False,
             "found": None,
@@ -126,47 +237,59 @@ async def read_root(
         raise
 
 @app.get("/tickets/all/html")
+@coalesce
 async def get_all_tickets_html(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     number: str = None,
     winners_only: bool = False,
+    country: str = None,
     status: bool = False,
     support: bool = False,
     about: bool = False,
     archiv: bool = False,
     prizes: bool = False
 ):
-    query = db.query(Ticket).filter(Ticket.is_archived == False)
+    query = db.query(Ticket)
+    total_tickets_count = query.count()
     
     if number:
-        query = query.filter(Ticket.ticket_number.ilike(f"%{number}%"))
+        query = query.filter(Ticket.ticket_key.contains(normalize_ticket_number(number), autoescape=True))
     
     if winners_only:
         query = query.filter(Ticket.is_winner == True)
     
-    tickets = query.order_by(Ticket.created_at.desc()).all()
-    
-    featured_tickets = db.query(Ticket).filter(
-        Ticket.is_featured == True, 
-        Ticket.is_archived == False
-    ).all()
+    country = normalize_country_code(country)
+    if country:
+        query = query.filter(Ticket.country_code == country)
     
-    archived_tickets = db.query(Ticket).filter(
-        Ticket.is_archived == True
-    ).order_by(Ticket.archived_at.desc()).all()
+    tickets_count = query.count()
     
     found = None
     if number:
-        found = any(number.lower() in ticket.ticket_number.lower() for ticket in tickets)
+        found = tickets_count > 0
+    tickets = stream_query(query.order_by(Ticket.created_at.desc()))
     
-    return templates.TemplateResponse("all_tickets.html", {
+    featured_tickets = hot_tickets.featured(db)
+    
+    # Архив нужен только на странице архива
+    archived_tickets = []
+    archive_stats = None
+    if archiv:
+        archived_tickets = stream_query(db.query(ArchivedTicket).order_by(ArchivedTicket.archived_at.desc()))
+        archive_stats = archive_summary(db)
+    
+    return stream_template("all_tickets.html", {
         "request": request,
         "tickets": tickets,
+        "tickets_count": tickets_count,
+        "total_tickets_count": total_tickets_count,
         "featured_tickets": featured_tickets,
         "archived_tickets": archived_tickets,
+        "archive_stats": archive_stats,
         "number": number,
         "winners_only": winners_only,
+        "country": country,
         "found": found,
         "status_page": status,
         "support_page": support,
@@ -177,27 +300,94 @@ async def get_all_tickets_html(
 
 @app.get("/admin")
 async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
-    winner_tickets = db.query(Ticket).filter(Ticket.is_winner == True).order_by(Ticket.created_at.desc()).all()
+    # Победители из живых билетов и из архива
+    winner_tickets = hot_tickets.all_winners(db)
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
         "winner_tickets": winner_tickets
     })
 
+def check_admin_key(admin_key: str):
+    if admin_key != ticket.ADMIN_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.get("/admin/memory")
+async def memory_status_api(admin_key: str):
+    # Состояние tracemalloc и пики памяти по маршрутам из MEMORY_TRACKED_ROUTES
+    check_admin_key(admin_key)
+    return memory_status()
+
+@app.post("/admin/memory/tracing")
+async def memory_tracing_api(admin_key: str, enabled: bool, frames: int = MEMORY_TRACE_FRAMES):
+    check_admin_key(admin_key)
+    if enabled:
+        start_tracing(max(1, frames))
+    else:
+        stop_tracing()
+    return memory_status()
+
+@app.post("/admin/memory/snapshot")
+async def memory_snapshot_api(admin_key: str, group_by: str = "lineno", limit: int = 20):
+    # Снимок большой кучи занимает секунды - не держим event loop
+    check_admin_key(admin_key)
+    try:
+        return await run_in_threadpool(take_snapshot, group_by, limit)
+    except MemoryProfilingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/memory/diff")
+async def memory_diff_api(admin_key: str, group_by: str = "lineno", limit: int = 20, reset: bool = False):
+    # Рост памяти с последнего /admin/memory/snapshot
+    check_admin_key(admin_key)
+    try:
+        return await run_in_threadpool(diff_snapshot, group_by, limit, reset)
+    except MemoryProfilingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/archived-tickets")
-async def get_archived_tickets_api(db: Session = Depends(get_db)):
-    archived_tickets = db.query(Ticket).filter(Ticket.is_archived == True).order_by(Ticket.archived_at.desc()).all()
-    return archived_tickets
+async def get_archived_tickets_api(db: Session = Depends(get_read_db)):
+    # Стримим курсором: архив растёт без ограничений
+    return stream_json(db.query(ArchivedTicket).order_by(ArchivedTicket.archived_at.desc()))
 
 @app.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    total_tickets = db.query(Ticket).count()
-    winner_tickets = db.query(Ticket).filter(Ticket.is_winner == True).count()
-    archived_tickets = db.query(Ticket).filter(Ticket.is_archived == True).count()
-    featured_tickets = db.query(Ticket).filter(Ticket.is_featured == True).count()
+@coalesce
+async def get_stats(db: Session = Depends(get_read_db)):
+    # Считаем по обеим таблицам: живые билеты + архив
+    archived_tickets = db.query(ArchivedTicket).count()
+    total_tickets = db.query(Ticket).count() + archived_tickets
+    winner_tickets = (
+        db.query(Ticket).filter(Ticket.is_winner == True).count()
+        + db.query(ArchivedTicket).filter(ArchivedTicket.is_winner == True).count()
+    )
+    featured_tickets = (
+        db.query(Ticket).filter(Ticket.is_featured == True).count()
+        + db.query(ArchivedTicket).filter(ArchivedTicket.is_featured == True).count()
+    )
     
     return {
         "total_tickets": total_tickets,
         "winner_tickets": winner_tickets,
         "archived_tickets": archived_tickets,
         "featured_tickets": featured_tickets
-    }
\ No newline at end of file
+    }
+
+@app.get("/stats/countries")
+@coalesce
+async def get_country_stats_api(db: Session = Depends(get_read_db)):
+    # Готовые счётчики из country_stats, без сканирования билетов
+    return get_country_stats(db)
+
+@app.get("/stats/timeseries")
+@coalesce
+async def get_timeseries_api(
+    bucket: str = "day",
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(get_read_db)
+):
+    # Создано билетов, победителей и архивных операций по часам или дням из activity_rollups.
+    # Без start отдаём последние DEFAULT_BUCKETS периодов до end (по умолчанию - до текущего)
+    try:
+        return get_timeseries(db, bucket, start, end)
+    except TimeseriesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from app.database.db import Base
+
+class ActivityRollup(Base):
+    # Счётчики событий по часам и по дням для /stats/timeseries,
+    # обновляются в той же транзакции, что и билеты (app/utils/timeseries.py)
+    __tablename__ = "activity_rollups"
+
+    # hour / day
+    bucket = Column(String, primary_key=True)
+    # Начало периода в UTC, без таймзоны: одинаково сравнивается в Postgres и SQLite
+    bucket_start = Column(DateTime, primary_key=True)
+    tickets_created = Column(Integer, nullable=False, default=0)
+    winners = Column(Integer, nullable=False, default=0)
+    archived = Column(Integer, nullable=False, default=0)
+    unarchived = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, BigInteger, DateTime
+from app.database.db import Base
+from app.models.ticket import TicketColumns
+
+class ArchivedTicket(TicketColumns, Base):
+    # Холодная часть: архивные билеты не мешают запросам по живым
+    __tablename__ = "archived_tickets"
+
+    archived_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # Ключ розыгрыша сохраняется только для истории, при разархивации выдаётся новый
+    draw_key = Column(BigInteger, nullable=True)
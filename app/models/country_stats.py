@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, Integer
+from app.database.db import Base
+
+class CountryStats(Base):
+    # Счётчики по странам, обновляются в той же транзакции, что и билеты
+    __tablename__ = "country_stats"
+
+    country_code = Column(String, primary_key=True)
+    total_tickets = Column(Integer, nullable=False, default=0)
+    winner_tickets = Column(Integer, nullable=False, default=0)
+    archived_tickets = Column(Integer, nullable=False, default=0)
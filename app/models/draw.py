@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database.db import Base
+
+class Draw(Base):
+    # Журнал розыгрышей: по seed, key_space и снимку подходящих билетов результат можно пересчитать
+    __tablename__ = "draws"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    seed = Column(String, nullable=False)
+    winners_requested = Column(Integer, nullable=False)
+    country_code = Column(String, nullable=True)
+    prize_description = Column(String, nullable=True)
+    method = Column(String, nullable=False)
+    key_space = Column(BigInteger, nullable=False)
+    eligible_count = Column(Integer, nullable=False)
+    # Отпечаток набора подходящих билетов: "min:max:sum" их draw_key
+    eligible_digest = Column(String, nullable=True)
+    winner_ids = Column(Text, nullable=False)
+    winner_numbers = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
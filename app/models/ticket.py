@@ -1,16 +1,42 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Boolean
-from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Boolean, BigInteger, Sequence, Uuid
+from sqlalchemy.sql import func, expression
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import validates
 from app.database.db import Base
+from app.utils.ticket_number import normalize_ticket_number
 
-class Ticket(Base):
-    __tablename__ = "tickets"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+# Отдельно от колонки, чтобы create_all создавал sequence в Postgres
+draw_key_seq = Sequence("tickets_draw_key_seq", metadata=Base.metadata)
+
+
+class next_draw_key(expression.FunctionElement):
+    # Плотный номер билета для розыгрыша: sequence в Postgres, max + 1 в SQLite
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(next_draw_key)
+def _next_draw_key_default(element, compiler, **kw):
+    # Вычисляется один раз на INSERT, см. use_insertmanyvalues в app/database/db.py
+    return "(SELECT coalesce(max(draw_key), 0) + 1 FROM tickets)"
+
+
+@compiles(next_draw_key, "postgresql")
+def _next_draw_key_postgresql(element, compiler, **kw):
+    return "nextval('tickets_draw_key_seq')"
+
+
+class TicketColumns:
+    # Общие колонки для живых билетов и архива (archived_tickets)
+    # Uuid: родной uuid в Postgres, CHAR(32) в SQLite (тот же формат, что хранился раньше)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     ticket_number = Column(String, unique=True, index=True, nullable=False)
-    country_code = Column(String, nullable=True)
-    image_url = Column(String, nullable=True)
+    # Нормализованный номер (normalize_ticket_number): уникальность и поиск идут по нему
+    ticket_key = Column(String, unique=True, index=True, nullable=False)
+    country_code = Column(String, nullable=True, index=True)
+    image_url = Column(String, nullable=True, index=True)
     status = Column(String, default="active")
     is_winner = Column(Boolean, default=False)
     is_featured = Column(Boolean, default=False)
@@ -20,4 +46,25 @@ class Ticket(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     archived_at = Column(DateTime(timezone=True), nullable=True)  # ✅ Должно быть
     social_link = Column(String, nullable=True)
-    wallet_address = Column(String, nullable=True)
\ No newline at end of file
+    wallet_address = Column(String, nullable=True)
+
+    @validates("ticket_number")
+    def _set_ticket_key(self, key, number):
+        # Ключ пересчитывается при каждой записи номера, в том числе при переносе в архив
+        self.ticket_key = normalize_ticket_number(number)
+        return number
+
+
+# Колонки, которые переносятся между tickets и archived_tickets как есть
+TICKET_FIELDS = (
+    "id", "ticket_number", "country_code", "image_url", "status", "is_winner",
+    "is_featured", "holder_info", "prize_description", "created_at",
+    "social_link", "wallet_address",
+)
+
+
+class Ticket(TicketColumns, Base):
+    # Только живые билеты; архивные лежат в archived_tickets
+    __tablename__ = "tickets"
+
+    draw_key = Column(BigInteger, default=next_draw_key(), unique=True, index=True)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, Uuid
+from sqlalchemy.sql import func
+from app.database.db import Base
+
+class TicketChange(Base):
+    # Журнал изменений билетов для /tickets/changes: seq - курсор клиента,
+    # удалённые билеты остаются здесь строками с action = "deleted"
+    __tablename__ = "ticket_changes"
+
+    # В SQLite автоинкремент есть только у INTEGER PRIMARY KEY
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    ticket_id = Column(Uuid(as_uuid=True), nullable=False, index=True)
+    ticket_number = Column(String, nullable=False)
+    # created / updated / archived / unarchived / deleted
+    action = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,38 +1,48 @@
 import os
 import shutil
 from uuid import uuid4, UUID
-from datetime import datetime
 
 from fastapi import (
     APIRouter, Depends, HTTPException, UploadFile,
     File, Form, Query, Request, Header
 )
 from fastapi.responses import HTMLResponse, JSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from werkzeug.utils import secure_filename
-import httpx
+from starlette.concurrency import run_in_threadpool
 
-from app.database.db import SessionLocal
+from app.database.db import get_read_db, get_write_db
 from app.models.ticket import Ticket
+from app.models.draw import Draw
+from app.models.archived_ticket import ArchivedTicket
 from app.utils.template_engine import templates
+from app.utils.streaming import stream_template, stream_query, stream_json
+from app.utils.single_flight import coalesce
+from app.utils.draw import run_draw, draw_to_dict, DrawError
+from app.utils.archive import move_to_archive, move_from_archive, find_any_ticket
+from app.utils.jobs import enqueue
+from app.utils.upload_gc import UPLOAD_DIR
+from app.utils.ticket_index import ticket_numbers
+from app.utils.fuzzy_index import fuzzy_numbers, MAX_DISTANCE
+from app.utils.ticket_number import clean_ticket_number, normalize_ticket_number
+from app.utils.hot_snapshot import hot_tickets
+from app.utils.group_commit import ticket_writes, GROUP_COMMIT_ENABLED
+from app.utils.change_feed import record_bulk, get_changes, MAX_PAGE_SIZE
+from app.utils.timeseries import record_activity
+from app.utils.solana import check_transaction as verify_transaction, SolanaRpcError, SIGNATURE_RE
 from app.schemas.ticket import TicketSchema
+from app.utils.country_stats import (
+    apply_country_delta, subtract_tickets, normalize_country_code, country_choices
+)
 
 # 🔐 Секреты из environment variables
 ADMIN_KEY = os.getenv("ADMIN_KEY", "MySuperSecretKeyForDeleteAll2133")
-SOLANA_WALLET_ADDRESS = os.getenv("SOLANA_WALLET_ADDRESS", "4NuDayX7fiZT4Teo9HGBNqCRKNV6bRsPFAY6JkjYC9rN")
 
 router = APIRouter(prefix="/tickets", tags=["Tickets"])
-UPLOAD_DIR = "uploaded_tickets"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Папку создаёт lifespan в app/main.py
 
-# ✅ Добавляем отладочную информацию
+# async из-за группового коммита (ticket_writes.submit); файл и работа с базой идут в пуле потоков,
+# чтобы ожидание блокировки записи (busy_timeout) не останавливало event loop
 @router.post("/create")
 async def create_ticket(
     request: Request,
@@ -43,36 +53,78 @@ async def create_ticket(
     wallet_address: str = Form(None),
     country_code: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
-    print(f"🔑 Received admin_key: '{admin_key}'")
-    print(f"🔑 Expected ADMIN_KEY: '{ADMIN_KEY}'")
-    print(f"✅ Match: {admin_key == ADMIN_KEY}")
-    
     if admin_key != ADMIN_KEY:
-        print("❌ ACCESS DENIED: Admin keys don't match!")
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    # Остальной код без изменений...
+    ticket_number = clean_ticket_number(ticket_number)
+    ticket_key = normalize_ticket_number(ticket_number)
+    if not ticket_key:
+        raise HTTPException(status_code=400, detail="Ticket number is empty")
+
+    # werkzeug нужен только здесь - не тянем его при старте
+    from werkzeug.utils import secure_filename
     filename = secure_filename(f"{uuid4().hex}_{file.filename}")
     file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+
+    def save_file():
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+    await run_in_threadpool(save_file)
 
     image_url = f"/{UPLOAD_DIR}/{filename}"
+    country_code = normalize_country_code(country_code)
+
+    def build(session: Session) -> Ticket:
+        # Проверки в той же транзакции, что и вставка: в SQLite блокировка записи
+        # берётся здесь, а не на время сохранения картинки.
+        # Варианты одного номера в другом регистре или с пробелами - это тот же билет
+        if session.query(Ticket.id).filter(Ticket.ticket_key == ticket_key).first():
+            raise HTTPException(status_code=409, detail="Ticket number already exists")
+        # Номер должен быть уникален и среди архивных билетов
+        if session.query(ArchivedTicket.id).filter(ArchivedTicket.ticket_key == ticket_key).first():
+            raise HTTPException(status_code=409, detail="Ticket number already exists in archive")
+        ticket = Ticket(
+            ticket_number=ticket_number,
+            holder_info=holder_info,
+            social_link=social_link,
+            wallet_address=wallet_address,
+            image_url=image_url,
+            country_code=country_code,
+            status="active"
+        )
+        session.add(ticket)
+        apply_country_delta(session, ticket.country_code, total=1)
+        record_activity(session, tickets_created=1)
+        return ticket
+
+    def write_alone() -> Ticket:
+        ticket = build(db)
+        db.commit()
+        db.refresh(ticket)
+        # refresh открыл транзакцию (в SQLite - BEGIN IMMEDIATE): закрываем её сразу, а не после
+        # отправки ответа, иначе следующий create будет ждать эту блокировку.
+        # close() не expire'ит объекты - билет остаётся загруженным
+        db.close()
+        return ticket
 
-    new_ticket = Ticket(
-        ticket_number=ticket_number.replace("baylot:", "").strip(),
-        holder_info=holder_info,
-        social_link=social_link,
-        wallet_address=wallet_address,
-        image_url=image_url,
-        country_code=country_code,
-        status="active"
-    )
-    db.add(new_ticket)
-    db.commit()
-    db.refresh(new_ticket)
+    try:
+        if GROUP_COMMIT_ENABLED:
+            # Коммит общий с параллельными запросами; ответ - только после него
+            new_ticket = await ticket_writes.submit(build)
+        else:
+            new_ticket = await run_in_threadpool(write_alone)
+    except Exception as e:
+        # Билет не сохранился - картинка без билета не нужна
+        await run_in_threadpool(db.rollback)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        # Тот же номер успел сохранить параллельный запрос
+        if isinstance(e, IntegrityError):
+            raise HTTPException(status_code=409, detail="Ticket number already exists")
+        raise
 
     if "text/html" in request.headers.get("accept", ""):
         return templates.TemplateResponse("ticket_success.html", {
@@ -97,7 +149,7 @@ async def create_ticket(
 def archive_ticket(
     ticket_id: UUID,
     admin_key: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -109,8 +161,10 @@ def archive_ticket(
     if not ticket.is_winner:
         raise HTTPException(status_code=400, detail="Only winner tickets can be archived")
     
-    ticket.is_archived = True
-    ticket.archived_at = datetime.now()
+    # Переносим строку в archived_tickets в одной транзакции
+    move_to_archive(db, ticket)
+    apply_country_delta(db, ticket.country_code, archived=1)
+    record_activity(db, archived=1)
     db.commit()
     
     return {"message": "Ticket archived successfully", "ticket_id": ticket_id}
@@ -119,51 +173,148 @@ def archive_ticket(
 def unarchive_ticket(
     ticket_id: UUID,
     admin_key: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
-    if not ticket:
+    archived = db.query(ArchivedTicket).filter(ArchivedTicket.id == ticket_id).first()
+    if not archived:
+        # Уже активный билет разархивировать не нужно
+        if db.query(Ticket.id).filter(Ticket.id == ticket_id).first():
+            return {"message": "Ticket unarchived successfully", "ticket_id": ticket_id}
         raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    ticket.is_archived = False
-    ticket.archived_at = None
+
+    if db.query(Ticket.id).filter(Ticket.ticket_key == archived.ticket_key).first():
+        raise HTTPException(status_code=409, detail="Active ticket with the same number already exists")
+
+    move_from_archive(db, archived)
+    apply_country_delta(db, archived.country_code, archived=-1)
+    record_activity(db, unarchived=1)
     db.commit()
     
     return {"message": "Ticket unarchived successfully", "ticket_id": ticket_id}
 
 @router.get("/search")
-def search_ticket(number: str, db: Session = Depends(get_db)):
+def search_ticket(number: str, db: Session = Depends(get_read_db)):
     # Ищем только среди неархивированных билетов
-    ticket = db.query(Ticket).filter(
-        Ticket.ticket_number == number,
-        Ticket.is_archived == False
-    ).first()
+    ticket = db.query(Ticket).filter(Ticket.ticket_key == normalize_ticket_number(number)).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     return ticket
 
 
+@router.get("/suggest")
+def suggest_ticket_numbers(
+    prefix: str = Query(..., min_length=1, max_length=64),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    # Автодополнение номера: первые limit живых билетов, чей ticket_key начинается с префикса.
+    # Отдаём номера в том виде, как их ввели (ticket_number)
+    prefix = normalize_ticket_number(prefix)
+    if not prefix:
+        return {"prefix": prefix, "suggestions": []}
+    if ticket_numbers.ready:
+        return {"prefix": prefix, "suggestions": ticket_numbers.suggest(prefix, limit)}
+
+    # Индекс ещё строится после старта - отвечаем из базы
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = db.query(Ticket.ticket_number).filter(
+        Ticket.ticket_key.like(f"{escaped}%", escape="\\")
+    ).order_by(Ticket.ticket_key).limit(limit).all()
+    return {"prefix": prefix, "suggestions": [number for (number,) in rows]}
+
+
+@router.get("/search/fuzzy")
+def search_ticket_fuzzy(
+    number: str = Query(..., min_length=1, max_length=64),
+    max_distance: int = Query(1, ge=0, le=MAX_DISTANCE),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    # Поиск с опечатками: ближайшие номера живых билетов в пределах max_distance правок.
+    # В ответе max_distance - до какого расстояния реально искали, distance_capped - оно меньше запрошенного
+    number = normalize_ticket_number(number)
+    requested = max_distance
+    if fuzzy_numbers.ready:
+        found = fuzzy_numbers.search(number, max_distance, limit)
+        matches = found["matches"]
+        max_distance = found["distance"]
+    else:
+        # Индекс ещё строится - честно отвечаем только точным совпадением
+        exact = db.query(Ticket.id).filter(Ticket.ticket_key == number).first()
+        matches = [(number, 0)] if exact else []
+        max_distance = 0
+
+    # Индекс знает только ключи - номера в том виде, как их ввели, берём одним IN по индексу ticket_key.
+    # Билета, которого ещё нет на отстающей реплике, показываем по ключу
+    displays = {}
+    if matches:
+        displays = dict(db.query(Ticket.ticket_key, Ticket.ticket_number).filter(
+            Ticket.ticket_key.in_([key for key, _ in matches])
+        ))
+    detail = None
+    if max_distance < requested:
+        detail = (
+            f"Searched up to distance {max_distance}, not {requested}: the index is still building"
+            if not fuzzy_numbers.ready else
+            f"Searched up to distance {max_distance}, not {requested}: the distance-{requested} "
+            f"neighbourhood of this number is too large"
+        )
+    return {
+        "number": number,
+        "requested_distance": requested,
+        "max_distance": max_distance,
+        "distance_capped": max_distance < requested,
+        "detail": detail,
+        "matches": [
+            {"ticket_number": displays.get(key, key), "distance": distance}
+            for key, distance in matches
+        ],
+    }
+
+
+@router.get("/changes")
+def get_ticket_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    # Лента изменений: клиент хранит cursor из ответа и передаёт его в since
+    return get_changes(db, since, limit)
+
+
+@router.get("/check-transaction")
+async def check_transaction(tx_hash: str = Query(...)):
+    # Проверяем, что транзакция подтверждена и касается нашего кошелька
+    tx_hash = tx_hash.strip()
+    if not SIGNATURE_RE.match(tx_hash):
+        raise HTTPException(status_code=400, detail="Invalid transaction hash")
+    try:
+        return await verify_transaction(tx_hash)
+    except SolanaRpcError:
+        raise HTTPException(status_code=502, detail="Solana RPC is unavailable, try again later")
+
+
 @router.put("/{ticket_number}/winner")
 def declare_winner(
     ticket_number: str,
     prize_description: str = Query(...),
     admin_key: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     # Ищем только среди неархивированных билетов
-    ticket = db.query(Ticket).filter(
-        Ticket.ticket_number == ticket_number,
-        Ticket.is_archived == False
-    ).first()
+    ticket = db.query(Ticket).filter(Ticket.ticket_key == normalize_ticket_number(ticket_number)).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
+    if not ticket.is_winner:
+        apply_country_delta(db, ticket.country_code, winners=1)
+        record_activity(db, winners=1)
     ticket.is_winner = True
     ticket.status = "winner"
     ticket.prize_description = prize_description
@@ -175,24 +326,73 @@ def declare_winner(
     }
 
 
+@router.post("/draw")
+def draw_winners(
+    prize_description: str = Query(...),
+    count: int = Query(1, ge=1, le=1000),
+    country: str = Query(None),
+    admin_key: str = Query(...),
+    db: Session = Depends(get_write_db)
+):
+    if admin_key != ADMIN_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # Победители выбираются из неархивированных билетов, которые ещё не выигрывали
+    try:
+        draw = run_draw(db, count, prize_description, country_code=country)
+    except DrawError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return draw_to_dict(draw)
+
+
+@router.post("/uploads/reconcile")
+def reconcile_uploaded_files(
+    admin_key: str = Query(...),
+    dry_run: bool = Query(False),
+    quarantine: bool = Query(True),
+    db: Session = Depends(get_write_db)
+):
+    if admin_key != ADMIN_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # Обход папки долгий - он идёт в очереди задач, результат пишется в лог
+    job = enqueue(db, "reconcile_uploads", quarantine=quarantine, dry_run=dry_run)
+    db.commit()
+    return {"job_id": job.id, "status": "queued"}
+
+
+@router.get("/draws/{draw_id}")
+def get_draw(draw_id: int, db: Session = Depends(get_read_db)):
+    # Публичная запись розыгрыша с seed для проверки результата
+    draw = db.query(Draw).filter(Draw.id == draw_id).first()
+    if not draw:
+        raise HTTPException(status_code=404, detail="Draw not found")
+    return draw_to_dict(draw)
+
+
 @router.delete("/{ticket_id}")
 def delete_ticket(
     ticket_id: UUID,
     admin_key: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     # Можно удалять любые билеты (и архивные, и неархивированные)
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+    ticket = find_any_ticket(db, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    image_path = ticket.image_url.lstrip("/")
-    if os.path.exists(image_path):
-        os.remove(image_path)
+    # Файл удалит фоновая задача, и только если удаление билета закоммитится
+    if ticket.image_url:
+        enqueue(db, "delete_files", paths=[ticket.image_url.lstrip("/")])
 
+    apply_country_delta(
+        db, ticket.country_code, total=-1,
+        winners=-1 if ticket.is_winner else 0,
+        archived=-1 if ticket.is_archived else 0
+    )
     db.delete(ticket)
     db.commit()
     
@@ -202,14 +402,32 @@ def delete_ticket(
     }
 
 
+def enqueue_image_cleanup(db: Session, model, chunk_size: int = 500):
+    # Раньше массовое удаление оставляло картинки на диске; теперь их удаляют фоновые задачи.
+    # Пути читаем пачками по id (keyset), а не одним списком на всю таблицу
+    last_id = None
+    while True:
+        query = db.query(model.id, model.image_url).filter(model.image_url.isnot(None))
+        if last_id is not None:
+            query = query.filter(model.id > last_id)
+        rows = query.order_by(model.id).limit(chunk_size).all()
+        if not rows:
+            break
+        enqueue(db, "delete_files", paths=[url.lstrip("/") for _, url in rows])
+        last_id = rows[-1].id
+
+
 # ✅ Удалить только неархивированные билеты
 @router.delete("/all/", response_model=dict)
-def delete_all_tickets(x_admin_key: str = Header(...), db: Session = Depends(get_db)):
+def delete_all_tickets(x_admin_key: str = Header(...), db: Session = Depends(get_write_db)):
     if x_admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="Access denied: Invalid admin key")
 
     # Удаляем только неархивированные билеты
-    deleted_count = db.query(Ticket).filter(Ticket.is_archived == False).delete()
+    enqueue_image_cleanup(db, Ticket)
+    subtract_tickets(db, Ticket)
+    record_bulk(db, Ticket, "deleted")
+    deleted_count = db.query(Ticket).delete()
     db.commit()
     
     return {
@@ -220,12 +438,15 @@ def delete_all_tickets(x_admin_key: str = Header(...), db: Session = Depends(get
 
 # ✅ Удалить все архивные билеты (отдельная функция)
 @router.delete("/archived/all/", response_model=dict)
-def delete_all_archived_tickets(x_admin_key: str = Header(...), db: Session = Depends(get_db)):
+def delete_all_archived_tickets(x_admin_key: str = Header(...), db: Session = Depends(get_write_db)):
     if x_admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="Access denied: Invalid admin key")
 
     # Удаляем только архивные билеты
-    deleted_count = db.query(Ticket).filter(Ticket.is_archived == True).delete()
+    enqueue_image_cleanup(db, ArchivedTicket)
+    subtract_tickets(db, ArchivedTicket)
+    record_bulk(db, ArchivedTicket, "deleted")
+    deleted_count = db.query(ArchivedTicket).delete()
     db.commit()
     
     return {
@@ -239,24 +460,26 @@ def delete_all_archived_tickets(x_admin_key: str = Header(...), db: Session = De
 def delete_archived_ticket(
     ticket_id: UUID,
     x_admin_key: str = Header(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if x_admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="Access denied: Invalid admin key")
 
     # Удаляем только если билет архивирован
-    ticket = db.query(Ticket).filter(
-        Ticket.id == ticket_id,
-        Ticket.is_archived == True
-    ).first()
+    ticket = db.query(ArchivedTicket).filter(ArchivedTicket.id == ticket_id).first()
     
     if not ticket:
         raise HTTPException(status_code=404, detail="Archived ticket not found")
 
-    image_path = ticket.image_url.lstrip("/")
-    if os.path.exists(image_path):
-        os.remove(image_path)
+    # Файл удалит фоновая задача, и только если удаление билета закоммитится
+    if ticket.image_url:
+        enqueue(db, "delete_files", paths=[ticket.image_url.lstrip("/")])
 
+    apply_country_delta(
+        db, ticket.country_code, total=-1,
+        winners=-1 if ticket.is_winner else 0,
+        archived=-1 if ticket.is_archived else 0
+    )
     db.delete(ticket)
     db.commit()
     
@@ -267,102 +490,15 @@ def delete_archived_ticket(
 
 
 @router.get("/winners/html", response_class=HTMLResponse)
-def show_winners(db: Session = Depends(get_db)):
+@coalesce
+def show_winners(request: Request, db: Session = Depends(get_read_db)):
     # Только неархивированные победители
-    winners = db.query(Ticket).filter(
-        Ticket.is_winner == True,
-        Ticket.is_archived == False
-    ).order_by(Ticket.created_at.desc()).all()
-
-    html = """
-    <html>
-        <head>
-            <title>Победители</title>
-            <style>
-                body { font-family: sans-serif; background: #f8f9fa; padding: 20px; }
-                .winner-list { display: flex; flex-direction: column; gap: 20px; max-width: 700px; margin: auto; }
-                .winner-card {
-                    background: white;
-                    border-radius: 10px;
-                    box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-                    padding: 15px;
-                    display: flex;
-                    align-items: flex-start;
-                    gap: 20px;
-                }
-                .winner-card img {
-                    max-width: 180px;
-                    max-height: 180px;
-                    border-radius: 8px;
-                    border: 1px solid #ccc;
-                }
-                .ticket-number {
-                    font-size: 18px;
-                    font-weight: bold;
-                    color: #333;
-                }
-                .holder-info {
-                    font-size: 14px;
-                    margin-top: 4px;
-                    color: #555;
-                }
-                .created-at {
-                    font-size: 14px;
-                    color: #777;
-                }
-                .prize-info {
-                    font-size: 15px;
-                    color: #000;
-                    margin-top: 6px;
-                    font-weight: bold;
-                }
-                .claim-buttons a {
-                    margin-right: 10px;
-                    display: inline-block;
-                    padding: 6px 12px;
-                    background-color: #007bff;
-                    color: white;
-                    text-decoration: none;
-                    border-radius: 4px;
-                    font-size: 14px;
-                }
-                .claim-buttons a:hover {
-                    background-color: #0056b3;
-                }
-            </style>
-        </head>
-        <body>
-            <h2 style="text-align:center;">🏆 Победители</h2>
-            <div class="winner-list">
-    """
-
-    for ticket in winners:
-        created = ticket.created_at.strftime('%d.%m.%Y %H:%M') if ticket.created_at else "—"
-        holder = ticket.holder_info or "—"
-        prize = ticket.prize_description or "—"
-        html += f"""
-        <div class="winner-card">
-            <img src="{ticket.image_url}" alt="ticket">
-            <div>
-                <div class="ticket-number">Билет: {ticket.ticket_number}</div>
-                <div class="holder-info">Владелец: {holder}</div>
-                <div class="prize-info">Приз: {prize}</div>
-                <div class="created-at">Дата: {created}</div>
-                <div class="claim-buttons" style="margin-top: 10px;">
-                    <a href="https://t.me/BabaySupport" target="_blank">Telegram</a>
-                    <a href="https://wa.me/992987654321" target="_blank">WhatsApp</a>
-                    <a href="mailto:babay@support.com" target="_blank">Email</a>
-                </div>
-            </div>
-        </div>
-        """
-
-    html += """
-            </div>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=html)
+    winners = hot_tickets.winners(db)
+
+    return stream_template("winners.html", {
+        "request": request,
+        "winners": winners
+    })
 
 
 @router.get("/search/html", response_class=HTMLResponse)
@@ -371,53 +507,62 @@ def search_ticket_form(request: Request):
 
 
 @router.get("/search/result", response_class=HTMLResponse)
-def search_ticket_result(request: Request, number: str, db: Session = Depends(get_db)):
+def search_ticket_result(request: Request, number: str, db: Session = Depends(get_read_db)):
     # Ищем только среди неархивированных билетов
-    ticket = db.query(Ticket).filter(
-        Ticket.ticket_number == number,
-        Ticket.is_archived == False
-    ).first()
+    number = normalize_ticket_number(number)
+    ticket = db.query(Ticket).filter(Ticket.ticket_key == number).first()
+    # Номер часто переписывают с фото с ошибкой - предлагаем похожие
+    similar = []
+    if ticket is None and fuzzy_numbers.ready:
+        similar = [match for match, _ in fuzzy_numbers.search(number)["matches"]]
     return templates.TemplateResponse("search_result.html", {
         "request": request,
         "ticket": ticket,
-        "not_found": ticket is None
+        "not_found": ticket is None,
+        "similar": similar
     })
 
 
 @router.get("/all/html", response_class=HTMLResponse)
+@coalesce
 def show_all_tickets(
     request: Request,
     number: str = Query(None),
     winners_only: bool = Query(False),
-    db: Session = Depends(get_db)
+    country: str = Query(None),
+    db: Session = Depends(get_read_db)
 ):
     # Только неархивированные билеты
-    query = db.query(Ticket).filter(Ticket.is_archived == False)
+    query = db.query(Ticket)
     found = None
 
+    country = normalize_country_code(country)
+    if country:
+        query = query.filter(Ticket.country_code == country)
+
     if number:
-        query = query.filter(Ticket.ticket_number.ilike(f"%{number}%"))
-        found = query.count() > 0
+        query = query.filter(Ticket.ticket_key.contains(normalize_ticket_number(number), autoescape=True))
+        found = query.first() is not None
 
     if winners_only:
         query = query.filter(Ticket.is_winner == True)
 
-    tickets = query.order_by(Ticket.created_at.desc()).all()
+    tickets_count = query.count()
+    tickets = stream_query(query.order_by(Ticket.created_at.desc()))
 
     # Только неархивированные избранные билеты
-    featured_tickets = db.query(Ticket).filter(
-        Ticket.is_featured == True,
-        Ticket.is_archived == False
-    ).all()
+    featured_tickets = hot_tickets.featured(db)
 
     # Получаем общее количество неархивированных билетов
-    total_tickets_count = db.query(Ticket).filter(Ticket.is_archived == False).count()
+    total_tickets_count = db.query(Ticket).count()
 
-    return templates.TemplateResponse("all_tickets.html", {
+    return stream_template("all_tickets.html", {
         "request": request,
         "tickets": tickets,
+        "tickets_count": tickets_count,
         "number": number,
         "winners_only": winners_only,
+        "country": country,
         "found": found,
         "featured_tickets": featured_tickets,
         "total_tickets_count": total_tickets_count
@@ -428,12 +573,12 @@ def feature_ticket(
     ticket_id: UUID,
     is_featured: bool = Query(...),
     admin_key: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+    ticket = find_any_ticket(db, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
@@ -443,29 +588,29 @@ def feature_ticket(
     return {"detail": f"Ticket {ticket_id} featured = {is_featured}"}
 
 @router.get("/count")
-def get_ticket_count(db: Session = Depends(get_db)):
+@coalesce
+def get_ticket_count(db: Session = Depends(get_read_db)):
     # Считаем только неархивированные билеты
-    count = db.query(Ticket).filter(Ticket.is_archived == False).count()
+    count = db.query(Ticket).count()
     return {"count": count}
 
 @router.get("/create", response_class=HTMLResponse)
 def create_ticket_form(request: Request):
-    return templates.TemplateResponse("create_ticket.html", {"request": request})
+    return templates.TemplateResponse("create_ticket.html", {
+        "request": request,
+        "countries": country_choices
+    })
 
 @router.get("/last_ticket", response_model=TicketSchema)
-def get_last_ticket(db: Session = Depends(get_db)):
+@coalesce
+def get_last_ticket(db: Session = Depends(get_read_db)):
     # Получаем последний неархивированный билет
-    ticket = db.query(Ticket).filter(
-        Ticket.is_archived == False
-    ).order_by(Ticket.created_at.desc()).first()
+    ticket = hot_tickets.latest(db)
     if not ticket:
         raise HTTPException(status_code=404, detail="No tickets found")
     return ticket
 
 # 🆕 Эндпоинт для получения архивных билетов
 @router.get("/archived")
-def get_archived_tickets(db: Session = Depends(get_db)):
-    archived_tickets = db.query(Ticket).filter(
-        Ticket.is_archived == True
-    ).order_by(Ticket.archived_at.desc()).all()
-    return archived_tickets
\ No newline at end of file
+def get_archived_tickets(db: Session = Depends(get_read_db)):
+    return stream_json(db.query(ArchivedTicket).order_by(ArchivedTicket.archived_at.desc()))
\ No newline at end of file
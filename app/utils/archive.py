@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket, TICKET_FIELDS
+
+
+def _copy_fields(source) -> dict:
+    return {field: getattr(source, field) for field in TICKET_FIELDS}
+
+
+def move_to_archive(db: Session, ticket: Ticket) -> ArchivedTicket:
+    # Перенос строки в archived_tickets; коммит делает вызывающий код,
+    # так что вставка и удаление попадают в одну транзакцию
+    archived = ArchivedTicket(
+        **_copy_fields(ticket),
+        is_archived=True,
+        archived_at=datetime.now(),
+        draw_key=ticket.draw_key,
+    )
+    db.delete(ticket)
+    db.add(archived)
+    return archived
+
+
+def move_from_archive(db: Session, archived: ArchivedTicket) -> Ticket:
+    # draw_key не переносим: живой билет получает новый ключ через default
+    ticket = Ticket(
+        **_copy_fields(archived),
+        is_archived=False,
+        archived_at=None,
+    )
+    db.delete(archived)
+    db.add(ticket)
+    return ticket
+
+
+def find_any_ticket(db: Session, ticket_id):
+    # Билет по id в любой из двух таблиц
+    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+    if ticket is None:
+        ticket = db.query(ArchivedTicket).filter(ArchivedTicket.id == ticket_id).first()
+    return ticket
+
+
+def archive_summary(db: Session) -> dict:
+    # Счётчики для страницы архива одним запросом: сама страница стримит архив курсором
+    # и не может посчитать их по списку в памяти
+    total, winners, with_prizes = db.query(
+        func.count(ArchivedTicket.id),
+        func.count(case((ArchivedTicket.is_winner == True, 1))),
+        func.count(case(((ArchivedTicket.prize_description != None) & (ArchivedTicket.prize_description != ""), 1))),
+    ).one()
+    return {"total": total, "winners": winners, "with_prizes": with_prizes}
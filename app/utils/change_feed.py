@@ -0,0 +1,147 @@
+from sqlalchemy import event, func, insert, select, literal, text
+from sqlalchemy.orm import Session
+
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket
+from app.models.ticket_change import TicketChange
+
+# Ключ advisory-лока Postgres, под которым пишется журнал
+FEED_LOCK_KEY = 0x7469636B
+MAX_PAGE_SIZE = 1000
+
+ticket_changes = TicketChange.__table__
+
+
+def _lock_feed(session: Session):
+    # seq выдаётся при вставке, а виден после коммита: без лока транзакция с seq=5
+    # могла бы закоммититься позже транзакции с seq=6, и клиент с курсором 6 её пропустил бы.
+    # Лок держится до конца транзакции, поэтому порядок seq совпадает с порядком коммитов.
+    # В SQLite пишущая транзакция и так одна
+    if session.info.get("feed_locked"):
+        return
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": FEED_LOCK_KEY})
+    session.info["feed_locked"] = True
+
+
+@event.listens_for(Session, "after_begin")
+def _lock_feed_on_begin(session, transaction, connection):
+    # Пишущая сессия в Postgres берёт лок журнала первым же действием - как BEGIN IMMEDIATE
+    # в SQLite. Иначе розыгрыш (строки билетов -> журнал -> счётчики) и создание билета
+    # (счётчики -> журнал) захватывали бы блокировки в разном порядке и могли бы зациклиться
+    if not session.info.get("writer") or session.info.get("feed_locked"):
+        return
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": FEED_LOCK_KEY})
+    session.info["feed_locked"] = True
+
+
+def _row(ticket, action: str) -> dict:
+    return {"ticket_id": ticket.id, "ticket_number": ticket.ticket_number, "action": action}
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    # Журнал пишется в той же транзакции, что и сами изменения, мимо ORM (Core insert)
+    removed = {obj.id: obj for obj in session.deleted if isinstance(obj, (Ticket, ArchivedTicket))}
+    rows = []
+    for obj in session.new:
+        if not isinstance(obj, (Ticket, ArchivedTicket)):
+            continue
+        # Архивация - это удаление из одной таблицы и вставка в другую с тем же id
+        if removed.pop(obj.id, None) is None:
+            rows.append(_row(obj, "created"))
+        else:
+            rows.append(_row(obj, "archived" if isinstance(obj, ArchivedTicket) else "unarchived"))
+    for obj in session.dirty:
+        if isinstance(obj, (Ticket, ArchivedTicket)) and session.is_modified(obj, include_collections=False):
+            rows.append(_row(obj, "updated"))
+    rows.extend(_row(obj, "deleted") for obj in removed.values())
+    if rows:
+        _lock_feed(session)
+        session.connection().execute(insert(ticket_changes), rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _release_feed(session):
+    session.info.pop("feed_locked", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _release_feed_on_rollback(session):
+    session.info.pop("feed_locked", None)
+
+
+def record_bulk(db: Session, model, action: str, *criterion):
+    # Массовые query(...).update()/delete() проходят мимо flush - журналим их одним
+    # INSERT ... SELECT. Для удаления вызывать до самого DELETE
+    _lock_feed(db)
+    db.connection().execute(insert(ticket_changes).from_select(
+        ["ticket_id", "ticket_number", "action"],
+        select(model.id, model.ticket_number, literal(action)).where(*criterion),
+    ))
+
+
+def feed_version(db: Session) -> int:
+    # Последний seq журнала - общая для всех воркеров версия данных, один запрос по первичному ключу
+    return db.query(func.max(TicketChange.seq)).scalar() or 0
+
+
+def feed_events(db: Session, since: int, limit: int = MAX_PAGE_SIZE) -> list:
+    # Сырые события после since: [(seq, action, ticket_number)]
+    return db.query(TicketChange.seq, TicketChange.action, TicketChange.ticket_number).filter(
+        TicketChange.seq > since
+    ).order_by(TicketChange.seq).limit(limit).all()
+
+
+def _ticket_state(ticket) -> dict:
+    if ticket is None:
+        return None
+    return {
+        "id": str(ticket.id),
+        "ticket_number": ticket.ticket_number,
+        "country_code": ticket.country_code,
+        "holder_info": ticket.holder_info,
+        "social_link": ticket.social_link,
+        "wallet_address": ticket.wallet_address,
+        "image_url": ticket.image_url,
+        "status": ticket.status,
+        "is_winner": ticket.is_winner,
+        "is_featured": ticket.is_featured,
+        "is_archived": isinstance(ticket, ArchivedTicket),
+        "prize_description": ticket.prize_description,
+        "created_at": ticket.created_at.isoformat() if ticket.created_at else None,
+        "archived_at": ticket.archived_at.isoformat() if ticket.archived_at else None,
+    }
+
+
+def get_changes(db: Session, since: int = 0, limit: int = MAX_PAGE_SIZE) -> dict:
+    # События после курсора since по порядку seq. К событию прикладываем текущее
+    # состояние билета (из tickets или archived_tickets), для удалённых - None
+    rows = db.query(TicketChange).filter(TicketChange.seq > since).order_by(TicketChange.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    ids = {row.ticket_id for row in rows if row.action != "deleted"}
+    current = {}
+    if ids:
+        for model in (Ticket, ArchivedTicket):
+            for ticket in db.query(model).filter(model.id.in_(ids)):
+                current[ticket.id] = ticket
+
+    return {
+        "changes": [
+            {
+                "seq": row.seq,
+                "action": row.action,
+                "ticket_id": str(row.ticket_id),
+                "ticket_number": row.ticket_number,
+                "changed_at": row.changed_at.isoformat() if row.changed_at else None,
+                "ticket": None if row.action == "deleted" else _ticket_state(current.get(row.ticket_id)),
+            }
+            for row in rows
+        ],
+        "cursor": rows[-1].seq if rows else since,
+        "has_more": has_more,
+    }
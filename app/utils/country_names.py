@@ -43,5 +43,23 @@ country_name_map = {
     "TM": "Turkmenistan", "UG": "Uganda", "UA": "Ukraine", "AE": "United Arab Emirates",
     "GB": "United Kingdom", "US": "United States", "UY": "Uruguay", "UZ": "Uzbekistan",
     "VE": "Venezuela", "VN": "Vietnam", "YE": "Yemen", "ZM": "Zambia",
-    "ZW": "Zimbabwe"
+    "ZW": "Zimbabwe",
+    "BQ": "Bonaire, Sint Eustatius and Saba", "BV": "Bouvet Island", "IO": "British Indian Ocean Territory", "KY": "Cayman Islands",
+    "CX": "Christmas Island", "CC": "Cocos (Keeling) Islands", "CK": "Cook Islands", "CW": "Curaçao",
+    "SZ": "Eswatini", "FK": "Falkland Islands (Malvinas)", "FO": "Faroe Islands", "GF": "French Guiana",
+    "PF": "French Polynesia", "TF": "French Southern Territories", "GI": "Gibraltar", "GL": "Greenland",
+    "GP": "Guadeloupe", "GU": "Guam", "GG": "Guernsey", "HM": "Heard Island and McDonald Islands",
+    "VA": "Holy See (Vatican City State)", "HK": "Hong Kong", "IM": "Isle of Man", "JE": "Jersey",
+    "MO": "Macao", "MH": "Marshall Islands", "MQ": "Martinique", "YT": "Mayotte",
+    "FM": "Micronesia, Federated States of", "MS": "Montserrat", "NR": "Nauru", "NC": "New Caledonia",
+    "NU": "Niue", "NF": "Norfolk Island", "MP": "Northern Mariana Islands", "PW": "Palau",
+    "PS": "Palestine, State of", "PN": "Pitcairn", "PR": "Puerto Rico", "RE": "Réunion",
+    "BL": "Saint Barthélemy", "SH": "Saint Helena, Ascension and Tristan da Cunha", "KN": "Saint Kitts and Nevis", "LC": "Saint Lucia",
+    "MF": "Saint Martin (French part)", "PM": "Saint Pierre and Miquelon", "VC": "Saint Vincent and the Grenadines", "WS": "Samoa",
+    "SM": "San Marino", "ST": "Sao Tome and Principe", "SL": "Sierra Leone", "SX": "Sint Maarten (Dutch part)",
+    "SB": "Solomon Islands", "GS": "South Georgia and the South Sandwich Islands", "SS": "South Sudan", "SR": "Suriname",
+    "SJ": "Svalbard and Jan Mayen", "TL": "Timor-Leste", "TG": "Togo", "TK": "Tokelau",
+    "TO": "Tonga", "TT": "Trinidad and Tobago", "TN": "Tunisia", "TC": "Turks and Caicos Islands",
+    "TV": "Tuvalu", "UM": "United States Minor Outlying Islands", "VU": "Vanuatu", "VG": "Virgin Islands, British",
+    "VI": "Virgin Islands, U.S.", "WF": "Wallis and Futuna", "EH": "Western Sahara", "AX": "Åland Islands"
 }
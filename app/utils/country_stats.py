@@ -0,0 +1,93 @@
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from app.models.archived_ticket import ArchivedTicket
+from app.models.country_stats import CountryStats
+from app.models.ticket import Ticket
+from app.utils.country_names import country_name_map
+
+
+def normalize_country_code(code: str):
+    if not code:
+        return None
+    return code.strip().upper() or None
+
+
+def insert_for(db: Session):
+    # INSERT ... ON CONFLICT есть и в Postgres, и в SQLite, но конструкции разные
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def apply_country_delta(db: Session, country_code: str, total: int = 0, winners: int = 0, archived: int = 0):
+    # Инкрементально меняем счётчики страны, коммит делает вызывающий код
+    code = normalize_country_code(country_code)
+    if not code or not (total or winners or archived):
+        return
+
+    insert = insert_for(db)
+    stmt = insert(CountryStats).values(
+        country_code=code,
+        total_tickets=total,
+        winner_tickets=winners,
+        archived_tickets=archived,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CountryStats.country_code],
+        set_={
+            "total_tickets": CountryStats.total_tickets + stmt.excluded.total_tickets,
+            "winner_tickets": CountryStats.winner_tickets + stmt.excluded.winner_tickets,
+            "archived_tickets": CountryStats.archived_tickets + stmt.excluded.archived_tickets,
+        },
+    )
+    db.execute(stmt)
+
+
+def subtract_tickets(db: Session, model, *criterion):
+    # Перед массовым удалением вычитаем удаляемые билеты одним GROUP BY
+    rows = db.query(
+        model.country_code,
+        func.count(model.id),
+        func.sum(case((model.is_winner == True, 1), else_=0)),
+        func.sum(case((model.is_archived == True, 1), else_=0)),
+    ).filter(*criterion).group_by(model.country_code).order_by(model.country_code).all()
+
+    for country_code, total, winners, archived in rows:
+        apply_country_delta(db, country_code, -total, -(winners or 0), -(archived or 0))
+
+
+def rebuild_country_stats(db: Session):
+    # Полный пересчёт счётчиков по обеим таблицам - сверка на случай расхождений
+    db.query(CountryStats).delete()
+    for model in (Ticket, ArchivedTicket):
+        rows = db.query(
+            model.country_code,
+            func.count(model.id),
+            func.sum(case((model.is_winner == True, 1), else_=0)),
+            func.sum(case((model.is_archived == True, 1), else_=0)),
+        ).group_by(model.country_code).all()
+        for country_code, total, winners, archived in rows:
+            apply_country_delta(db, country_code, total, winners or 0, archived or 0)
+
+
+def get_country_stats(db: Session):
+    rows = db.query(CountryStats).filter(CountryStats.total_tickets > 0).order_by(
+        CountryStats.total_tickets.desc(), CountryStats.country_code
+    ).all()
+    return [
+        {
+            "country_code": row.country_code,
+            "country_name": country_name_map.get(row.country_code, row.country_code),
+            "total_tickets": row.total_tickets,
+            "winner_tickets": row.winner_tickets,
+            "archived_tickets": row.archived_tickets,
+        }
+        for row in rows
+    ]
+
+
+# Список для <select> в форме создания билета, отсортирован по названию
+country_choices = sorted(country_name_map.items(), key=lambda item: item[1])
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_deadlines(value: str) -> dict:
+    deadlines = {}
+    for item in value.split(","):
+        path, _, seconds = item.strip().rpartition("=")
+        if path:
+            deadlines[path] = float(seconds)
+    return deadlines
+
+
+# Дедлайны GET/HEAD по пути: "путь=секунды,...". Считаются от начала запроса до последнего байта ответа
+REQUEST_DEADLINES = _parse_deadlines(os.getenv(
+    "REQUEST_DEADLINES",
+    "/=60,/tickets/all/html=60,/tickets/winners/html=15,/archived-tickets=120,/tickets/archived=120,"
+    "/tickets/changes=15,/stats/timeseries=10,/tickets/search/fuzzy=5,/tickets/suggest=2",
+))
+# Для остальных GET/HEAD; 0 - без дедлайна
+REQUEST_DEADLINE_DEFAULT = float(os.getenv("REQUEST_DEADLINE_DEFAULT", "30"))
+# Как часто SQLite вызывает проверку дедлайна во время запроса (в инструкциях VM)
+SQLITE_PROGRESS_STEPS = 10000
+
+_current = ContextVar("request_guard", default=None)
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+def current_guard() -> Optional["RequestGuard"]:
+    return _current.get()
+
+
+def _interrupt(dbapi_connection):
+    # psycopg: cancel() - то же, что pg_cancel_backend для этого соединения, на простаивающем ничего не делает.
+    # sqlite3.interrupt() здесь не подходит: без выполняющегося запроса он прерывает следующий,
+    # то есть ROLLBACK. В SQLite запрос останавливает progress handler (см. _attach_connection)
+    cancel = getattr(dbapi_connection, "cancel", None)
+    if cancel is None:
+        return
+    try:
+        cancel()
+    except Exception as e:
+        logger.warning(f"Failed to cancel a running statement: {str(e)}")
+
+
+class RequestGuard:
+    # Состояние одного запроса: дедлайн, причина отмены и соединения с базой,
+    # которые он сейчас держит. Отмена прерывает их запросы, чтобы брошенная работа
+    # не занимала пул и CPU
+    def __init__(self, timeout: Optional[float]):
+        self.deadline_at = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        # Ответ строится для нескольких запросов сразу (coalesce) - один клиент его не отменяет
+        self.detached = False
+        self.connections = set()
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline_at is None:
+            return None
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def expired(self) -> bool:
+        if self.detached:
+            return False
+        return self.reason is not None or (self.deadline_at is not None and time.monotonic() >= self.deadline_at)
+
+    def check(self):
+        # Между запросами к базе: рендер и сериализация тоже должны остановиться
+        if self.expired():
+            raise RequestCancelled(self.reason or "deadline")
+
+    def iterate(self, rows, every: int):
+        for index, row in enumerate(rows):
+            if index % every == 0:
+                self.check()
+            yield row
+
+    def attach(self, dbapi_connection):
+        with self._lock:
+            self.connections.add(dbapi_connection)
+
+    def release(self, dbapi_connection):
+        with self._lock:
+            self.connections.discard(dbapi_connection)
+
+    def detach(self):
+        self.detached = True
+
+    def cancel(self, reason: str) -> bool:
+        if self.detached or self.reason is not None:
+            return False
+        self.reason = reason
+        with self._lock:
+            connections = list(self.connections)
+        for dbapi_connection in connections:
+            _interrupt(dbapi_connection)
+        return True
+
+
+@event.listens_for(Session, "after_begin")
+def _attach_connection(session, transaction, connection):
+    # Сессии запроса (в том числе в потоках threadpool - контекст копируется) отдают
+    # свои соединения guard'у. Фоновые задачи guard'а не имеют и не ограничиваются
+    guard = _current.get()
+    if guard is None:
+        return
+    dbapi_connection = connection.connection.dbapi_connection
+    connection.info["request_guard"] = guard
+    guard.attach(dbapi_connection)
+    if connection.dialect.name == "sqlite":
+        # Дедлайн и отмена проверяются внутри самого запроса: срабатывает, даже если event loop
+        # занят синхронным обработчиком и таймер не может выстрелить
+        dbapi_connection.set_progress_handler(lambda: 1 if guard.expired() else 0, SQLITE_PROGRESS_STEPS)
+    elif connection.dialect.name == "postgresql":
+        remaining = guard.remaining()
+        if remaining is not None:
+            # SET LOCAL действует до конца транзакции, соединение в пул возвращается без него
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(remaining * 1000))}")
+
+
+def _disarm(dbapi_connection):
+    # COMMIT/ROLLBACK отменённого запроса прерывать нельзя, иначе соединение вернётся в пул с открытой транзакцией
+    if dbapi_connection is not None and hasattr(dbapi_connection, "set_progress_handler"):
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def _before_transaction_end(connection):
+    if "request_guard" in connection.info:
+        _disarm(connection.connection.dbapi_connection)
+
+
+@event.listens_for(Pool, "reset")
+def _before_reset(dbapi_connection, connection_record, reset_state):
+    if "request_guard" in connection_record.info:
+        _disarm(dbapi_connection)
+
+
+@event.listens_for(Pool, "checkin")
+def _release_connection(dbapi_connection, connection_record):
+    guard = connection_record.info.pop("request_guard", None)
+    if guard is not None and dbapi_connection is not None:
+        guard.release(dbapi_connection)
+
+
+class _ReceiveChannel:
+    # Единственный читатель receive: сразу замечает http.disconnect, а приложению
+    # отдаёт те же сообщения из буфера. Так и request.is_disconnected(), и наш
+    # сторож видят отключение клиента
+    def __init__(self, receive):
+        self._receive = receive
+        self.messages = deque()
+        self._changed = asyncio.Event()
+
+    async def watch(self, on_disconnect):
+        while True:
+            message = await self._receive()
+            self.messages.append(message)
+            self._changed.set()
+            if message["type"] == "http.disconnect":
+                on_disconnect()
+                return
+
+    async def receive(self):
+        while not self.messages:
+            self._changed.clear()
+            await self._changed.wait()
+        message = self.messages[0]
+        # http.disconnect остаётся в буфере: его можно получить сколько угодно раз
+        if message["type"] != "http.disconnect":
+            self.messages.popleft()
+        return message
+
+
+class RequestDeadlineMiddleware:
+    # Для GET/HEAD: дедлайн по пути и отмена, когда клиент ушёл. В обоих случаях
+    # прерываем запросы к базе этого запроса и отменяем его задачу. Если ответ ещё
+    # не начат, по дедлайну отдаём 504; начатый ответ просто обрывается
+    def __init__(self, app, deadlines: dict = REQUEST_DEADLINES, default: float = REQUEST_DEADLINE_DEFAULT):
+        self.app = app
+        self.deadlines = deadlines
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self.deadlines.get(scope["path"], self.default)
+        guard = RequestGuard(timeout)
+        token = _current.set(guard)
+        task = asyncio.current_task()
+        channel = _ReceiveChannel(receive)
+        started = finished = False
+
+        async def guarded_send(message):
+            nonlocal started, finished
+            if message["type"] == "http.response.start":
+                started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # После последнего чанка сервер сам отвечает на receive() через http.disconnect
+                finished = True
+            await send(message)
+
+        def stop(reason):
+            if not finished and guard.cancel(reason):
+                task.cancel()
+
+        watcher = asyncio.ensure_future(channel.watch(lambda: stop("disconnect")))
+        timer = asyncio.get_running_loop().call_later(timeout, stop, "deadline") if timeout else None
+        try:
+            await self.app(scope, channel.receive, guarded_send)
+        except asyncio.CancelledError:
+            # Отменили не мы (остановка сервера) или не только мы - отмену не глотаем
+            if guard.reason is None or task.uncancel() > 0:
+                raise
+            await self._stopped(scope, send, guard.reason, started)
+        except Exception:
+            # Прерванный запрос к базе и RequestCancelled приходят обычными исключениями
+            if not guard.expired():
+                raise
+            # Причина фиксируется, чтобы таймер уже не отменил задачу посреди ответа 504
+            guard.cancel("deadline")
+            await self._stopped(scope, send, guard.reason, started)
+        finally:
+            watcher.cancel()
+            if timer is not None:
+                timer.cancel()
+            _current.reset(token)
+
+    async def _stopped(self, scope, send, reason: str, started: bool):
+        logger.warning(f"{scope['method']} {scope['path']} stopped: {reason}")
+        if reason == "deadline" and not started:
+            await JSONResponse(status_code=504, content={"detail": "Request took too long"})(scope, None, send)
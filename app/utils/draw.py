@@ -0,0 +1,183 @@
+import hashlib
+import json
+import secrets
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.draw import Draw
+from app.models.ticket import Ticket
+from app.utils.change_feed import record_bulk
+from app.utils.country_stats import apply_country_delta, normalize_country_code
+from app.utils.timeseries import record_activity
+
+# Если подходящих билетов меньше 1/64 пространства ключей, а всего их немного,
+# дешевле прочитать их ключи по индексу, чем угадывать ключи наугад
+ENUMERATE_MAX_ELIGIBLE = 100_000
+ENUMERATE_MIN_RATIO = 64
+MAX_BATCH_KEYS = 5_000
+# Защита от бесконечного цикла, если подходящие билеты исчезли во время розыгрыша
+MAX_ATTEMPTS_FACTOR = 1_000
+
+
+class DrawError(Exception):
+    pass
+
+
+class DrawRng:
+    # Проверяемый ГСЧ: i-е число - первые 8 байт sha256(sha256(seed) || i)
+    def __init__(self, seed: str):
+        self.key = hashlib.sha256(seed.encode()).digest()
+        self.counter = 0
+
+    def _next64(self) -> int:
+        block = hashlib.sha256(self.key + self.counter.to_bytes(8, "big")).digest()
+        self.counter += 1
+        return int.from_bytes(block[:8], "big")
+
+    def below(self, n: int) -> int:
+        # Равномерно в [0, n): отбрасываем хвост, чтобы не было смещения от остатка
+        limit = (1 << 64) - (1 << 64) % n
+        while True:
+            value = self._next64()
+            if value < limit:
+                return value % n
+
+
+def _eligible(db: Session, country_code: str):
+    # В tickets только живые билеты, архив лежит в archived_tickets
+    query = db.query(Ticket).filter(Ticket.is_winner == False)
+    if country_code:
+        query = query.filter(Ticket.country_code == country_code)
+    return query
+
+
+def _eligible_snapshot(eligible):
+    # Один агрегат в базе, строки в Python не читаются: число подходящих билетов и
+    # отпечаток набора "min:max:sum" их draw_key. Повтор розыгрыша сверяет его тем же запросом
+    count, low, high, total = eligible.with_entities(
+        func.count(), func.min(Ticket.draw_key), func.max(Ticket.draw_key), func.sum(Ticket.draw_key)
+    ).one()
+    return count, f"{low or 0}:{high or 0}:{total or 0}"
+
+
+def _sample_by_rejection(eligible, rng: DrawRng, key_space: int, eligible_count: int, count: int):
+    # Случайный ключ из [1, key_space]: если он принадлежит подходящему билету - берём,
+    # иначе (дырка, архив, победитель, другая страна) - тянем следующий. Так каждый
+    # подходящий билет выбирается с одинаковой вероятностью, а в базу уходят только IN по индексу
+    chosen = []
+    chosen_keys = set()
+    attempts = 0
+    max_attempts = MAX_ATTEMPTS_FACTOR * count * max(1, key_space // max(1, eligible_count))
+
+    while len(chosen) < count:
+        if attempts > max_attempts:
+            raise DrawError("Not enough eligible tickets")
+        needed = count - len(chosen)
+        batch_size = min(MAX_BATCH_KEYS, needed * key_space // max(1, eligible_count) + 16)
+        keys = [rng.below(key_space) + 1 for _ in range(batch_size)]
+        attempts += batch_size
+
+        found = {
+            ticket.draw_key: ticket
+            for ticket in eligible.filter(Ticket.draw_key.in_(set(keys))).all()
+        }
+        # Порядок принятия - порядок ключей в потоке ГСЧ, размер пачки на результат не влияет
+        for key in keys:
+            if key in found and key not in chosen_keys:
+                chosen_keys.add(key)
+                chosen.append(found[key])
+                if len(chosen) == count:
+                    break
+    return chosen
+
+
+def _sample_by_enumeration(eligible, rng: DrawRng, count: int):
+    # Частичный Фишер-Йетс по отсортированному списку ключей подходящих билетов
+    keys = [key for (key,) in eligible.with_entities(Ticket.draw_key).order_by(Ticket.draw_key)]
+    if len(keys) < count:
+        raise DrawError("Not enough eligible tickets")
+    for i in range(count):
+        j = i + rng.below(len(keys) - i)
+        keys[i], keys[j] = keys[j], keys[i]
+    picked = keys[:count]
+    by_key = {ticket.draw_key: ticket for ticket in eligible.filter(Ticket.draw_key.in_(picked)).all()}
+    return [by_key[key] for key in picked]
+
+
+def run_draw(db: Session, count: int, prize_description: str, country_code: str = None) -> Draw:
+    country_code = normalize_country_code(country_code)
+    # seed выбирает только сервер: иначе вызывающий мог бы подобрать seed под нужный результат
+    seed = secrets.token_hex(32)
+    rng = DrawRng(seed)
+
+    eligible = _eligible(db, country_code)
+    eligible_count, eligible_digest = _eligible_snapshot(eligible)
+    if eligible_count < count:
+        raise DrawError(f"Only {eligible_count} eligible tickets, {count} requested")
+    key_space = db.query(func.max(Ticket.draw_key)).scalar() or 0
+
+    if eligible_count <= ENUMERATE_MAX_ELIGIBLE and eligible_count * ENUMERATE_MIN_RATIO < key_space:
+        method = "enumerate"
+        winners = _sample_by_enumeration(eligible, rng, count)
+    else:
+        method = "rejection"
+        winners = _sample_by_rejection(eligible, rng, key_space, eligible_count, count)
+
+    # Одним UPDATE помечаем всех победителей; условие is_winner == False
+    # ловит параллельный розыгрыш, выбравший те же билеты
+    winner_ids = [ticket.id for ticket in winners]
+    updated = db.query(Ticket).filter(
+        Ticket.id.in_(winner_ids),
+        Ticket.is_winner == False
+    ).update({
+        Ticket.is_winner: True,
+        Ticket.status: "winner",
+        Ticket.prize_description: prize_description,
+    }, synchronize_session=False)
+    if updated != len(winner_ids):
+        db.rollback()
+        raise DrawError("Tickets changed during the draw, try again")
+    record_bulk(db, Ticket, "updated", Ticket.id.in_(winner_ids))
+
+    per_country = {}
+    for ticket in winners:
+        per_country[ticket.country_code] = per_country.get(ticket.country_code, 0) + 1
+    # Строки счётчиков обновляем в одном порядке во всех транзакциях
+    for code, winners_count in sorted(per_country.items(), key=lambda item: item[0] or ""):
+        apply_country_delta(db, code, winners=winners_count)
+    record_activity(db, winners=len(winner_ids))
+
+    draw = Draw(
+        seed=seed,
+        winners_requested=count,
+        country_code=country_code,
+        prize_description=prize_description,
+        method=method,
+        key_space=key_space,
+        eligible_count=eligible_count,
+        eligible_digest=eligible_digest,
+        winner_ids=json.dumps([str(ticket_id) for ticket_id in winner_ids]),
+        winner_numbers=json.dumps([ticket.ticket_number for ticket in winners]),
+    )
+    db.add(draw)
+    db.commit()
+    db.refresh(draw)
+    return draw
+
+
+def draw_to_dict(draw: Draw) -> dict:
+    return {
+        "id": draw.id,
+        "seed": draw.seed,
+        "winners_requested": draw.winners_requested,
+        "country_code": draw.country_code,
+        "prize_description": draw.prize_description,
+        "method": draw.method,
+        "key_space": draw.key_space,
+        "eligible_count": draw.eligible_count,
+        "eligible_digest": draw.eligible_digest,
+        "winner_ids": json.loads(draw.winner_ids),
+        "winner_numbers": json.loads(draw.winner_numbers),
+        "created_at": draw.created_at.isoformat() if draw.created_at else None,
+    }
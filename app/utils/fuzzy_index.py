@@ -0,0 +1,147 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from app.utils.ticket_events import subscribe_numbers
+from app.utils.ticket_index import LiveNumberIndex
+
+MAX_DISTANCE = 2
+# Потолок числа вариантов для расстояния 2 (~1 мкс на вариант): цифровые номера до 12 знаков
+# и hex до 8 в него укладываются, а при алфавите из букв и цифр поиск ограничивается
+# расстоянием 1 - ответ это показывает (capped)
+MAX_VARIANTS = 40_000
+# Бит фильтра на номер: при 16 лишь ~6% отсутствующих вариантов доходят до bisect
+FILTER_BITS_PER_KEY = 16
+
+
+def _edits(word: bytes, alphabet: list) -> set:
+    # Все строки на расстоянии Левенштейна ровно 1 (удаление, замена, вставка)
+    result = set()
+    for i in range(len(word) + 1):
+        head, tail = word[:i], word[i:]
+        for char in alphabet:
+            result.add(head + char + tail)
+        if tail:
+            rest = tail[1:]
+            result.add(head + rest)
+            for char in alphabet:
+                result.add(head + char + rest)
+    result.discard(word)
+    return result
+
+
+class FuzzyNumberIndex(LiveNumberIndex):
+    # Поиск с опечатками через окрестность запроса: генерируем все варианты номера
+    # на расстоянии 1-2 и проверяем, какие из них есть среди билетов. Номера хранятся
+    # отсортированным array 64-битных хешей (8 байт на билет), проверка - bisect.
+    # Время зависит от длины номера и алфавита, а не от числа билетов и их распределения.
+    # Перед bisect стоит битовый фильтр по тому же хешу (2 байта на билет): большинство
+    # вариантов отсеивается одной проверкой бита
+    def __init__(self):
+        super().__init__()
+        self._hashes = array("q")
+        self._filter = bytearray(1)
+        self._filter_mask = 7
+        # Какие символы встречаются в номерах: варианты строим только из них
+        self._chars = Counter()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _build_filter(self):
+        # Размер - степень двойки, чтобы номер бита брался маской. Биты удалённых номеров
+        # не снимаются (их могут делить другие номера) - их чистит следующая пересборка
+        bits = 1 << max(16, (len(self._hashes) * FILTER_BITS_PER_KEY - 1).bit_length())
+        self._filter = bytearray(bits >> 3)
+        self._filter_mask = bits - 1
+        for value in self._hashes:
+            self._set_bit(value)
+
+    def _set_bit(self, value: int):
+        bit = value & self._filter_mask
+        self._filter[bit >> 3] |= 1 << (bit & 7)
+
+    def _contains_hash(self, value: int) -> bool:
+        bit = value & self._filter_mask
+        if not self._filter[bit >> 3] & (1 << (bit & 7)):
+            return False
+        pos = bisect_left(self._hashes, value)
+        return pos < len(self._hashes) and self._hashes[pos] == value
+
+    def _contains(self, key: bytes) -> bool:
+        return self._contains_hash(hash(key))
+
+    def _entry(self, key: str, number: str) -> bytes:
+        return key.encode()
+
+    def _install(self, keys: list):
+        self._hashes = array("q", sorted(set(map(hash, keys))))
+        self._build_filter()
+        self._chars = Counter()
+        for key in keys:
+            self._chars.update(key)
+
+    def _add(self, key: str, number: str):
+        key = key.encode()
+        value = hash(key)
+        pos = bisect_left(self._hashes, value)
+        if pos < len(self._hashes) and self._hashes[pos] == value:
+            return
+        self._hashes.insert(pos, value)
+        self._chars.update(key)
+        # Фильтр переполнился - делаем вдвое больше, иначе растёт доля ложных срабатываний
+        if len(self._hashes) * FILTER_BITS_PER_KEY > (self._filter_mask + 1) * 2:
+            self._build_filter()
+        else:
+            self._set_bit(value)
+
+    def _remove(self, key: str):
+        key = key.encode()
+        value = hash(key)
+        pos = bisect_left(self._hashes, value)
+        if pos < len(self._hashes) and self._hashes[pos] == value:
+            del self._hashes[pos]
+            self._chars.subtract(key)
+            self._chars += Counter()
+
+    def search(self, number: str, max_distance: int = 1, limit: int = 10) -> dict:
+        # Ближайшие ключи [(ticket_key, расстояние)] - номера для показа подставляет маршрут; distance - до какого расстояния реально искали,
+        # capped - запрошенное расстояние урезано из-за размера окрестности
+        query = number.encode()
+        requested = max(0, min(max_distance, MAX_DISTANCE))
+        with self._lock:
+            alphabet = [bytes((char,)) for char in self._chars]
+            bits, mask = self._filter, self._filter_mask
+
+        # Варианты строим и прогоняем через фильтр без лока: правки индекса из коммитов их не ждут.
+        # Биты фильтра только добавляются, пока пересборка не заменит его целиком
+        levels = [{query}]
+        distance = requested
+        if requested >= 1:
+            first = _edits(query, alphabet)
+            levels.append(first)
+            # Размер окрестности второго уровня - около |первой|^2 / 2
+            if requested >= 2 and len(first) ** 2 // 2 > MAX_VARIANTS:
+                distance = 1
+            if distance >= 2:
+                second = set()
+                for variant in first:
+                    second |= _edits(variant, alphabet)
+                second -= first
+                second.discard(query)
+                levels.append(second)
+        candidates = [
+            (key, level)
+            for level, keys in enumerate(levels)
+            for key in keys
+            if bits[((value := hash(key)) & mask) >> 3] & (1 << (value & 7))
+        ]
+
+        with self._lock:
+            results = [(key.decode(), level) for key, level in candidates if self._contains(key)]
+        results.sort(key=lambda item: (item[1], item[0]))
+        return {"distance": distance, "capped": distance < requested, "matches": results[:limit]}
+
+
+fuzzy_numbers = FuzzyNumberIndex()
+subscribe_numbers(fuzzy_numbers.on_change)
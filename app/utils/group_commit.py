@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+
+from sqlalchemy import inspect
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import WriteSessionLocal
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() == "true"
+# Сколько ждать попутчиков после первого запроса и сколько строк максимум в одной транзакции
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "64"))
+
+
+def _load(db, objects):
+    # После коммита дочитываем серверные значения (created_at и т.п.) одним SELECT
+    # на модель вместо refresh() на каждый объект
+    ids = defaultdict(list)
+    for obj in objects:
+        ids[type(obj)].append(inspect(obj).identity[0])
+    for model, keys in ids.items():
+        primary_key = inspect(model).primary_key[0]
+        db.query(model).filter(primary_key.in_(keys)).populate_existing().all()
+
+
+class GroupCommitter:
+    # Склеивает записи из параллельных запросов в одну транзакцию: один коммит (fsync)
+    # на пачку вместо коммита на каждый запрос. Если одна запись падает (например, на
+    # уникальности), пачка повторяется с savepoint на каждую запись - соседи не страдают.
+    # Результат отдаётся вызывающему только после коммита всей пачки
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_rows: int = GROUP_COMMIT_MAX_ROWS):
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._pending = []
+        self._full = None
+        self._flusher = None
+
+    async def submit(self, build):
+        # build(db) добавляет объекты в сессию и возвращает результат записи.
+        # Исключение из build или из flush его savepoint приходит только этому вызывающему
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((build, future, loop.time()))
+        if self._flusher is None:
+            self._full = asyncio.Event()
+            self._flusher = asyncio.ensure_future(self._run())
+        elif len(self._pending) >= self.max_rows:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                # Окно считается от самого старого запроса: те, кто ждал прошлый коммит, уже отстояли своё
+                delay = self.window - (loop.time() - self._pending[0][2])
+                if delay > 0 and len(self._pending) < self.max_rows:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+                self._full = asyncio.Event()
+                try:
+                    outcomes = await run_in_threadpool(self._commit, [build for build, _, _ in batch])
+                except Exception as e:
+                    outcomes = [(None, e)] * len(batch)
+                for (_, future, _), (result, error) in zip(batch, outcomes):
+                    # Запрос мог быть отменён (клиент ушёл), а запись уже сохранена
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._flusher = None
+
+    def _commit(self, builds):
+        # Объекты не expire после коммита: вызывающие читают их уже без сессии
+        db = WriteSessionLocal(expire_on_commit=False)
+        try:
+            try:
+                # Обычно ошибок в пачке нет: пишем её одной транзакцией без savepoint'ов
+                outcomes = [(build(db), None) for build in builds]
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                if len(builds) == 1:
+                    return [(None, e)]
+                # Кто-то из пачки упал - повторяем, изолируя каждую запись в своём savepoint
+                outcomes = self._commit_isolated(db, builds)
+            _load(db, [result for result, error in outcomes if error is None and result is not None])
+            logger.debug(f"Group commit: {len(builds)} writes in one transaction")
+            return outcomes
+        finally:
+            db.close()
+
+    def _commit_isolated(self, db, builds):
+        outcomes = []
+        for build in builds:
+            try:
+                # flush savepoint'а происходит при выходе из блока
+                with db.begin_nested():
+                    result = build(db)
+                outcomes.append((result, None))
+            except Exception as e:
+                outcomes.append((None, e))
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Group commit of {len(builds)} writes failed: {str(e)}")
+            return [(None, error or e) for _, error in outcomes]
+        return outcomes
+
+
+# Вставки билетов из /tickets/create
+ticket_writes = GroupCommitter()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import ReadSessionLocal
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket
+from app.utils.change_feed import feed_version
+from app.utils.ticket_events import subscribe, tickets_version
+
+logger = logging.getLogger(__name__)
+
+# Как часто сверять снимок с журналом изменений (MAX(seq)): столько он максимум отстаёт
+# от коммитов других процессов (воркеров). Свои коммиты с билетами будят пересборку сразу
+HOT_SNAPSHOT_MAX_LAG = float(os.getenv("HOT_SNAPSHOT_MAX_LAG", "1"))
+# Сколько секунд снимок, отставший от своих коммитов с билетами, ещё отдаётся клиентам,
+# которые сами не писали (без cookie read-your-writes). Пишущему клиенту - сразу из базы
+HOT_SNAPSHOT_MAX_STALENESS = float(os.getenv("HOT_SNAPSHOT_MAX_STALENESS", "1"))
+
+
+class HotSnapshot(NamedTuple):
+    # version - tickets_version() на момент начала сборки: если он меньше текущего,
+    # снимок ещё не видит последние коммиты этого процесса с билетами. feed_seq - MAX(seq) журнала
+    # изменений на тот же момент, по нему видны коммиты других процессов
+    version: int
+    feed_seq: int
+    built_at: float
+    featured: tuple
+    winners: tuple
+    archived_winners: tuple
+    latest: Optional[Ticket]
+
+
+class HotTickets:
+    # Маленькие и очень горячие выборки (избранные, победители, последний билет) в памяти.
+    # Снимок не меняется после сборки: новый собирается целиком и подменяется одним
+    # присваиванием, поэтому читатели не берут локов и не ходят в базу.
+    # Коммит этого процесса с билетами сразу будит пересборку. Пока она идёт, снимок
+    # отстаёт: клиенту, который сам писал (cookie read-your-writes, см. get_read_db), и
+    # админке читаем из базы - после своего коммита он не увидит старые данные или 404.
+    # Остальным отставший снимок отдаётся не дольше HOT_SNAPSHOT_MAX_STALENESS секунд.
+    # Коммиты без билетов (задачи, счётчики) снимок не устаревают.
+    # Объекты в снимке отсоединены от сессии и общие для всех запросов - их нельзя менять
+    def __init__(self):
+        self.current: Optional[HotSnapshot] = None
+        # time.monotonic() первого коммита с билетами, которого снимок не видит
+        self._behind_since: Optional[float] = None
+        self._loop = None
+        self._wakeup = None
+
+    def _fresh(self, db, max_staleness: float = HOT_SNAPSHOT_MAX_STALENESS) -> Optional[HotSnapshot]:
+        snapshot = self.current
+        if snapshot is None:
+            return None
+        if snapshot.version == tickets_version():
+            return snapshot
+        # Сессии без отметки (get_db, админка) считаем сессиями пишущего клиента
+        behind_since = self._behind_since
+        if db.info.get("own_writes", True) or behind_since is None or time.monotonic() - behind_since > max_staleness:
+            return None
+        return snapshot
+
+    def wake(self, *_):
+        # Вызывается из after_commit в любом потоке: будим пересборку, только если снимок отстал
+        snapshot = self.current
+        if snapshot is not None and snapshot.version == tickets_version():
+            return
+        if self._behind_since is None:
+            self._behind_since = time.monotonic()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # Цикл уже закрыт (остановка приложения)
+                pass
+
+    def rebuild(self):
+        started = time.monotonic()
+        version = tickets_version()
+        db = ReadSessionLocal()
+        try:
+            feed_seq = feed_version(db)
+            featured = tuple(db.query(Ticket).filter(Ticket.is_featured == True))
+            winners = tuple(db.query(Ticket).filter(Ticket.is_winner == True).order_by(Ticket.created_at.desc()))
+            archived_winners = tuple(
+                db.query(ArchivedTicket).filter(ArchivedTicket.is_winner == True).order_by(ArchivedTicket.created_at.desc())
+            )
+            latest = db.query(Ticket).order_by(Ticket.created_at.desc()).first()
+        finally:
+            # close() не expire'ит объекты - атрибуты остаются загруженными
+            db.close()
+        self.current = HotSnapshot(version, feed_seq, time.time(), featured, winners, archived_winners, latest)
+        # Коммиты во время сборки снимок может не видеть - считаем его отставшим с её начала
+        self._behind_since = None if tickets_version() == version else started
+
+    def featured(self, db) -> list:
+        # Пока снимка нет (старт, ошибки сборки) или он отстал, читаем из базы, как раньше
+        snapshot = self._fresh(db)
+        if snapshot is None:
+            return db.query(Ticket).filter(Ticket.is_featured == True).all()
+        return list(snapshot.featured)
+
+    def winners(self, db) -> list:
+        snapshot = self._fresh(db)
+        if snapshot is None:
+            return db.query(Ticket).filter(Ticket.is_winner == True).order_by(Ticket.created_at.desc()).all()
+        return list(snapshot.winners)
+
+    def all_winners(self, db) -> list:
+        # Победители из живых билетов и из архива, новые первыми
+        snapshot = self._fresh(db)
+        if snapshot is None:
+            winners = db.query(Ticket).filter(Ticket.is_winner == True).all()
+            winners += db.query(ArchivedTicket).filter(ArchivedTicket.is_winner == True).all()
+        else:
+            winners = list(snapshot.winners + snapshot.archived_winners)
+        winners.sort(key=lambda t: t.created_at, reverse=True)
+        return winners
+
+    def latest(self, db) -> Optional[Ticket]:
+        # Пустой снимок тоже перепроверяем запросом: 404 отдаём только по данным базы
+        snapshot = self._fresh(db)
+        if snapshot is None or snapshot.latest is None:
+            return db.query(Ticket).order_by(Ticket.created_at.desc()).first()
+        return snapshot.latest
+
+    def status(self) -> dict:
+        snapshot = self.current
+        if snapshot is None:
+            return {"version": None, "feed_seq": None, "tickets_version": tickets_version(), "age": None, "behind": None}
+        behind_since = self._behind_since
+        return {
+            "version": snapshot.version,
+            "feed_seq": snapshot.feed_seq,
+            "tickets_version": tickets_version(),
+            "age": round(time.time() - snapshot.built_at, 3),
+            # Сколько секунд снимок не видит свой коммит с билетами (None - не отстаёт)
+            "behind": round(time.monotonic() - behind_since, 3) if behind_since is not None else None,
+        }
+
+
+hot_tickets = HotTickets()
+subscribe(hot_tickets.wake)
+
+
+def _feed_moved(snapshot: HotSnapshot) -> bool:
+    db = ReadSessionLocal()
+    try:
+        return feed_version(db) != snapshot.feed_seq
+    finally:
+        db.close()
+
+
+async def keep_snapshot_fresh(snapshot: HotTickets, max_lag: float = HOT_SNAPSHOT_MAX_LAG):
+    # Пересборка сразу после своего коммита с билетами (будит wake), а раз в max_lag -
+    # ещё и если журнал изменений вырос из-за коммитов других воркеров
+    # (один запрос MAX(seq) по первичному ключу). Коммиты во время сборки дадут ещё одну
+    snapshot._wakeup = asyncio.Event()
+    snapshot._loop = asyncio.get_running_loop()
+    try:
+        while True:
+            snapshot._wakeup.clear()
+            try:
+                current = snapshot.current
+                if (
+                    current is None
+                    or current.version != tickets_version()
+                    or await run_in_threadpool(_feed_moved, current)
+                ):
+                    await run_in_threadpool(snapshot.rebuild)
+            except Exception as e:
+                logger.error(f"Failed to build hot ticket snapshot: {str(e)}")
+            try:
+                await asyncio.wait_for(snapshot._wakeup.wait(), max_lag)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        snapshot._loop = None
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, insert, update, delete, and_, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import SessionLocal, WriteSessionLocal, engine, write_engine
+from app.models.job import Job
+from app.utils.country_stats import rebuild_country_stats
+from app.utils.ticket_events import subscribe
+from app.utils.upload_gc import reconcile_uploads
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() != "false"
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# Страховочный опрос базы: задачи из других процессов и отложенные повторы
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5.0"))
+# Сколько задача может выполняться, прежде чем её заберёт другой воркер
+JOB_LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = 300
+# Период сверки папки загрузок с базой, секунды (0 - только вручную)
+UPLOAD_RECONCILE_INTERVAL = float(os.getenv("UPLOAD_RECONCILE_INTERVAL", str(24 * 3600)))
+
+jobs = Job.__table__
+# Тип задачи -> функция handler(db, **payload)
+HANDLERS = {}
+# Задачи, которые меняют данные: получают пишущую сессию (BEGIN IMMEDIATE в SQLite,
+# лок журнала изменений в Postgres), как обработчики с get_write_db
+WRITING_JOBS = set()
+
+
+def job_handler(kind: str, writes: bool = False):
+    def register(func):
+        HANDLERS[kind] = func
+        if writes:
+            WRITING_JOBS.add(kind)
+        return func
+    return register
+
+
+def enqueue(db: Session, kind: str, max_attempts: int = 5, delay: float = 0, **payload) -> Job:
+    # Задача попадает в базу вместе с коммитом вызывающего кода:
+    # если транзакция откатится, задачи тоже не будет
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+    )
+    db.add(job)
+    return job
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _claim_jobs(limit: int) -> list:
+    # Служебные записи идут через Core, мимо Session: иначе каждая смена статуса
+    # задачи поднимала бы версию данных в ticket_events
+    now = _now()
+    due = or_(
+        and_(jobs.c.status == "queued", jobs.c.run_at <= now),
+        and_(jobs.c.status == "running", jobs.c.locked_until < now),
+    )
+    # Раннер просыпается на каждый коммит, а задачи бывают редко: сначала дешёвое чтение
+    # по индексу status, и только если есть что брать - пишущая транзакция с блокировкой
+    with engine.connect() as conn:
+        if conn.execute(select(jobs.c.id).where(due).limit(1)).first() is None:
+            return []
+
+    claimed = []
+    with write_engine.begin() as conn:
+        # Зависшие задачи, у которых кончились попытки, больше не берём
+        conn.execute(update(jobs).where(
+            jobs.c.status == "running",
+            jobs.c.locked_until < now,
+            jobs.c.attempts >= jobs.c.max_attempts,
+        ).values(status="failed", locked_until=None))
+
+        rows = conn.execute(
+            select(jobs.c.id, jobs.c.kind, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts)
+            .where(due)
+            .order_by(jobs.c.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        for row in rows:
+            # Повторная проверка условия - защита от второго воркера без SKIP LOCKED (SQLite)
+            result = conn.execute(update(jobs).where(jobs.c.id == row.id, due).values(
+                status="running",
+                attempts=row.attempts + 1,
+                locked_until=now + JOB_LEASE,
+            ))
+            if result.rowcount == 1:
+                claimed.append(row)
+    return claimed
+
+
+def _finish_job(job_id: int):
+    with write_engine.begin() as conn:
+        conn.execute(delete(jobs).where(jobs.c.id == job_id))
+
+
+def _fail_job(row, error: str):
+    attempts = row.attempts + 1
+    if attempts >= row.max_attempts:
+        values = {"status": "failed", "locked_until": None, "last_error": error}
+    else:
+        # Экспоненциальная пауза между попытками: 2, 4, 8... секунд
+        delay = min(MAX_RETRY_DELAY, 2 ** attempts)
+        values = {
+            "status": "queued",
+            "locked_until": None,
+            "last_error": error,
+            "run_at": _now() + timedelta(seconds=delay),
+        }
+    with write_engine.begin() as conn:
+        conn.execute(update(jobs).where(jobs.c.id == row.id).values(**values))
+
+
+def _schedule(kind: str, delay: float, **payload):
+    # Периодическая задача: ставим следующий запуск, если в очереди такой ещё нет.
+    # Проверка и вставка в одной пишущей транзакции - воркеры не задвоят задачу
+    with write_engine.begin() as conn:
+        pending = conn.execute(
+            select(jobs.c.id).where(jobs.c.kind == kind, jobs.c.status == "queued").limit(1)
+        ).first()
+        if pending is None:
+            conn.execute(insert(jobs).values(
+                kind=kind,
+                payload=json.dumps(payload),
+                status="queued",
+                attempts=0,
+                max_attempts=5,
+                run_at=_now() + timedelta(seconds=delay),
+            ))
+
+
+def _schedule_periodic():
+    if UPLOAD_RECONCILE_INTERVAL > 0:
+        _schedule("reconcile_uploads", UPLOAD_RECONCILE_INTERVAL)
+
+
+def _run_handler(kind: str, payload: str):
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        raise LookupError(f"Unknown job kind: {kind}")
+    db = WriteSessionLocal() if kind in WRITING_JOBS else SessionLocal()
+    try:
+        handler(db, **json.loads(payload))
+    finally:
+        db.close()
+
+
+class JobRunner:
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.running = set()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+    def wake(self, *_):
+        # Можно вызывать из любого потока, например из after_commit
+        if self._loop is not None and not self._stopping:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        try:
+            await run_in_threadpool(_schedule_periodic)
+        except Exception as e:
+            logger.error(f"Failed to schedule periodic jobs: {str(e)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        if self._task is None:
+            return
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        # Даём начатым задачам доделаться; незавершённые заберёт следующий запуск по lease
+        if self.running:
+            await asyncio.wait(self.running, timeout=timeout)
+
+    async def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            free = self.concurrency - len(self.running)
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = await run_in_threadpool(_claim_jobs, free)
+                except Exception as e:
+                    logger.error(f"Failed to claim jobs: {str(e)}")
+            for row in claimed:
+                task = asyncio.create_task(self._execute(row))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+            # Будят новый коммит, завершение задачи или остановка; иначе - опрос по таймеру
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, row):
+        try:
+            await run_in_threadpool(_run_handler, row.kind, row.payload)
+        except Exception as e:
+            logger.error(f"Job {row.id} ({row.kind}) failed: {str(e)}")
+            await run_in_threadpool(_fail_job, row, str(e))
+        else:
+            await run_in_threadpool(_finish_job, row.id)
+        finally:
+            self.wake()
+
+
+runner = JobRunner()
+# Новая задача видна после коммита - будим раннер, не дожидаясь опроса
+subscribe(runner.wake)
+
+
+@job_handler("delete_files")
+def delete_files(db: Session, paths: list):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@job_handler("reconcile_country_stats", writes=True)
+def reconcile_country_stats(db: Session):
+    rebuild_country_stats(db)
+    db.commit()
+
+
+@job_handler("reconcile_uploads")
+def reconcile_uploads_job(db: Session, quarantine: bool = True, dry_run: bool = False):
+    try:
+        reconcile_uploads(db, quarantine=quarantine, dry_run=dry_run)
+    finally:
+        # Следующая плановая сверка, даже если эта упала; ручной запуск её не задваивает
+        _schedule_periodic()
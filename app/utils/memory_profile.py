@@ -0,0 +1,162 @@
+import logging
+import os
+import resource
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# tracemalloc с самого старта: нужен, чтобы пики запросов считались сразу, а не после включения через API.
+# Трассировка замедляет выделения памяти и сама занимает память, поэтому по умолчанию выключена
+MEMORY_TRACKING_ENABLED = os.getenv("MEMORY_TRACKING_ENABLED", "false").lower() == "true"
+# Глубина стека на выделение: 1 - только строка, больше - полезнее diff, но дороже
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+# Маршруты, для которых считаем пик памяти за запрос (точное совпадение пути)
+MEMORY_TRACKED_ROUTES = tuple(
+    route.strip()
+    for route in os.getenv(
+        "MEMORY_TRACKED_ROUTES",
+        "/,/tickets/all/html,/tickets/winners/html,/archived-tickets,/tickets/archived,/tickets/changes",
+    ).split(",")
+    if route.strip()
+)
+# Запрос с пиком больше этого пишется в лог предупреждением
+MEMORY_PEAK_WARN_MB = float(os.getenv("MEMORY_PEAK_WARN_MB", "64"))
+
+GROUP_BY = ("lineno", "filename", "traceback")
+# Свои выделения tracemalloc и импорты в отчёте только мешают
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_baseline = None
+# Путь -> счётчики пиков: requests, skipped, last_kb, max_kb
+route_peaks = {}
+
+
+class MemoryProfilingError(Exception):
+    pass
+
+
+def start_tracing(frames: int = MEMORY_TRACE_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing():
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+
+
+def memory_status() -> dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else None,
+        "traced_kb": current // 1024,
+        "traced_peak_kb": peak // 1024,
+        # ru_maxrss в Linux в килобайтах: максимум за всю жизнь процесса, не текущее значение
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "has_baseline": _baseline is not None,
+        "routes": route_peaks,
+    }
+
+
+def _take() -> tracemalloc.Snapshot:
+    if not tracemalloc.is_tracing():
+        raise MemoryProfilingError("tracemalloc is not tracing, enable it first")
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+
+def _check_group_by(group_by: str):
+    if group_by not in GROUP_BY:
+        raise MemoryProfilingError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+
+
+def _where(stat) -> list:
+    # Для group_by=traceback - весь стек, иначе одна строка
+    return [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+
+
+def take_snapshot(group_by: str = "lineno", limit: int = 20) -> dict:
+    # Снимок становится базой для diff_snapshot
+    global _baseline
+    _check_group_by(group_by)
+    snapshot = _take()
+    _baseline = snapshot
+    stats = snapshot.statistics(group_by)
+    return {
+        "total_kb": sum(stat.size for stat in stats) // 1024,
+        "top": [
+            {"where": _where(stat), "size_kb": stat.size // 1024, "count": stat.count}
+            for stat in stats[:limit]
+        ],
+    }
+
+
+def diff_snapshot(group_by: str = "lineno", limit: int = 20, reset: bool = False) -> dict:
+    # Что выросло с базового снимка; reset=True делает текущий снимок новой базой
+    global _baseline
+    _check_group_by(group_by)
+    if _baseline is None:
+        raise MemoryProfilingError("No baseline snapshot, take one first")
+    snapshot = _take()
+    stats = snapshot.compare_to(_baseline, group_by)
+    if reset:
+        _baseline = snapshot
+    return {
+        "growth_kb": sum(stat.size_diff for stat in stats) // 1024,
+        "top": [
+            {
+                "where": _where(stat),
+                "size_kb": stat.size // 1024,
+                "size_diff_kb": stat.size_diff // 1024,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+
+class RequestMemoryMiddleware:
+    # Пик traced-памяти за время запроса для MEMORY_TRACKED_ROUTES (пока включён tracemalloc).
+    # Пик в tracemalloc один на процесс, поэтому меряем по одному запросу за раз, остальные
+    # считаются в skipped. Выделения параллельных запросов попадают в замер - это оценка сверху
+    def __init__(self, app, routes=MEMORY_TRACKED_ROUTES, warn_mb: float = MEMORY_PEAK_WARN_MB):
+        self.app = app
+        self.routes = frozenset(routes)
+        self.warn_kb = warn_mb * 1024
+        self.active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.routes or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+
+        stats = route_peaks.setdefault(scope["path"], {"requests": 0, "skipped": 0, "last_kb": 0, "max_kb": 0})
+        if self.active:
+            stats["skipped"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        self.active = True
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            # Ответы стримятся, поэтому замер заканчивается после отправки последнего чанка
+            await self.app(scope, receive, send)
+        finally:
+            self.active = False
+            if tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                peak_kb = max(0, peak - start) // 1024
+                stats["requests"] += 1
+                stats["last_kb"] = peak_kb
+                stats["max_kb"] = max(stats["max_kb"], peak_kb)
+                if peak_kb > self.warn_kb:
+                    logger.warning(f"{scope['method']} {scope['path']} peaked at {peak_kb / 1024:.1f} MB")
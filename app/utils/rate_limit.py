@@ -0,0 +1,254 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+# По умолчанию равно ёмкости пула SQLAlchemy (5 + 10 overflow)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "15"))
+# Слоты, которые публичные запросы занять не могут - они остаются админке
+ADMIN_RESERVED_SLOTS = int(os.getenv("ADMIN_RESERVED_SLOTS", "3"))
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "50"))
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", "2.0"))
+MAX_TRACKED_CLIENTS = 100_000
+# Сколько прокси перед приложением дописывают адрес в X-Forwarded-For (Render, nginx).
+# 0 - заголовку не верим и считаем клиентом адрес соединения
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+# Сколько секунд ответ держит слот после начала отправки: медленные читатели длинных
+# потоковых страниц не занимают все публичные слоты
+SLOT_HOLD_AFTER_START = float(os.getenv("SLOT_HOLD_AFTER_START", "2.0"))
+
+# Класс маршрута: (токенов в секунду, размер корзины)
+ROUTE_LIMITS = {
+    "search": (1.0, 10),
+    "count": (1.0, 10),
+    "pages": (2.0, 20),
+    "default": (5.0, 50),
+    # Не запросы, а ответы 401/403 на админские записи: ограничивает подбор ADMIN_KEY
+    "auth_failure": (0.1, 10),
+}
+
+EXEMPT_PREFIXES = ("/static/", "/uploaded_tickets/")
+EXEMPT_PATHS = {"/health", "/ready"}
+PAGE_PATHS = {"/", "/tickets/all/html", "/tickets/winners/html", "/tickets/archived", "/archived-tickets"}
+SEARCH_PATHS = {"/tickets/search", "/tickets/search/result"}
+
+
+def classify(method: str, path: str, query: dict):
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path in SEARCH_PATHS or (path == "/tickets/all/html" and query.get("number")):
+        return "search"
+    if path == "/tickets/count":
+        return "count"
+    if method not in ("GET", "HEAD"):
+        # Все изменяющие маршруты закрыты ADMIN_KEY, и ключ проверяет сам обработчик:
+        # /tickets/create получает его полем формы, которое здесь не прочитать
+        return "admin_write"
+    if path in PAGE_PATHS:
+        return "pages"
+    return "default"
+
+
+def client_ip(scope, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if trusted_hops <= 0:
+        return peer
+    forwarded = []
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            forwarded += [part.strip() for part in value.decode("latin-1").split(",") if part.strip()]
+    # Каждый прокси дописывает в конец адрес, от которого получил запрос, поэтому клиент -
+    # trusted_hops-й адрес с конца. Всё левее мог прислать сам клиент. Адресов меньше -
+    # запрос пришёл в обход прокси
+    if len(forwarded) < trusted_hops:
+        return peer
+    return forwarded[-trusted_hops]
+
+
+class TokenBuckets:
+    # Корзина токенов на пару (IP, класс маршрута); старые ключи вытесняются по LRU
+    def __init__(self, limits: dict, max_keys: int = MAX_TRACKED_CLIENTS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def _tokens(self, key, rate: float, burst: int, now: float) -> float:
+        tokens, updated = self.buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def wait_time(self, client: str, route_class: str) -> float:
+        # Как take, но токен не списывается
+        rate, burst = self.limits[route_class]
+        tokens = self._tokens((client, route_class), rate, burst, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    def take(self, client: str, route_class: str) -> float:
+        # 0 - запрос пропущен, иначе сколько секунд подождать до следующего токена
+        rate, burst = self.limits[route_class]
+        key = (client, route_class)
+        now = time.monotonic()
+        tokens = self._tokens(key, rate, burst, now)
+        self.buckets.pop(key, None)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+class ConcurrencyLimiter:
+    # Общий лимит одновременных запросов; админские ждут в отдельной очереди и идут первыми
+    def __init__(self, limit: int, admin_reserved: int, max_queue: int):
+        self.limit = limit
+        self.public_limit = max(1, limit - admin_reserved)
+        self.max_queue = max_queue
+        self.active = 0
+        self.admin_waiters = deque()
+        self.public_waiters = deque()
+
+    def _can_enter(self, admin: bool) -> bool:
+        if admin:
+            return self.active < self.limit
+        return not self.admin_waiters and self.active < self.public_limit
+
+    async def acquire(self, admin: bool, timeout: float) -> bool:
+        waiters = self.admin_waiters if admin else self.public_waiters
+        if not waiters and self._can_enter(admin):
+            self.active += 1
+            return True
+        if not admin and len(waiters) >= self.max_queue:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await asyncio.wait_for(future, None if admin else timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._abandon(future, waiters)
+            return False
+        except asyncio.CancelledError:
+            self._abandon(future, waiters)
+            raise
+
+    def _abandon(self, future, waiters):
+        if future.done() and not future.cancelled():
+            # Слот уже был выдан, но забрать его не успели - возвращаем
+            self.release()
+        elif future in waiters:
+            waiters.remove(future)
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        # Слот переходит ожидающему напрямую, без повторной конкуренции
+        while self.admin_waiters and self.active < self.limit:
+            future = self.admin_waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(True)
+        while self.public_waiters and self._can_enter(False):
+            future = self.public_waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(True)
+
+
+def _retry_response(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, admin_key: str):
+        self.app = app
+        self.admin_key = admin_key
+        self.buckets = TokenBuckets(ROUTE_LIMITS)
+        self.limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, ADMIN_RESERVED_SLOTS, MAX_QUEUE_DEPTH)
+
+    def _is_admin(self, scope, query: dict) -> bool:
+        if not self.admin_key:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-admin-key":
+                return value.decode("latin-1") == self.admin_key
+        return query.get("admin_key", [None])[0] == self.admin_key
+
+    def _count_auth_failures(self, send, client: str):
+        async def counting_send(message):
+            if message["type"] == "http.response.start" and message["status"] in (401, 403):
+                self.buckets.take(client, "auth_failure")
+            await send(message)
+        return counting_send
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        route_class = classify(scope["method"], scope["path"], query)
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        admin = self._is_admin(scope, query)
+        client = client_ip(scope)
+        if route_class == "admin_write":
+            if not admin:
+                # Корзину тратят только отказы обработчика: с верным ключом в форме записи не ограничены
+                retry_after = self.buckets.wait_time(client, "auth_failure")
+                if retry_after:
+                    await _retry_response(429, "Too many requests", retry_after)(scope, receive, send)
+                    return
+                send = self._count_auth_failures(send, client)
+        elif not admin:
+            retry_after = self.buckets.take(client, route_class)
+            if retry_after:
+                await _retry_response(429, "Too many requests", retry_after)(scope, receive, send)
+                return
+
+        if not await self.limiter.acquire(admin, MAX_QUEUE_WAIT):
+            await _retry_response(503, "Server is busy, try again later", MAX_QUEUE_WAIT)(scope, receive, send)
+            return
+
+        # Слот держим до конца ответа, но не дольше SLOT_HOLD_AFTER_START с начала отправки:
+        # дальше потоковое тело упирается в скорость клиента, а не в сервер
+        released = False
+        timer = None
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.limiter.release()
+
+        async def slot_send(message):
+            nonlocal timer
+            if message["type"] == "http.response.start" and timer is None:
+                timer = asyncio.get_running_loop().call_later(SLOT_HOLD_AFTER_START, release)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, slot_send)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            release()
@@ -0,0 +1,254 @@
+import asyncio
+import functools
+import inspect
+import os
+import weakref
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.deadlines import current_guard
+from app.utils.ticket_events import data_version
+
+# Ключ -> future с результатом вычисления, которое сейчас выполняется
+_inflight = {}
+# Сколько символов потокового ответа держать для догоняющих и медленных читателей
+COALESCE_BUFFER_SIZE = int(os.getenv("COALESCE_BUFFER_SIZE", str(1024 * 1024)))
+
+
+class _ReaderResponse(StreamingResponse):
+    # Ответ одного читателя общего потока. Оборванная отправка (клиент ушёл, дедлайн)
+    # не закрывает генератор тела сразу, поэтому читатель снимается здесь - иначе
+    # генерация ждала бы его до сборки мусора, а остальные читатели стояли бы
+    def __init__(self, content, on_finish, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_finish = on_finish
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_finish()
+
+
+class _SharedStream:
+    # Один проход по телу потокового ответа, раздаваемый всем ожидающим.
+    # В памяти держим не больше max_buffer символов: прочитанное всеми читателями
+    # выбрасывается, а генерация ждёт самого медленного. Присоединиться можно, пока
+    # начало тела ещё в буфере; потом новые запросы считают ответ сами.
+    # cleanup вызывается, когда генерация закончилась: тело читает из сессий вычисления,
+    # и закрыть их можно только после последнего чанка
+    def __init__(self, response: StreamingResponse, max_buffer: int = COALESCE_BUFFER_SIZE, on_closed=None, cleanup=None):
+        self.status_code = response.status_code
+        self.headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+        self.max_buffer = max_buffer
+        self.on_closed = on_closed
+        self.cleanup = cleanup
+        self.chunks = []
+        # Номер первого чанка в self.chunks с начала тела и суммарный размер буфера
+        self.offset = 0
+        self.size = 0
+        # Читатель -> номер следующего чанка
+        self.positions = {}
+        self.joinable = True
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        # Отмена запроса-ведущего не должна обрывать ответ остальным (см. response)
+        self.guard = current_guard()
+        self.task = asyncio.ensure_future(self._pump(response.body_iterator))
+
+    async def _pump(self, body_iterator):
+        try:
+            async for chunk in body_iterator:
+                self.chunks.append(chunk)
+                self.size += len(chunk)
+                self._wake()
+                while self.size > self.max_buffer:
+                    self._trim()
+                    if not self.positions:
+                        # Все читатели ушли - дальше генерировать некому
+                        return
+                    if self.size <= self.max_buffer:
+                        break
+                    await self._changed.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+            try:
+                if hasattr(body_iterator, "aclose"):
+                    await body_iterator.aclose()
+            finally:
+                if self.cleanup is not None:
+                    await run_in_threadpool(self.cleanup)
+
+    def _trim(self):
+        lowest = min(self.positions.values(), default=self.offset + len(self.chunks))
+        drop = lowest - self.offset
+        if drop <= 0:
+            return
+        self._close()
+        for chunk in self.chunks[:drop]:
+            self.size -= len(chunk)
+        del self.chunks[:drop]
+        self.offset = lowest
+
+    def _close(self):
+        # Начало тела выброшено - присоединиться больше нельзя
+        if self.joinable:
+            self.joinable = False
+            if self.on_closed is not None:
+                self.on_closed()
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _leave(self, reader):
+        if self.positions.pop(reader, None) is not None:
+            self._wake()
+
+    async def _iterate(self, reader):
+        try:
+            while True:
+                while self.positions[reader] < self.offset + len(self.chunks):
+                    position = self.positions[reader]
+                    self.positions[reader] = position + 1
+                    if self.size > self.max_buffer:
+                        # Генерация может ждать именно этого читателя
+                        self._wake()
+                    yield self.chunks[position - self.offset]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self._leave(reader)
+
+    def response(self):
+        # None - начало тела уже не в буфере, ответ нужно считать заново
+        if not self.joinable:
+            return None
+        if self.positions and self.guard is not None:
+            # Второй читатель: генерацию теперь остановит только уход всех читателей
+            self.guard.detach()
+        reader = object()
+        self.positions[reader] = 0
+        body = self._iterate(reader)
+        # Если тело так и не начали читать (клиент ушёл раньше), finally генератора не выполнится -
+        # читатель снимается при сборке генератора и не держит генерацию
+        weakref.finalize(body, self._leave, reader)
+        return _ReaderResponse(body, functools.partial(self._leave, reader), status_code=self.status_code, headers=self.headers)
+
+
+def _freeze(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _make_key(func, kwargs):
+    params = []
+    for name, value in sorted(kwargs.items()):
+        if isinstance(value, Session):
+            # Чтение с реплики и с основной базы не склеиваем: реплика может отставать.
+            # Клиент после своей записи тоже не должен получить ответ, собранный из отставшего снимка
+            params.append((name, value.info.get("route"), value.info.get("own_writes")))
+            continue
+        if isinstance(value, Request):
+            # url_for строит абсолютные ссылки, поэтому хост входит в ключ
+            params.append((name, str(value.base_url)))
+            continue
+        params.append((name, _freeze(value)))
+    return (func.__module__, func.__qualname__, tuple(params), data_version())
+
+
+def _own_sessions(kwargs) -> dict:
+    # Свои сессии для вычисления вместо сессий запроса-ведущего: FastAPI закрывает их,
+    # когда ведущий получил ответ или ушёл, а общий поток ещё читают остальные.
+    # Сессия реплики привязана к соединению, которое закроет get_read_db, - берём его движок
+    owned = {}
+    for name, value in kwargs.items():
+        if isinstance(value, Session):
+            bind = value.get_bind()
+            if isinstance(bind, Connection):
+                bind = bind.engine
+            owned[name] = Session(bind=bind, autoflush=False, info=dict(value.info))
+    return owned
+
+
+def _close_sessions(sessions: dict):
+    for session in sessions.values():
+        session.close()
+
+
+def coalesce(func):
+    # Одинаковые одновременные запросы (маршрут, параметры, версия данных)
+    # ждут одно вычисление вместо того, чтобы каждый раз ходить в базу
+    is_async = inspect.iscoroutinefunction(func)
+
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        key = _make_key(func, kwargs)
+        waiter = _inflight.get(key)
+        if waiter is not None:
+            try:
+                result = await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                if not waiter.cancelled():
+                    raise
+                # Ведущий запрос отменён - считаем сами
+                return await wrapper(**kwargs)
+            if isinstance(result, _SharedStream):
+                response = result.response()
+                # Опоздали к началу большого ответа - считаем сами
+                return response if response is not None else await wrapper(**kwargs)
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        sessions = _own_sessions(kwargs)
+        try:
+            if is_async:
+                result = await func(**{**kwargs, **sessions})
+            else:
+                result = await run_in_threadpool(func, **{**kwargs, **sessions})
+        except asyncio.CancelledError:
+            _inflight.pop(key, None)
+            future.cancel()
+            _close_sessions(sessions)
+            raise
+        except Exception as e:
+            _inflight.pop(key, None)
+            _close_sessions(sessions)
+            future.set_exception(e)
+            # Помечаем исключение как полученное, даже если ждущих не было
+            future.exception()
+            raise
+
+        if isinstance(result, StreamingResponse):
+            def release(*_):
+                if _inflight.get(key) is future:
+                    del _inflight[key]
+
+            # Сессии живут, пока идёт генерация тела, и закрываются её задачей
+            shared = _SharedStream(result, on_closed=release, cleanup=functools.partial(_close_sessions, sessions))
+            future.set_result(shared)
+            # Запрос считается выполняющимся, пока тело не дочитано до конца или не вышло из буфера
+            shared.task.add_done_callback(release)
+            return shared.response()
+
+        _inflight.pop(key, None)
+        future.set_result(result)
+        await run_in_threadpool(_close_sessions, sessions)
+        return result
+
+    return wrapper
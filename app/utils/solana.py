@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SOLANA_RPC_URL = os.getenv("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com")
+SOLANA_WALLET_ADDRESS = os.getenv("SOLANA_WALLET_ADDRESS", "4NuDayX7fiZT4Teo9HGBNqCRKNV6bRsPFAY6JkjYC9rN")
+SOLANA_RPC_TIMEOUT = float(os.getenv("SOLANA_RPC_TIMEOUT", "5.0"))
+# Сколько ждём, чтобы собрать несколько подписей в один getSignatureStatuses
+BATCH_WINDOW = 0.02
+# Лимит RPC на число подписей в одном getSignatureStatuses
+MAX_BATCH_SIZE = 256
+# Неподтверждённые и ненайденные транзакции перепроверяем через несколько секунд
+PENDING_TTL = 10.0
+MAX_CACHED_RESULTS = 50_000
+
+SIGNATURE_RE = re.compile(r"^[1-9A-HJ-NP-Za-km-z]{64,88}$")
+
+_client = None
+# Подпись -> результат; подтверждённые лежат без срока, остальные до expires_at
+_cache = OrderedDict()
+# Подпись -> future проверки, которая сейчас выполняется
+_inflight = {}
+_queue = []
+_flush_task = None
+
+
+class SolanaRpcError(Exception):
+    pass
+
+
+def get_client():
+    # Один пул соединений на процесс вместо нового клиента на каждый запрос.
+    # httpx импортируется при первой проверке транзакции, а не при старте приложения
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SOLANA_RPC_TIMEOUT, connect=2.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _rpc(payload):
+    response = await get_client().post(SOLANA_RPC_URL, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+def _result(status: str, detail: str, confirmation: str = None) -> dict:
+    return {"status": status, "detail": detail, "confirmation": confirmation}
+
+
+def _account_keys(transaction: dict) -> set:
+    keys = transaction.get("transaction", {}).get("message", {}).get("accountKeys", [])
+    return {key["pubkey"] if isinstance(key, dict) else key for key in keys}
+
+
+async def _fetch_transactions(signatures: list) -> dict:
+    # Один JSON-RPC batch на все подтверждённые подписи
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "id": index,
+            "method": "getTransaction",
+            "params": [signature, {
+                "encoding": "jsonParsed",
+                "commitment": "confirmed",
+                "maxSupportedTransactionVersion": 0,
+            }],
+        }
+        for index, signature in enumerate(signatures)
+    ]
+    replies = await _rpc(payload)
+    by_id = {reply.get("id"): reply.get("result") for reply in replies}
+    return {signature: by_id.get(index) for index, signature in enumerate(signatures)}
+
+
+async def _check_batch(signatures: list) -> dict:
+    reply = await _rpc({
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "getSignatureStatuses",
+        "params": [signatures, {"searchTransactionHistory": True}],
+    })
+    if "error" in reply:
+        raise SolanaRpcError(reply["error"].get("message", "RPC error"))
+    statuses = dict(zip(signatures, reply["result"]["value"]))
+
+    results = {}
+    confirmed = []
+    for signature, status in statuses.items():
+        if status is None:
+            results[signature] = _result("not_found", "Transaction not found")
+        elif status.get("err") is not None:
+            results[signature] = _result("error", "Transaction failed", status.get("confirmationStatus"))
+        elif status.get("confirmationStatus") in ("confirmed", "finalized"):
+            confirmed.append(signature)
+        else:
+            results[signature] = _result("pending", "Transaction is not confirmed yet", status.get("confirmationStatus"))
+
+    if confirmed:
+        transactions = await _fetch_transactions(confirmed)
+        for signature in confirmed:
+            transaction = transactions.get(signature)
+            confirmation = statuses[signature].get("confirmationStatus")
+            if transaction is None:
+                results[signature] = _result("pending", "Transaction is not available yet", confirmation)
+            elif SOLANA_WALLET_ADDRESS not in _account_keys(transaction):
+                results[signature] = _result("error", "Transaction is not related to our wallet", confirmation)
+            else:
+                results[signature] = _result("success", "Transaction confirmed", confirmation)
+    return results
+
+
+def _cache_get(signature: str):
+    entry = _cache.get(signature)
+    if entry is None:
+        return None
+    result, expires_at = entry
+    if expires_at is not None and expires_at < time.monotonic():
+        del _cache[signature]
+        return None
+    _cache.move_to_end(signature)
+    return result
+
+
+def _cache_put(signature: str, result: dict):
+    # Итог окончательный, только когда транзакция финализирована
+    final = result["confirmation"] == "finalized" and result["status"] in ("success", "error")
+    _cache[signature] = (result, None if final else time.monotonic() + PENDING_TTL)
+    _cache.move_to_end(signature)
+    while len(_cache) > MAX_CACHED_RESULTS:
+        _cache.popitem(last=False)
+
+
+async def _flush():
+    global _flush_task
+    await asyncio.sleep(BATCH_WINDOW)
+    _flush_task = None
+    queued, _queue[:] = list(_queue), []
+
+    for start in range(0, len(queued), MAX_BATCH_SIZE):
+        signatures = queued[start:start + MAX_BATCH_SIZE]
+        error = None
+        try:
+            results = await _check_batch(signatures)
+        except Exception as e:
+            logger.error(f"Solana RPC request failed: {str(e)}")
+            results = {}
+            error = e
+        for signature in signatures:
+            future = _inflight.pop(signature)
+            if signature in results:
+                _cache_put(signature, results[signature])
+                future.set_result(results[signature])
+            else:
+                future.set_exception(SolanaRpcError(str(error)))
+                future.exception()
+
+
+async def check_transaction(signature: str) -> dict:
+    global _flush_task
+    cached = _cache_get(signature)
+    if cached is not None:
+        return cached
+
+    # Одновременные проверки одной подписи ждут один и тот же ответ
+    future = _inflight.get(signature)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        _inflight[signature] = future
+        _queue.append(signature)
+        if _flush_task is None:
+            _flush_task = asyncio.ensure_future(_flush())
+    return await asyncio.shield(future)
@@ -0,0 +1,238 @@
+import asyncio
+import fcntl
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse
+
+from app.database.db import ReadSessionLocal, reads_own_writes
+from app.utils.change_feed import feed_version
+from app.utils.hot_snapshot import hot_tickets
+from app.utils.ticket_events import data_version, tickets_version
+
+logger = logging.getLogger(__name__)
+
+STATIC_SNAPSHOT_ENABLED = os.getenv("STATIC_SNAPSHOT_ENABLED", "false").lower() == "true"
+STATIC_SNAPSHOT_DIR = os.getenv("STATIC_SNAPSHOT_DIR", "static_snapshot")
+# Перерисовка через столько секунд после последнего коммита: серия записей даёт одну перерисовку
+STATIC_SNAPSHOT_DEBOUNCE = float(os.getenv("STATIC_SNAPSHOT_DEBOUNCE", "1"))
+# При непрерывных записях всё равно перерисовываем не реже, чем раз в столько секунд
+STATIC_SNAPSHOT_MAX_DELAY = float(os.getenv("STATIC_SNAPSHOT_MAX_DELAY", "10"))
+# Перерисовка без новых коммитов - страховка, если журнал изменений не читается
+STATIC_SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("STATIC_SNAPSHOT_REFRESH_INTERVAL", "60"))
+
+# Страницы без параметров, которые отдаются файлами, и расширение файла (по нему выбирается content-type).
+# С любыми query-параметрами запрос идёт в обычный маршрут
+PAGES = {
+    "/": "html",
+    "/tickets/all/html": "html",
+    "/tickets/winners/html": "html",
+    "/tickets/archived": "json",
+    "/archived-tickets": "json",
+    "/tickets/last_ticket": "json",
+    "/tickets/count": "json",
+    "/stats": "json",
+    "/stats/countries": "json",
+}
+# Запросы самой отрисовки идут мимо файлов, иначе перерисовка прочитает старый файл
+RENDER_HEADER = "x-static-snapshot-render"
+# Файлы пишет один воркер - тот, кто держит эту блокировку в каталоге снимка
+LOCK_FILE = ".render.lock"
+
+
+def page_file(directory: str, path: str) -> str:
+    # /tickets/winners/html -> <directory>/tickets/winners/html/index.html: фронт-прокси
+    # находит файл по $uri без отдельной таблицы путей
+    return os.path.join(directory, path.strip("/"), f"index.{PAGES[path]}")
+
+
+def write_atomic(target: str, content: bytes):
+    # Пишем во временный файл рядом и подменяем через os.replace: читатель видит
+    # либо старую, либо новую версию целиком, но не недописанный файл
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        # mkstemp создаёт файл с правами 0600 - фронт-прокси под другим пользователем его не прочитает
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class StaticSnapshot:
+    # Рендерит PAGES через само приложение (ASGI, без сети) в файлы. Так файлы совпадают с
+    # ответами обычных маршрутов, а отдельного кода отрисовки нет
+    def __init__(self, app, directory: str = STATIC_SNAPSHOT_DIR, admin_key: Optional[str] = None):
+        self.app = app
+        self.directory = directory
+        # С админским ключом запросы отрисовки не упираются в лимиты по IP
+        self.admin_key = admin_key
+        self.version: Optional[int] = None
+        self.feed_seq: Optional[int] = None
+        self.rendered_at: Optional[float] = None
+        self._lock_fd: Optional[int] = None
+
+    def file_for(self, path: str) -> str:
+        return page_file(self.directory, path)
+
+    def acquire(self) -> bool:
+        # Неблокирующий flock: держит его тот воркер, который первым его взял, до своего
+        # завершения. Остальные только отдают файлы и пробуют снова на каждом тике -
+        # так после падения пишущего воркера его место занимает другой
+        if self._lock_fd is not None:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def release(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def render(self, feed_seq: Optional[int] = None):
+        import httpx
+
+        version = data_version()
+        if feed_seq is None:
+            feed_seq = await run_in_threadpool(_read_feed_version)
+        # Страницы берут избранных и победителей из снимка в памяти - он должен видеть те же
+        # коммиты, в том числе коммиты других воркеров до feed_seq, поэтому устаревший снимок
+        # пересобираем, а не отдаём в пределах HOT_SNAPSHOT_MAX_STALENESS
+        current = hot_tickets.current
+        if current is None or current.version != tickets_version() or current.feed_seq < feed_seq:
+            await run_in_threadpool(hot_tickets.rebuild)
+
+        headers = {RENDER_HEADER: "1"}
+        if self.admin_key:
+            headers["x-admin-key"] = self.admin_key
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://snapshot", headers=headers) as client:
+            for path in PAGES:
+                response = await client.get(path)
+                target = self.file_for(path)
+                if response.status_code == 200:
+                    await run_in_threadpool(write_atomic, target, response.content)
+                elif os.path.exists(target):
+                    # 404 (нет ни одного билета) и ошибки отдаёт обычный маршрут
+                    os.unlink(target)
+        self.version = version
+        self.feed_seq = feed_seq
+        self.rendered_at = time.time()
+
+    def status(self) -> dict:
+        writer = self._lock_fd is not None
+        if self.rendered_at is None:
+            return {"version": None, "feed_seq": None, "age": None, "writer": writer}
+        return {
+            "version": self.version,
+            "feed_seq": self.feed_seq,
+            "age": round(time.time() - self.rendered_at, 3),
+            "writer": writer,
+        }
+
+
+def _read_feed_version() -> int:
+    db = ReadSessionLocal()
+    try:
+        return feed_version(db)
+    finally:
+        db.close()
+
+
+async def keep_static_fresh(
+    snapshot: StaticSnapshot,
+    debounce: float = STATIC_SNAPSHOT_DEBOUNCE,
+    max_delay: float = STATIC_SNAPSHOT_MAX_DELAY,
+    interval: float = STATIC_SNAPSHOT_REFRESH_INTERVAL,
+):
+    # Рисует только воркер с блокировкой (acquire), остальные ждут её освобождения.
+    # Первая отрисовка сразу, дальше - когда после коммитов debounce секунд тишины
+    # (или max_delay с первого неотрисованного коммита) и раз в interval в любом случае.
+    # Коммиты других воркеров видны по MAX(seq) журнала изменений - один запрос по
+    # первичному ключу на тик, только в пишущем воркере
+    seen = data_version()
+    seen_feed = None
+    last_change = pending_since = None
+    last_render = None
+    try:
+        while True:
+            if not await run_in_threadpool(snapshot.acquire):
+                await asyncio.sleep(debounce)
+                continue
+            now = time.monotonic()
+            version = data_version()
+            try:
+                feed_seq = await run_in_threadpool(_read_feed_version)
+            except Exception as e:
+                logger.error(f"Failed to read change feed for static snapshot: {str(e)}")
+                feed_seq = seen_feed
+            if version != seen or (seen_feed is not None and feed_seq != seen_feed):
+                last_change = now
+                if pending_since is None:
+                    pending_since = now
+            seen = version
+            seen_feed = feed_seq
+
+            due = last_render is None or now - last_render >= interval
+            if pending_since is not None and (now - last_change >= debounce or now - pending_since >= max_delay):
+                due = True
+            if due:
+                pending_since = None
+                # Время попытки, а не успеха: при ошибке не повторяем каждый тик
+                last_render = now
+                try:
+                    await snapshot.render(feed_seq)
+                except Exception as e:
+                    logger.error(f"Failed to render static snapshot: {str(e)}")
+            await asyncio.sleep(debounce / 4)
+    finally:
+        snapshot.release()
+
+
+class StaticSnapshotMiddleware:
+    # GET/HEAD страниц из PAGES без параметров отдаются готовым файлом: без обработчика,
+    # шаблонов и базы. Нет файла - обычный маршрут
+    def __init__(self, app, snapshot: StaticSnapshot):
+        self.app = app
+        self.snapshot = snapshot
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or scope["query_string"]
+            or scope["path"] not in PAGES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        # Клиент после своей записи должен сразу видеть изменения, а файл перерисуется только через debounce
+        if RENDER_HEADER in request.headers or reads_own_writes(request):
+            await self.app(scope, receive, send)
+            return
+
+        target = self.snapshot.file_for(scope["path"])
+        try:
+            stat_result = os.stat(target)
+        except FileNotFoundError:
+            await self.app(scope, receive, send)
+            return
+        response = FileResponse(target, stat_result=stat_result, headers={"Cache-Control": "no-cache"})
+        await response(scope, receive, send)
@@ -0,0 +1,52 @@
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.utils.deadlines import current_guard
+from app.utils.template_engine import templates
+
+# Сколько фрагментов Jinja склеивать в один чанк ответа
+STREAM_BUFFER_SIZE = 64
+# Сколько строк за раз тянуть из серверного курсора
+STREAM_FETCH_SIZE = 200
+
+
+def stream_template(name: str, context: dict, status_code: int = 200, headers: dict = None) -> StreamingResponse:
+    # Рендерим шаблон по частям: шапка и первые карточки уходят клиенту,
+    # пока остальные строки ещё читаются из курсора
+    template = templates.get_template(name)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return StreamingResponse(
+        stream,
+        status_code=status_code,
+        headers=headers,
+        media_type="text/html; charset=utf-8",
+    )
+
+
+def stream_query(query):
+    # Серверный курсор (stream_results) вместо .all(): строки не копятся в памяти
+    rows = query.yield_per(STREAM_FETCH_SIZE)
+    # Клиент ушёл или вышел дедлайн - останавливаемся на следующей пачке, а не в конце таблицы
+    guard = current_guard()
+    return guard.iterate(rows, STREAM_FETCH_SIZE) if guard is not None else rows
+
+
+def stream_json(query, status_code: int = 200) -> StreamingResponse:
+    # JSON-массив по строкам курсора: тот же вывод, что у return query.all(),
+    # но в памяти только текущая пачка, а не вся таблица и весь ответ
+    def chunks():
+        separator = "["
+        batch = []
+        for row in stream_query(query):
+            batch.append(separator + json.dumps(jsonable_encoder(row), ensure_ascii=False, separators=(",", ":")))
+            separator = ","
+            if len(batch) >= STREAM_FETCH_SIZE:
+                yield "".join(batch)
+                batch = []
+        batch.append("]" if separator == "," else "[]")
+        yield "".join(batch)
+
+    return StreamingResponse(chunks(), status_code=status_code, media_type="application/json")
@@ -0,0 +1,139 @@
+import logging
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket
+
+logger = logging.getLogger(__name__)
+
+# Версия данных внутри процесса: растёт после каждого коммита с изменениями
+_version = 0
+# Растёт только после коммитов, менявших билеты (живые или архив), - без задач, счётчиков и т.п.
+_tickets_version = 0
+_version_lock = threading.Lock()
+_listeners = []
+_number_listeners = []
+
+
+def data_version() -> int:
+    return _version
+
+
+def tickets_version() -> int:
+    return _tickets_version
+
+
+def subscribe(callback):
+    # callback(version) вызывается в потоке, сделавшем коммит, поэтому должен быть быстрым
+    _listeners.append(callback)
+    return callback
+
+
+def subscribe_numbers(callback):
+    # callback(changes, reset) после коммита: changes - список ("add"|"remove", ticket_key, ticket_number)
+    # по живым билетам в порядке flush; reset=True - было массовое изменение, нужен полный пересчёт
+    _number_listeners.append(callback)
+    return callback
+
+
+def _notify_numbers(changes, reset):
+    for callback in list(_number_listeners):
+        try:
+            callback(changes, reset)
+        except Exception as e:
+            logger.error(f"Ticket number listener failed: {str(e)}")
+
+
+def notify_change(tickets: bool = True):
+    global _version, _tickets_version
+    with _version_lock:
+        _version += 1
+        if tickets:
+            _tickets_version += 1
+        version = _version
+    for callback in list(_listeners):
+        try:
+            callback(version)
+        except Exception as e:
+            logger.error(f"Ticket change listener failed: {str(e)}")
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["data_changed"] = True
+    if any(isinstance(obj, (Ticket, ArchivedTicket)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["tickets_changed"] = True
+
+    # Номера снимаем во время flush: после коммита объекты уже expired
+    changes = session.info.setdefault("ticket_numbers", [])
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            changes.append(("remove", obj.ticket_key, obj.ticket_number))
+    for obj in session.dirty:
+        if isinstance(obj, Ticket):
+            history = inspect(obj).attrs.ticket_key.history
+            changes.extend(("remove", key, None) for key in history.deleted)
+            changes.extend(("add", key, obj.ticket_number) for key in history.added)
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            changes.append(("add", obj.ticket_key, obj.ticket_number))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk(orm_execute_state):
+    # Массовые query(...).delete() и upsert'ы не проходят через flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["data_changed"] = True
+        # Массовые UPDATE билетов (розыгрыш) номера не меняют, а delete/insert - меняют
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Ticket, ArchivedTicket):
+            orm_execute_state.session.info["tickets_changed"] = True
+        if mapper is not None and mapper.class_ is Ticket and not orm_execute_state.is_update:
+            orm_execute_state.session.info["ticket_numbers_reset"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    session.info.pop("savepoints", None)
+    changes = session.info.pop("ticket_numbers", [])
+    reset = session.info.pop("ticket_numbers_reset", False)
+    if changes or reset:
+        _notify_numbers(changes, reset)
+    tickets = session.info.pop("tickets_changed", False)
+    if session.info.pop("data_changed", False):
+        notify_change(tickets)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_savepoint(session, transaction):
+    # Запоминаем состояние на начало savepoint: откат к нему убирает только то, что было внутри
+    if transaction.nested:
+        session.info.setdefault("savepoints", {})[transaction] = (
+            len(session.info.get("ticket_numbers", [])),
+            session.info.get("data_changed", False),
+            session.info.get("ticket_numbers_reset", False),
+            session.info.get("tickets_changed", False),
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    if session.in_nested_transaction():
+        # Откат к savepoint (begin_nested): внешняя транзакция продолжается
+        mark = session.info.get("savepoints", {}).pop(session.get_nested_transaction(), None)
+        if mark is not None:
+            size, changed, reset, tickets = mark
+            del session.info.setdefault("ticket_numbers", [])[size:]
+            session.info["data_changed"] = changed
+            session.info["ticket_numbers_reset"] = reset
+            session.info["tickets_changed"] = tickets
+        return
+    session.info.pop("data_changed", None)
+    session.info.pop("ticket_numbers", None)
+    session.info.pop("ticket_numbers_reset", None)
+    session.info.pop("tickets_changed", None)
+    session.info.pop("savepoints", None)
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from itertools import accumulate
+
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import ReadSessionLocal
+from app.models.ticket import Ticket
+from app.utils.change_feed import feed_events, feed_version
+from app.utils.ticket_events import subscribe_numbers
+from app.utils.ticket_number import normalize_ticket_number
+
+logger = logging.getLogger(__name__)
+
+# Как часто сверяться с журналом изменений (MAX(seq)): столько индекс максимум отстаёт
+# от коммитов других процессов (воркеров). Свои коммиты применяются сразу
+SUGGEST_SYNC_INTERVAL = float(os.getenv("SUGGEST_SYNC_INTERVAL", "1"))
+# Если отстали на большее число событий, дешевле пересобрать индекс целиком
+MAX_CATCH_UP_EVENTS = 10_000
+# Буфер пересобирается, когда удалённые номера занимают больше этой доли
+COMPACT_RATIO = 0.5
+# События журнала -> правка множества живых номеров; updated номер не меняет
+FEED_OPS = {"created": "add", "unarchived": "add", "archived": "remove", "deleted": "remove"}
+
+
+class LiveNumberIndex(ABC):
+    # Общая часть индексов по номерам живых билетов: сборка из базы в фоне,
+    # правки своих коммитов из ticket_events и чужих - из журнала изменений.
+    # Подклассы задают _entry/_install/_add/_remove
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._building = False
+        self._pending = []
+        self._reset_requested = False
+        # До какого seq журнала индекс применил события
+        self.seq = 0
+        self.ready = False
+
+    @abstractmethod
+    def _entry(self, key: str, number: str):
+        # Что хранится на билет: строится при сборке из (ticket_key, ticket_number)
+        ...
+
+    @abstractmethod
+    def _install(self, entries: list):
+        ...
+
+    @abstractmethod
+    def _add(self, key: str, number: str):
+        ...
+
+    @abstractmethod
+    def _remove(self, key: str):
+        ...
+
+    def rebuild(self):
+        with self._lock:
+            if self._building:
+                self._reset_requested = True
+                return
+            self._building = True
+            self._pending = []
+            self._reset_requested = False
+
+        try:
+            db = ReadSessionLocal()
+            try:
+                # seq читаем до билетов: события после него при сверке применятся ещё раз,
+                # а повтор add/remove по порядку seq даёт то же множество
+                seq = feed_version(db)
+                entries = [
+                    self._entry(key, number)
+                    for key, number in db.query(Ticket.ticket_key, Ticket.ticket_number).yield_per(10_000)
+                ]
+            finally:
+                db.close()
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+
+        with self._lock:
+            self._install(entries)
+            # Изменения, закоммиченные во время чтения, накатываем поверх
+            self._apply(self._pending)
+            self._pending = []
+            self._building = False
+            self.seq = seq
+            self.ready = True
+            again = self._reset_requested
+        logger.info(f"{type(self).__name__} built: {len(entries)} numbers")
+        if again:
+            self.rebuild()
+
+    def _apply(self, changes):
+        for op, key, number in changes:
+            if op == "add":
+                self._add(key, number)
+            else:
+                self._remove(key)
+
+    def catch_up(self, events: list):
+        # События журнала [(seq, action, ticket_number)] по порядку seq, в том числе свои:
+        # они уже применены, а повтор ничего не меняет
+        with self._lock:
+            if self._building:
+                return
+            changes = []
+            for seq, action, number in events:
+                if seq > self.seq and action in FEED_OPS:
+                    changes.append((FEED_OPS[action], normalize_ticket_number(number), number))
+            self._apply(changes)
+            if events:
+                self.seq = max(self.seq, events[-1][0])
+
+    def on_change(self, changes, reset):
+        # Вызывается из after_commit в потоке запроса - держим лок коротко
+        with self._lock:
+            if self._building:
+                self._pending.extend(changes)
+                self._reset_requested = self._reset_requested or reset
+                return
+            if not reset:
+                self._apply(changes)
+                return
+        # Массовое удаление - пересобираем в фоне, не задерживая запрос
+        threading.Thread(target=self.rebuild, daemon=True).start()
+
+
+class SortedNumberIndex(LiveNumberIndex):
+    # Номера живых билетов: байты (utf-8) подряд в одном bytearray, а порядок сортировки
+    # задаёт array с номерами записей. ~20 байт на билет вместо отдельного str на каждый.
+    # Запись - ticket_key, а если номер для показа отличается - ticket_key\0ticket_number:
+    # \0 меньше любого символа, поэтому записи упорядочены по ключу
+    def __init__(self):
+        super().__init__()
+        self._blob = bytearray()
+        self._starts = array("I")
+        self._lengths = array("H")
+        self._order = array("I")
+        self._garbage = 0
+
+    def __len__(self):
+        return len(self._order)
+
+    def _entry(self, key: str, number: str) -> bytes:
+        if not number or number == key:
+            return key.encode()
+        return key.encode() + b"\0" + number.encode()
+
+    def _key(self, entry: int) -> bytes:
+        start = self._starts[entry]
+        return bytes(self._blob[start:start + self._lengths[entry]])
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(self._order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, key: bytes):
+        # Позиция записи с этим ticket_key и признак, что она есть
+        pos = self._lower_bound(key)
+        if pos < len(self._order):
+            found = self._key(self._order[pos])
+            return pos, found == key or found.startswith(key + b"\0")
+        return pos, False
+
+    def _add(self, key: str, number: str):
+        pos, exists = self._find(key.encode())
+        if exists:
+            return
+        entry = self._entry(key, number)
+        self._starts.append(len(self._blob))
+        self._lengths.append(len(entry))
+        self._blob += entry
+        self._order.insert(pos, len(self._starts) - 1)
+
+    def _remove(self, key: str):
+        pos, exists = self._find(key.encode())
+        if exists:
+            self._garbage += self._lengths[self._order[pos]]
+            del self._order[pos]
+            if self._garbage > len(self._blob) * COMPACT_RATIO:
+                self._compact()
+
+    def _compact(self):
+        self._install([self._key(entry) for entry in self._order])
+
+    def _install(self, entries: list):
+        # Сортируем сами: порядок байт не зависит от collation базы
+        entries = sorted(entries)
+        lengths = array("H", map(len, entries))
+        self._starts = array("I", accumulate(lengths, initial=0))
+        self._starts.pop()
+        self._lengths = lengths
+        self._blob = bytearray(b"".join(entries))
+        self._order = array("I", range(len(entries)))
+        self._garbage = 0
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        # Номера для показа, упорядоченные по ticket_key
+        key = prefix.encode()
+        result = []
+        with self._lock:
+            pos = self._lower_bound(key)
+            while pos < len(self._order) and len(result) < limit:
+                candidate = self._key(self._order[pos])
+                if not candidate.startswith(key):
+                    break
+                result.append(candidate.rpartition(b"\0")[2].decode())
+                pos += 1
+        return result
+
+
+ticket_numbers = SortedNumberIndex()
+subscribe_numbers(ticket_numbers.on_change)
+
+
+def sync_indexes(indexes):
+    # Одна проверка MAX(seq) на все индексы; события читаются, только если журнал вырос
+    for index in indexes:
+        # Первая сборка не удалась - пробуем ещё раз
+        if not index.ready:
+            index.rebuild()
+    ready = [index for index in indexes if index.ready]
+    if not ready:
+        return
+    db = ReadSessionLocal()
+    try:
+        latest = feed_version(db)
+        since = min(index.seq for index in ready)
+        if latest <= since:
+            return
+        if latest - since > MAX_CATCH_UP_EVENTS:
+            events = None
+        else:
+            events = feed_events(db, since, MAX_CATCH_UP_EVENTS)
+    finally:
+        db.close()
+    for index in ready:
+        if index.seq >= latest:
+            continue
+        if events is None:
+            index.rebuild()
+        else:
+            index.catch_up(events)
+
+
+async def keep_index_fresh(indexes, interval: float = SUGGEST_SYNC_INTERVAL):
+    # Первая сборка сразу после старта, дальше - сверка с журналом (0 - только свои коммиты)
+    for index in indexes:
+        try:
+            await run_in_threadpool(index.rebuild)
+        except Exception as e:
+            logger.error(f"Failed to build {type(index).__name__}: {str(e)}")
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(sync_indexes, indexes)
+        except Exception as e:
+            logger.error(f"Failed to sync number indexes: {str(e)}")
@@ -0,0 +1,20 @@
+import re
+import unicodedata
+
+# Префикс из QR-кода билета, в любом регистре
+PREFIX_RE = re.compile(r"^\s*baylot:", re.IGNORECASE)
+
+
+def clean_ticket_number(number: str) -> str:
+    # Номер для показа: без префикса и пробелов по краям, регистр как ввели
+    if number is None:
+        return None
+    return PREFIX_RE.sub("", unicodedata.normalize("NFKC", number)).strip()
+
+
+def normalize_ticket_number(number: str) -> str:
+    # Канонический ключ номера (колонка ticket_key): без префикса, без пробелов
+    # внутри, в верхнем регистре. Через него идут все записи и поиски по номеру
+    if number is None:
+        return None
+    return "".join(clean_ticket_number(number).split()).upper()
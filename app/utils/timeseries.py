@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from app.models.activity_rollup import ActivityRollup
+from app.utils.country_stats import insert_for
+
+BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+COUNTERS = ("tickets_created", "winners", "archived", "unarchived")
+# Сколько периодов отдаём по умолчанию и максимум за один запрос
+DEFAULT_BUCKETS = 30
+MAX_BUCKETS = 2000
+
+
+class TimeseriesError(Exception):
+    pass
+
+
+def to_utc(moment: datetime) -> datetime:
+    # Всё храним и сравниваем в UTC без таймзоны; время без таймзоны считаем уже UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    moment = to_utc(moment).replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def record_activity(db: Session, tickets_created: int = 0, winners: int = 0, archived: int = 0, unarchived: int = 0):
+    # Прибавляем события к текущему часу и дню, коммит делает вызывающий код
+    values = {"tickets_created": tickets_created, "winners": winners, "archived": archived, "unarchived": unarchived}
+    if not any(values.values()):
+        return
+
+    now = datetime.now(timezone.utc)
+    insert = insert_for(db)
+    stmt = insert(ActivityRollup).values([
+        {"bucket": bucket, "bucket_start": bucket_start(now, bucket), **values} for bucket in BUCKETS
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ActivityRollup.bucket, ActivityRollup.bucket_start],
+        set_={name: getattr(ActivityRollup, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+    )
+    db.execute(stmt)
+
+
+def get_timeseries(db: Session, bucket: str = "day", start: datetime = None, end: datetime = None) -> dict:
+    # Читаем только строки периодов из диапазона: стоимость зависит от числа периодов, а не билетов.
+    # Периоды без событий заполняем нулями
+    if bucket not in BUCKETS:
+        raise TimeseriesError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    step = BUCKETS[bucket]
+    end = bucket_start(end or datetime.now(timezone.utc), bucket)
+    start = bucket_start(start, bucket) if start else end - step * (DEFAULT_BUCKETS - 1)
+    if start > end:
+        raise TimeseriesError("start must not be after end")
+    if (end - start) // step + 1 > MAX_BUCKETS:
+        raise TimeseriesError(f"Too many buckets, at most {MAX_BUCKETS} per request")
+
+    rows = {
+        row.bucket_start: row
+        for row in db.query(ActivityRollup).filter(
+            ActivityRollup.bucket == bucket,
+            ActivityRollup.bucket_start >= start,
+            ActivityRollup.bucket_start <= end,
+        )
+    }
+    series = []
+    totals = dict.fromkeys(COUNTERS, 0)
+    moment = start
+    while moment <= end:
+        row = rows.get(moment)
+        point = {"start": moment.isoformat() + "Z"}
+        for name in COUNTERS:
+            point[name] = getattr(row, name) if row is not None else 0
+            totals[name] += point[name]
+        series.append(point)
+        moment += step
+
+    return {
+        "bucket": bucket,
+        "start": start.isoformat() + "Z",
+        "end": end.isoformat() + "Z",
+        "series": series,
+        "totals": totals,
+    }
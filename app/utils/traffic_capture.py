@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from urllib.parse import parse_qsl, urlencode
+
+TRAFFIC_CAPTURE_ENABLED = os.getenv("TRAFFIC_CAPTURE_ENABLED", "false").lower() == "true"
+# Доля запросов, попадающих в файл: 0.05 - каждый двадцатый
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "0.05"))
+TRAFFIC_CAPTURE_FILE = os.getenv("TRAFFIC_CAPTURE_FILE", "captures/traffic.jsonl")
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "5"))
+
+REDACTED = "REDACTED"
+# Параметры и заголовки, значения которых в файл не пишем
+SECRET_PARAMS = {"admin_key", "password", "token", "secret", "api_key"}
+SECRET_HEADERS = {b"x-admin-key", b"authorization", b"cookie"}
+# Заголовки, от которых зависит ответ: нужны для повторения запроса
+KEPT_HEADERS = {b"accept", b"content-type"}
+SKIPPED_PREFIXES = ("/static/", "/uploaded_tickets/")
+
+logger = logging.getLogger("traffic_capture")
+logger.propagate = False
+
+
+def _redact_query(query_string: bytes) -> str:
+    params = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return urlencode([(name, REDACTED if name.lower() in SECRET_PARAMS else value) for name, value in params])
+
+
+def _headers(raw_headers) -> dict:
+    headers = {}
+    for name, value in raw_headers:
+        if name in SECRET_HEADERS:
+            # Сам факт админского запроса важен для повтора, значение - нет
+            headers[name.decode("latin-1")] = REDACTED
+        elif name in KEPT_HEADERS:
+            headers[name.decode("latin-1")] = value.decode("latin-1")
+    return headers
+
+
+_listener = None
+
+
+def start_capture(path: str = TRAFFIC_CAPTURE_FILE):
+    # Вызывается из lifespan; без него middleware ничего не пишет
+    global _listener
+    if _listener is not None:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(
+        path, maxBytes=TRAFFIC_CAPTURE_MAX_BYTES, backupCount=TRAFFIC_CAPTURE_BACKUPS, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(logging.INFO)
+    _listener = QueueListener(records, handler)
+    _listener.start()
+
+
+def stop_capture():
+    # Дописывает очередь и закрывает файл
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+class TrafficCaptureMiddleware:
+    # Выборочная запись запросов в JSONL для scripts/replay_traffic.py. В пути запроса
+    # только random() и put в очередь; в файл пишет поток QueueListener с ротацией
+    def __init__(self, app, sample: float = TRAFFIC_CAPTURE_SAMPLE):
+        self.app = app
+        self.sample = sample
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or _listener is None
+            or random.random() >= self.sample
+            or scope["path"].startswith(SKIPPED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        timestamp = time.time()
+        started = time.perf_counter()
+        response = {"status": None, "bytes": 0}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response["duration_ms"] = (time.perf_counter() - started) * 1000
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            logger.info(json.dumps({
+                "ts": timestamp,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": _redact_query(scope.get("query_string", b"")),
+                "headers": _headers(scope["headers"]),
+                "status": response["status"],
+                "bytes": response["bytes"],
+                "duration_ms": round(response.get("duration_ms", (time.perf_counter() - started) * 1000), 3),
+            }))
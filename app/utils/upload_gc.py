@@ -0,0 +1,138 @@
+import logging
+import os
+import time
+
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket
+
+logger = logging.getLogger(__name__)
+
+# Папка загрузок: отсюда её берут роутер билетов и StaticFiles в app.main
+UPLOAD_DIR = "uploaded_tickets"
+# Карантин лежит рядом, а не внутри UPLOAD_DIR, чтобы файлы не раздавались через StaticFiles
+QUARANTINE_DIR = os.getenv("UPLOAD_QUARANTINE_DIR", "uploaded_tickets_orphaned")
+# Свежие файлы не трогаем: билет мог ещё не закоммититься после записи картинки
+ORPHAN_GRACE_SECONDS = int(os.getenv("ORPHAN_GRACE_SECONDS", str(24 * 3600)))
+# Сколько файлы живут в карантине до окончательного удаления
+QUARANTINE_TTL_SECONDS = int(os.getenv("QUARANTINE_TTL_SECONDS", str(7 * 24 * 3600)))
+BATCH_SIZE = 500
+MAX_REPORTED_MISSING = 100
+
+
+def _referenced(db: Session, urls: list) -> set:
+    # Один IN по индексу image_url на пачку файлов, в обеих таблицах
+    query = union_all(
+        select(Ticket.image_url).where(Ticket.image_url.in_(urls)),
+        select(ArchivedTicket.image_url).where(ArchivedTicket.image_url.in_(urls)),
+    )
+    return {url for (url,) in db.execute(query)}
+
+
+def _scan_batches(upload_dir: str, batch_size: int):
+    # scandir отдаёт записи потоком, без списка всей папки в памяти
+    batch = []
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            # Служебные файлы вроде .gitkeep не являются загрузками
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _purge_quarantine(quarantine_dir: str, now: float, dry_run: bool) -> int:
+    if not os.path.isdir(quarantine_dir):
+        return 0
+    purged = 0
+    with os.scandir(quarantine_dir) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and now - entry.stat().st_mtime > QUARANTINE_TTL_SECONDS:
+                if not dry_run:
+                    os.remove(entry.path)
+                purged += 1
+    return purged
+
+
+def _find_missing(db: Session, upload_dir: str, report: dict):
+    # Обратная сверка: билеты, у которых файла на диске нет
+    prefix = f"/{upload_dir}/"
+    query = union_all(
+        select(Ticket.id, Ticket.ticket_number, Ticket.image_url).where(Ticket.image_url.isnot(None)),
+        select(ArchivedTicket.id, ArchivedTicket.ticket_number, ArchivedTicket.image_url).where(ArchivedTicket.image_url.isnot(None)),
+    )
+    for ticket_id, ticket_number, image_url in db.execute(query).yield_per(BATCH_SIZE):
+        if not image_url.startswith(prefix):
+            continue
+        if not os.path.exists(os.path.join(upload_dir, image_url[len(prefix):])):
+            report["missing_count"] += 1
+            if len(report["missing"]) < MAX_REPORTED_MISSING:
+                report["missing"].append({
+                    "ticket_id": str(ticket_id),
+                    "ticket_number": ticket_number,
+                    "image_url": image_url,
+                })
+
+
+def reconcile_uploads(db: Session, upload_dir: str = UPLOAD_DIR, quarantine: bool = True,
+                      dry_run: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    now = time.time()
+    report = {
+        "scanned": 0,
+        "referenced": 0,
+        "orphans": 0,
+        "orphans_in_grace": 0,
+        "quarantined": 0,
+        "deleted": 0,
+        "quarantine_purged": 0,
+        "missing_count": 0,
+        "missing": [],
+        "dry_run": dry_run,
+    }
+    if not os.path.isdir(upload_dir):
+        return report
+
+    if quarantine and not dry_run:
+        os.makedirs(QUARANTINE_DIR, exist_ok=True)
+
+    for batch in _scan_batches(upload_dir, batch_size):
+        report["scanned"] += len(batch)
+        referenced = _referenced(db, [f"/{upload_dir}/{entry.name}" for entry in batch])
+        report["referenced"] += len(referenced)
+
+        for entry in batch:
+            if f"/{upload_dir}/{entry.name}" in referenced:
+                continue
+            report["orphans"] += 1
+            if now - entry.stat().st_mtime < ORPHAN_GRACE_SECONDS:
+                report["orphans_in_grace"] += 1
+                continue
+            if dry_run:
+                continue
+            try:
+                if quarantine:
+                    target = os.path.join(QUARANTINE_DIR, entry.name)
+                    os.replace(entry.path, target)
+                    # Срок карантина отсчитываем от момента переноса
+                    os.utime(target)
+                    report["quarantined"] += 1
+                else:
+                    os.remove(entry.path)
+                    report["deleted"] += 1
+            except FileNotFoundError:
+                pass
+
+    report["quarantine_purged"] = _purge_quarantine(QUARANTINE_DIR, now, dry_run)
+    _find_missing(db, upload_dir, report)
+    logger.info(
+        f"Upload reconcile: scanned={report['scanned']} orphans={report['orphans']} "
+        f"quarantined={report['quarantined']} deleted={report['deleted']} missing={report['missing_count']} "
+        f"dry_run={dry_run}"
+    )
+    return report
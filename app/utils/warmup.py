@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from app.database.db import engine, read_engine, write_engine, replicas, ReadSessionLocal
+from app.models.archived_ticket import ArchivedTicket
+from app.models.ticket import Ticket
+from app.utils.country_stats import get_country_stats
+from app.utils.hot_snapshot import hot_tickets
+from app.utils.template_engine import templates
+
+logger = logging.getLogger(__name__)
+
+# Сколько соединений открыть в каждом пуле заранее
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+# Дольше старт не задерживаем: недогретое приложение лучше, чем неотвечающее
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+
+def _open_connections():
+    engines = [engine] + [e for e in (read_engine, write_engine) if e is not engine] + replicas.engines
+    for target in engines:
+        connections = []
+        try:
+            for _ in range(WARMUP_CONNECTIONS):
+                connection = target.connect()
+                connections.append(connection)
+                connection.execute(text("SELECT 1"))
+                connection.rollback()
+        finally:
+            # Соединения возвращаются в пул открытыми
+            for connection in connections:
+                connection.close()
+
+
+def _compile_templates():
+    # Окружение Jinja кэширует скомпилированные шаблоны - первый рендер не будет их парсить
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.get_template(name)
+
+
+def _prime_queries():
+    # Запросы главных страниц: SQLAlchemy кэширует их компиляцию, база - планы и страницы
+    db = ReadSessionLocal()
+    try:
+        db.query(Ticket).count()
+        db.query(Ticket).filter(Ticket.is_featured == True).all()
+        db.query(Ticket).order_by(Ticket.created_at.desc()).limit(1).all()
+        db.query(ArchivedTicket).count()
+        get_country_stats(db)
+    finally:
+        db.close()
+
+
+def warm_up() -> dict:
+    # Вызывается из lifespan до того, как приложение начнёт принимать запросы.
+    # Ошибки не фатальны: то, что не прогрелось, сделает первый запрос
+    timings = {}
+    for name, step in (
+        ("mappers", configure_mappers),
+        ("connections", _open_connections),
+        ("templates", _compile_templates),
+        ("queries", _prime_queries),
+        ("hot_snapshot", hot_tickets.rebuild),
+    ):
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Warm-up done: {timings} ms")
+    return timings
@@ -0,0 +1,112 @@
+"""Проверка равномерности розыгрыша: хи-квадрат по множеству розыгрышей с известными seed.
+
+Запуск:
+    python scripts/draw_uniformity.py [--draws 5000] [--pool 20] [--winners 3] [--alpha 0.001]
+
+В SQLite-базе в памяти создаётся пул из --pool подходящих билетов вперемешку с тем же
+числом победителей (дырки в пространстве ключей, как после прошлых розыгрышей).
+Оба способа выборки (_sample_by_rejection и _sample_by_enumeration) проводят --draws
+розыгрышей по --winners билетов с seed "uniformity-<i>". Проверяются частота первого
+выбранного билета и частота попадания билета в победители; p-value считается
+аппроксимацией Уилсона-Хилферти. seed фиксированы, поэтому результат воспроизводим.
+Скрипт завершается с кодом 1, если хоть один p-value меньше --alpha. Подходит для CI.
+"""
+import argparse
+import math
+import os
+import sys
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database.db import Base  # noqa: E402
+from app.models.ticket import Ticket  # noqa: E402
+from app.utils.draw import DrawRng, _eligible, _sample_by_enumeration, _sample_by_rejection  # noqa: E402
+
+
+def chi_square_p(statistic: float, df: int) -> float:
+    # P(X >= statistic) для хи-квадрат с df степенями свободы через нормальную аппроксимацию
+    # куба корня (Уилсон-Хилферти); при df >= 10 ошибка в p-value меньше сотых
+    z = ((statistic / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def prefill(db: Session, pool: int):
+    # Чётные ключи - подходящие билеты, нечётные - уже выигравшие
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "ticket_number": f"U{key:06d}",
+            "ticket_key": f"U{key:06d}",
+            "draw_key": key,
+            "is_winner": key % 2 == 1,
+            "status": "winner" if key % 2 else "active",
+        }
+        for key in range(1, 2 * pool + 1)
+    ]
+    db.execute(insert(Ticket), rows)
+    db.commit()
+
+
+def tally(db: Session, method: str, draws: int, winners: int, key_space: int, pool: int) -> dict:
+    eligible = _eligible(db, None)
+    first = {}
+    picked = {}
+    for i in range(draws):
+        rng = DrawRng(f"uniformity-{i}")
+        if method == "rejection":
+            chosen = _sample_by_rejection(eligible, rng, key_space, pool, winners)
+        else:
+            chosen = _sample_by_enumeration(eligible, rng, winners)
+        first[chosen[0].draw_key] = first.get(chosen[0].draw_key, 0) + 1
+        for ticket in chosen:
+            picked[ticket.draw_key] = picked.get(ticket.draw_key, 0) + 1
+        db.expunge_all()
+    return {"first": first, "picked": picked}
+
+
+def statistic(observed: dict, keys: list, expected: float) -> float:
+    return sum((observed.get(key, 0) - expected) ** 2 / expected for key in keys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chi-square uniformity check for the winner draw")
+    parser.add_argument("--draws", type=int, default=5000)
+    parser.add_argument("--pool", type=int, default=20, help="Eligible tickets")
+    parser.add_argument("--winners", type=int, default=3, help="Winners per draw")
+    parser.add_argument("--alpha", type=float, default=0.001)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    prefill(db, args.pool)
+    keys = list(range(2, 2 * args.pool + 1, 2))
+    df = args.pool - 1
+    share = args.winners / args.pool
+
+    failed = False
+    print(f"{args.draws} draws of {args.winners} from {args.pool} eligible tickets, alpha {args.alpha}")
+    for method in ("rejection", "enumerate"):
+        result = tally(db, method, args.draws, args.winners, 2 * args.pool, args.pool)
+        stray = set(result["picked"]) - set(keys)
+        checks = {
+            "first pick": statistic(result["first"], keys, args.draws / args.pool),
+            # Без возвращения счётчики отрицательно связаны: статистика ~ (1 - k/n) * хи-квадрат
+            "any pick": statistic(result["picked"], keys, args.draws * share) / (1 - share),
+        }
+        for name, value in checks.items():
+            p_value = chi_square_p(value, df)
+            print(f"  {method:9} {name:10}: chi2 {value:7.2f} (df {df})  p {p_value:.4f}")
+            if p_value < args.alpha:
+                print(f"FAIL: {method} {name} is not uniform")
+                failed = True
+        if stray:
+            print(f"FAIL: {method} picked ineligible tickets: {sorted(stray)}")
+            failed = True
+    sys.exit(1 if failed else 0)
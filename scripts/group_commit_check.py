@@ -0,0 +1,158 @@
+"""Проверка group commit: параллельные POST /tickets/create с дублями внутри одной пачки.
+
+Запуск:
+    python scripts/group_commit_check.py [--tickets 40] [--duplicates 8] [--window-ms 50]
+
+Приложение поднимается в процессе с GROUP_COMMIT_ENABLED=true на чистой SQLite-базе
+в --workdir и получает все запросы разом, без сети. Для первых --duplicates номеров
+отправляется ещё один запрос с тем же номером в другом написании (регистр, префикс
+baylot:, пробелы) - после нормализации это тот же билет, и он попадает в ту же пачку.
+Ожидается ровно один 200 на номер и один 409 на каждый дубль, а в базе - ровно одна
+строка билета, одно событие created в журнале и +1 в счётчике страны на каждый успех.
+Скрипт завершается с кодом 1, если что-то не сошлось. Подходит для CI.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ADMIN_KEY = "group-commit-check"
+COUNTRY = "TJ"
+
+
+def variants(number: str):
+    # Другое написание того же номера: normalize_ticket_number даёт тот же ключ
+    return [number.lower(), f"baylot: {number}", f" {number[:2]} {number[2:]} "]
+
+
+async def fire(client, number: str) -> tuple:
+    response = await client.post(
+        "/tickets/create",
+        data={"admin_key": ADMIN_KEY, "ticket_number": number, "country_code": COUNTRY},
+        files={"file": ("check.jpg", b"group-commit-check")},
+        headers={"x-admin-key": ADMIN_KEY, "accept": "application/json"},
+    )
+    body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+    return number, response.status_code, body
+
+
+async def run(requests: list) -> list:
+    import httpx
+
+    from app.main import app
+
+    # Ошибка в обработчике - это ответ 500 и строка FAIL, а не падение проверки
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+        return await asyncio.gather(*(fire(client, number) for number in requests))
+
+
+class BatchSizes(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.sizes = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("Group commit:"):
+            self.sizes.append(int(message.split()[2]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group commit correctness check")
+    parser.add_argument("--tickets", type=int, default=40, help="Distinct ticket numbers")
+    parser.add_argument("--duplicates", type=int, default=8, help="Numbers sent twice in the same burst")
+    parser.add_argument("--window-ms", type=float, default=50, help="GROUP_COMMIT_WINDOW_MS for the run")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.workdir, "group_commit_check.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{path}",
+        ADMIN_KEY=ADMIN_KEY,
+        GROUP_COMMIT_ENABLED="true",
+        GROUP_COMMIT_WINDOW_MS=str(args.window_ms),
+        GROUP_COMMIT_MAX_ROWS=str(args.tickets + args.duplicates),
+        JOBS_ENABLED="false",
+        RATE_LIMIT_ENABLED="false",
+    )
+    # StaticFiles и папка загрузок заданы относительно корня репозитория
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.INFO)
+
+    from sqlalchemy import func
+
+    import app.main  # noqa: F401 - регистрирует все модели в Base.metadata
+    from app.database.db import Base, SessionLocal, engine
+    from app.models.country_stats import CountryStats
+    from app.models.ticket import Ticket
+    from app.models.ticket_change import TicketChange
+    from app.utils.ticket_number import normalize_ticket_number
+    from app.utils.upload_gc import UPLOAD_DIR
+
+    Base.metadata.create_all(engine)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    batches = BatchSizes()
+    group_logger = logging.getLogger("app.utils.group_commit")
+    group_logger.addHandler(batches)
+    group_logger.setLevel(logging.DEBUG)
+    group_logger.propagate = False
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.disable(logging.NOTSET)
+
+    numbers = [f"GC{index:05d}" for index in range(args.tickets)]
+    duplicated = numbers[:args.duplicates]
+    requests = numbers + [random.Random(index).choice(variants(number)) for index, number in enumerate(duplicated)]
+    random.Random(0).shuffle(requests)
+    results = asyncio.run(run(requests))
+
+    by_key = {}
+    for number, status_code, body in results:
+        by_key.setdefault(normalize_ticket_number(number), []).append((status_code, body))
+
+    failures = []
+    created_urls = []
+    for number in numbers:
+        codes = sorted(status for status, _ in by_key.get(number, []))
+        expected = [200, 409] if number in duplicated else [200]
+        if codes != expected:
+            failures.append(f"{number}: responses {codes}, expected {expected}")
+        created_urls += [body["image_url"] for status, body in by_key.get(number, []) if status == 200]
+
+    db = SessionLocal()
+    try:
+        rows = dict(db.query(Ticket.ticket_key, func.count()).group_by(Ticket.ticket_key).all())
+        created = db.query(func.count()).select_from(TicketChange).filter(TicketChange.action == "created").scalar()
+        stats = db.query(CountryStats.total_tickets).filter(CountryStats.country_code == COUNTRY).scalar()
+    finally:
+        db.close()
+    if rows != dict.fromkeys(numbers, 1):
+        extra = {key: count for key, count in rows.items() if count != 1 or key not in numbers}
+        failures.append(f"tickets table: {len(rows)} keys, expected {len(numbers)}; unexpected {extra}")
+    if created != len(numbers):
+        failures.append(f"change feed: {created} created events, expected {len(numbers)}")
+    if stats != len(numbers):
+        failures.append(f"country_stats: {stats} tickets, expected {len(numbers)}")
+    if not any(size > 1 for size in batches.sizes):
+        failures.append(f"no batch had more than one write (batches: {batches.sizes}), group commit was not exercised")
+
+    # Картинки успешных запросов (картинки 409 удаляет сам обработчик)
+    for url in created_urls:
+        file_path = url.lstrip("/")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    ok = sum(1 for _, status, _ in results if status == 200)
+    conflicts = sum(1 for _, status, _ in results if status == 409)
+    print(f"{len(requests)} concurrent creates: {ok} x 200, {conflicts} x 409; batches {batches.sizes}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,59 @@
+"""Проверка холодного старта: сколько стоит import app.main и что при этом подгружается.
+
+Запуск:
+    python scripts/import_budget.py --budget-ms 1200 [--runs 5]
+
+Каждый замер - отдельный процесс, берётся медиана. Скрипт завершается с кодом 1,
+если импорт дольше бюджета или если при старте подгрузился модуль, который
+должен импортироваться лениво (LAZY_MODULES). Подходит для CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Нужны только отдельным эндпоинтам - при старте их быть не должно
+LAZY_MODULES = ("httpx", "werkzeug")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget for app.main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1200")))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///./sql_app.db")
+    env["PYTHONPATH"] = ROOT
+    results = [measure(env) for _ in range(args.runs)]
+    median = statistics.median(result["ms"] for result in results)
+    loaded = sorted({name for result in results for name in result["loaded"]})
+
+    print(f"import app.main: median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if median > args.budget_ms:
+        print("FAIL: over budget; run `python -X importtime -c 'import app.main'` to see what grew")
+        failed = True
+    if loaded:
+        print(f"FAIL: loaded at startup but should be lazy: {', '.join(loaded)}")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,214 @@
+"""Проверка потолков памяти для тяжёлых страниц и выгрузок на больших таблицах.
+
+Запуск:
+    python scripts/memory_budget.py --sizes 100000,1000000 [--workdir /tmp/memory_budget]
+
+Для каждого размера отдельный процесс заполняет SQLite-базу (живые билеты, архив,
+журнал изменений; база в --workdir переиспользуется между запусками) и прогоняет
+ENDPOINTS через само приложение в памяти, без сети. Тело ответа не копится:
+считается пик tracemalloc за запрос, включая выделения в потоках обработчиков.
+Потолки не зависят от размера - страницы стримятся курсором, и рост пика с числом
+билетов и есть регрессия. Скрипт завершается с кодом 1, если хоть один маршрут
+вышел за потолок. Подходит для CI.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ADMIN_KEY = "memory-budget"
+
+# Маршрут -> потолок пика в МБ
+ENDPOINTS = {
+    "/": 16,
+    "/tickets/all/html": 16,
+    "/?archiv=true": 16,
+    "/tickets/winners/html": 4,
+    "/archived-tickets": 8,
+    "/tickets/archived": 8,
+    "/tickets/changes?since=0&limit=500": 8,
+}
+BATCH_SIZE = 10000
+# Доля архивных билетов; избранных и победителей фиксированное число, как в жизни
+ARCHIVED_SHARE = 0.2
+FEATURED = 20
+WINNERS = 50
+
+
+def seed(size: int):
+    from sqlalchemy import insert
+
+    import app.main  # noqa: F401 - регистрирует все модели в Base.metadata
+    from app.database.db import Base, engine
+    from app.models.archived_ticket import ArchivedTicket
+    from app.models.ticket import Ticket
+    from app.models.ticket_change import TicketChange
+
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("SELECT count(*) FROM tickets").scalar() + conn.exec_driver_sql(
+            "SELECT count(*) FROM archived_tickets"
+        ).scalar() == size:
+            return
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    archived_count = int(size * ARCHIVED_SHARE)
+    started = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, size, BATCH_SIZE):
+            tickets, archived, changes = [], [], []
+            for index in range(offset, min(offset + BATCH_SIZE, size)):
+                number = f"MB{index:08d}"
+                row = {
+                    "id": uuid.uuid4(),
+                    "ticket_number": number,
+                    "ticket_key": number,
+                    "country_code": ("TJ", "RU", "KZ", "UZ")[index % 4],
+                    "image_url": f"/uploaded_tickets/{number}.jpg",
+                    "status": "active",
+                    "is_winner": index % (size // WINNERS or 1) == 0,
+                    "is_featured": index < FEATURED,
+                    "holder_info": f"Holder {index}",
+                    "prize_description": "Prize" if index % (size // WINNERS or 1) == 0 else None,
+                    "created_at": started + timedelta(seconds=index),
+                }
+                changes.append({"ticket_id": row["id"], "ticket_number": number, "action": "created", "changed_at": row["created_at"]})
+                if index < archived_count:
+                    archived.append({**row, "is_archived": True, "archived_at": row["created_at"], "draw_key": index + 1})
+                else:
+                    tickets.append({**row, "draw_key": index + 1})
+            if tickets:
+                conn.execute(insert(Ticket), tickets)
+            if archived:
+                conn.execute(insert(ArchivedTicket), archived)
+            conn.execute(insert(TicketChange), changes)
+
+
+async def fetch(app, target: str) -> dict:
+    # Минимальный ASGI-клиент: тело ответа только считаем, чтобы оно не попадало в замер
+    path, _, query = target.partition("?")
+    done = asyncio.Event()
+    result = {"status": None, "bytes": 0}
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            result["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"memory-budget"), (b"x-admin-key", ADMIN_KEY.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("memory-budget", 80),
+    }
+    await app(scope, receive, send)
+    done.set()
+    return result
+
+
+async def measure_all(app) -> dict:
+    import tracemalloc
+
+    results = {}
+    for target in ENDPOINTS:
+        gc.collect()
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        response = await fetch(app, target)
+        _, peak = tracemalloc.get_traced_memory()
+        results[target] = {
+            "status": response["status"],
+            "bytes": response["bytes"],
+            "seconds": round(time.perf_counter() - started, 2),
+            "peak_mb": round(max(0, peak - start) / 1024 / 1024, 2),
+        }
+    return results
+
+
+def probe(size: int):
+    seed(size)
+    import tracemalloc
+
+    from app.main import app
+    from app.utils.warmup import warm_up
+
+    # Шаблоны, соединения и кэши запросов греем до замера - это разовая стоимость, не запроса
+    warm_up()
+    tracemalloc.start()
+    print(json.dumps(asyncio.run(measure_all(app))))
+
+
+def run_size(size: int, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'memory_{size}.db')}",
+        ADMIN_KEY=ADMIN_KEY,
+        JOBS_ENABLED="false",
+        RATE_LIMIT_ENABLED="false",
+        PYTHONPATH=ROOT,
+    )
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", os.path.abspath(__file__), "--probe", str(size)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory ceilings for list, export and archive endpoints")
+    parser.add_argument("--sizes", default="100000", help="Comma-separated ticket counts, e.g. 100000,1000000")
+    parser.add_argument("--workdir", default=os.path.join(ROOT, "captures", "memory_budget"))
+    parser.add_argument("--probe", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.probe)
+        sys.exit(0)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    failed = False
+    for size in (int(value) for value in args.sizes.split(",")):
+        results = run_size(size, args.workdir)
+        print(f"{size} tickets:")
+        for target, result in results.items():
+            limit = ENDPOINTS[target]
+            verdict = "ok"
+            if result["status"] != 200:
+                verdict = f"FAIL: status {result['status']}"
+            elif result["peak_mb"] > limit:
+                verdict = "FAIL: over budget"
+            failed = failed or verdict != "ok"
+            print(
+                f"  {target:40} peak {result['peak_mb']:7.2f} MB (budget {limit} MB)"
+                f"  {result['bytes'] / 1024 / 1024:8.1f} MB sent in {result['seconds']:6.2f}s  {verdict}"
+            )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,139 @@
+"""Повтор записанного трафика (TRAFFIC_CAPTURE_ENABLED=true) против локального сервера.
+
+Запуск:
+    python scripts/replay_traffic.py captures/traffic.jsonl --base-url http://127.0.0.1:8000 \\
+        [--speed 1] [--concurrency 16] [--include-writes --admin-key ...]
+
+Запросы уходят с теми же интервалами, что и в записи, ускоренными в --speed раз
+(0 - без пауз, насколько позволяет --concurrency). В конце - таблица по маршрутам:
+время в записи и при повторе (p50/p95), разница медиан и число несовпавших статусов.
+
+По умолчанию повторяются только GET/HEAD: тела POST не записываются, а повтор
+изменений на боевой копии базы опасен. Скрытые значения (REDACTED) в admin_key
+и x-admin-key заменяются на --admin-key, если он указан.
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+REDACTED = "REDACTED"
+SAFE_METHODS = {"GET", "HEAD"}
+# UUID и номера в пути схлопываем, чтобы группировать по маршруту
+ID_RE = re.compile(r"/(?:[0-9a-fA-F-]{32,36}|\d+)(?=/|$)")
+
+
+def load(paths: list, include_writes: bool, limit: int) -> list:
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if include_writes or record["method"] in SAFE_METHODS:
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def route(record: dict) -> str:
+    return f"{record['method']} {ID_RE.sub('/{id}', record['path'])}"
+
+
+def prepare(record: dict, admin_key: str):
+    params = parse_qsl(record.get("query", ""), keep_blank_values=True)
+    params = [(name, admin_key if value == REDACTED and admin_key else value) for name, value in params]
+    headers = {}
+    for name, value in record.get("headers", {}).items():
+        if value == REDACTED:
+            if name == "x-admin-key" and admin_key:
+                headers[name] = admin_key
+            continue
+        headers[name] = value
+    url = record["path"] + (f"?{urlencode(params)}" if params else "")
+    return url, headers
+
+
+async def replay(records: list, base_url: str, speed: float, concurrency: int, admin_key: str) -> list:
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def send(record: dict, delay: float):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            url, headers = prepare(record, admin_key)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with client.stream(record["method"], url, headers=headers) as response:
+                        async for _ in response.aiter_raw():
+                            pass
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = f"error: {type(e).__name__}"
+                elapsed = (time.perf_counter() - started) * 1000
+            results.append((record, status, elapsed))
+
+        first = records[0]["ts"]
+        tasks = [
+            asyncio.create_task(send(record, (record["ts"] - first) / speed if speed > 0 else 0))
+            for record in records
+        ]
+        await asyncio.gather(*tasks)
+    return results
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def report(results: list, wall_seconds: float):
+    by_route = defaultdict(list)
+    for record, status, elapsed in results:
+        by_route[route(record)].append((record, status, elapsed))
+
+    print(f"{len(results)} requests in {wall_seconds:.1f}s ({len(results) / max(wall_seconds, 1e-9):.1f} req/s)")
+    print(f"{'route':<45} {'n':>6} {'rec p50':>9} {'rec p95':>9} {'new p50':>9} {'new p95':>9} {'delta':>8} {'status!=':>8}")
+    rows = sorted(by_route.items(), key=lambda item: -len(item[1]))
+    for name, items in rows:
+        captured = [record["duration_ms"] for record, _, _ in items]
+        replayed = [elapsed for _, _, elapsed in items]
+        mismatched = sum(1 for record, status, _ in items if status != record.get("status"))
+        before, after = statistics.median(captured), statistics.median(replayed)
+        delta = (after - before) / before * 100 if before else 0.0
+        print(
+            f"{name[:45]:<45} {len(items):>6} {before:>9.1f} {percentile(captured, 0.95):>9.1f} "
+            f"{after:>9.1f} {percentile(replayed, 0.95):>9.1f} {delta:>+7.0f}% {mismatched:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latencies")
+    parser.add_argument("files", nargs="+", help="JSONL-файлы записи, в том числе ротированные (.1, .2 ...)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Во сколько раз быстрее записи; 0 - без пауз")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--include-writes", action="store_true", help="Повторять и изменяющие запросы")
+    parser.add_argument("--admin-key", help="Подставляется вместо скрытых admin_key / x-admin-key")
+    parser.add_argument("--limit", type=int, default=0, help="Не больше N первых запросов")
+    args = parser.parse_args()
+
+    records = load(args.files, args.include_writes, args.limit)
+    if not records:
+        print("Nothing to replay")
+        sys.exit(1)
+    started = time.perf_counter()
+    results = asyncio.run(replay(records, args.base_url, args.speed, args.concurrency, args.admin_key))
+    report(results, time.perf_counter() - started)
@@ -0,0 +1,159 @@
+"""Пропускная способность app.launcher в зависимости от числа воркеров и ядер.
+
+Запуск:
+    python scripts/scaling_bench.py [--workers 1,2,4] [--size 20000] [--duration 15] [--concurrency 32]
+
+Для каждого числа воркеров поднимается python -m app.launcher (WEB_CONCURRENCY)
+на SQLite-базе из --workdir (заполняется как в memory_budget.py), после прогрева
+--clients процессов нагружают ROUTES по кругу в течение --duration секунд.
+Печатается req/s, задержки и ускорение относительно одного воркера; эффективность
+считается к min(воркеры, ядра) - больше воркеров, чем ядер, быстрее не станет.
+Клиенты работают на той же машине и отнимают у сервера часть CPU.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ROUTES = ("/tickets/winners/html", "/tickets/count", "/stats", "/tickets/last_ticket", "/stats/countries")
+
+SEED = """
+import sys
+sys.path.insert(0, %r)
+from memory_budget import seed
+seed(%d)
+"""
+
+
+def usable_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+async def _client(base_url: str, duration: float, concurrency: int) -> list:
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def loop(client, offset):
+        nonlocal errors
+        index = offset
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(ROUTES[index % len(ROUTES)])
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            index += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await asyncio.gather(*(loop(client, offset) for offset in range(concurrency)))
+    return [latencies, errors]
+
+
+def client_process(base_url: str, duration: float, concurrency: int, results):
+    results.put(asyncio.run(_client(base_url, duration, concurrency)))
+
+
+def wait_ready(base_url: str, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+def measure(workers: int, args, env: dict) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.launcher"],
+        cwd=ROOT,
+        env={**env, "WEB_CONCURRENCY": str(workers), "PORT": str(args.port), "HOST": "127.0.0.1"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(base_url)
+        # Какой воркер ответил на /ready, неизвестно - даём прогреться всем
+        time.sleep(2)
+        results = multiprocessing.Queue()
+        for duration in (args.warmup, args.duration):
+            clients = [
+                multiprocessing.Process(target=client_process, args=(base_url, duration, args.concurrency, results))
+                for _ in range(args.clients)
+            ]
+            for client in clients:
+                client.start()
+            collected = [results.get() for _ in clients]
+            for client in clients:
+                client.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(60)
+
+    latencies = sorted(latency for part, _ in collected for latency in part)
+    return {
+        "rps": len(latencies) / args.duration,
+        "errors": sum(errors for _, errors in collected),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+    }
+
+
+if __name__ == "__main__":
+    cores = usable_cores()
+    parser = argparse.ArgumentParser(description="Launcher throughput by worker count")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, max(1, cores // 2), cores, cores * 2})))
+    parser.add_argument("--size", type=int, default=20000, help="Tickets in the seeded database")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--clients", type=int, default=cores, help="Load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Connections per client process")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--workdir", default=os.path.join(ROOT, "captures", "memory_budget"))
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(args.workdir, f'memory_{args.size}.db')}",
+        JOBS_ENABLED="false",
+        RATE_LIMIT_ENABLED="false",
+        WORKER_MAX_REQUESTS="0",
+        PYTHONPATH=ROOT,
+    )
+    subprocess.run([sys.executable, "-W", "ignore", "-c", SEED % (os.path.dirname(os.path.abspath(__file__)), args.size)],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+    print(f"{cores} core(s), {args.clients} client process(es) x {args.concurrency} connections")
+    baseline = None
+    for workers in (int(value) for value in args.workers.split(",")):
+        result = measure(workers, args, env)
+        baseline = baseline or result["rps"]
+        speedup = result["rps"] / baseline if baseline else 0
+        print(
+            f"  {workers:3} worker(s): {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms"
+            f"  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']:4}"
+            f"  speedup x{speedup:.2f}  efficiency {speedup / min(workers, cores):.0%}"
+        )
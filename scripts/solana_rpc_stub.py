@@ -0,0 +1,109 @@
+"""Локальная замена Solana JSON-RPC для проверки транзакций без сети.
+
+Запуск:
+    python scripts/solana_rpc_stub.py --port 8899 --wallet <адрес> [--data stub.json]
+    SOLANA_RPC_URL=http://127.0.0.1:8899 uvicorn app.main:app
+
+Транзакции можно передать файлом (список объектов ниже) или добавить на лету:
+    curl -X POST http://127.0.0.1:8899/_stub/transactions \\
+         -H 'Content-Type: application/json' \\
+         -d '{"signature": "...", "confirmationStatus": "finalized", "accounts": ["..."]}'
+
+Поля транзакции: signature, confirmationStatus (processed/confirmed/finalized),
+accounts (список адресов), err (null или описание ошибки), slot.
+"""
+import argparse
+import json
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+app = FastAPI(title="Solana RPC stub")
+transactions = {}
+default_accounts = []
+
+
+def add_transaction(data: dict):
+    transactions[data["signature"]] = {
+        "slot": data.get("slot", 1),
+        "confirmationStatus": data.get("confirmationStatus", "finalized"),
+        "accounts": data.get("accounts") or list(default_accounts),
+        "err": data.get("err"),
+    }
+
+
+def _signature_status(signature: str):
+    tx = transactions.get(signature)
+    if tx is None:
+        return None
+    return {
+        "slot": tx["slot"],
+        "confirmations": None if tx["confirmationStatus"] == "finalized" else 1,
+        "err": tx["err"],
+        "confirmationStatus": tx["confirmationStatus"],
+    }
+
+
+def _transaction(signature: str):
+    tx = transactions.get(signature)
+    if tx is None or tx["confirmationStatus"] == "processed":
+        return None
+    return {
+        "slot": tx["slot"],
+        "meta": {"err": tx["err"]},
+        "transaction": {
+            "signatures": [signature],
+            "message": {
+                "accountKeys": [
+                    {"pubkey": account, "signer": index == 0, "writable": True}
+                    for index, account in enumerate(tx["accounts"])
+                ],
+            },
+        },
+    }
+
+
+def _handle(call: dict) -> dict:
+    method = call.get("method")
+    params = call.get("params") or []
+    if method == "getSignatureStatuses":
+        result = {"context": {"slot": 1}, "value": [_signature_status(s) for s in params[0]]}
+    elif method == "getTransaction":
+        result = _transaction(params[0])
+    else:
+        return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+    return {"jsonrpc": "2.0", "id": call.get("id"), "result": result}
+
+
+@app.post("/")
+async def rpc(request: Request):
+    payload = await request.json()
+    # JSON-RPC batch - массив вызовов, ответ тоже массив
+    if isinstance(payload, list):
+        return [_handle(call) for call in payload]
+    return _handle(payload)
+
+
+@app.post("/_stub/transactions")
+async def stub_add_transaction(request: Request):
+    data = await request.json()
+    add_transaction(data)
+    return {"status": "ok", "count": len(transactions)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Solana JSON-RPC stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--wallet", help="Адрес, который по умолчанию попадает в accounts")
+    parser.add_argument("--data", help="JSON-файл со списком транзакций")
+    args = parser.parse_args()
+
+    if args.wallet:
+        default_accounts.append(args.wallet)
+    if args.data:
+        with open(args.data) as f:
+            for item in json.load(f):
+                add_transaction(item)
+
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,137 @@
+"""Чтение под нагрузкой записи: SQLite по умолчанию против настроек из app/database/db.py.
+
+Запуск:
+    python scripts/sqlite_bench.py --tickets 50000 --readers 4 --seconds 10
+
+Для каждого режима создаётся отдельный файл базы. Один поток пишет билеты по одному
+в своей транзакции, как /tickets/create. Несколько потоков в это время читают то же,
+что и публичные страницы: count, поиск по номеру и последние 50 билетов.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+BENCH_DIR = tempfile.mkdtemp(prefix="sqlite_bench_")
+# app.database.db читает DATABASE_URL при импорте
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(BENCH_DIR, 'import.db')}")
+
+from sqlalchemy import create_engine, func, insert  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database.db import Base, _create_engine  # noqa: E402
+from app.models.ticket import Ticket  # noqa: E402
+import app.models.archived_ticket  # noqa: E402,F401
+import app.models.ticket_change  # noqa: E402,F401
+
+
+def make_engines(mode: str, path: str):
+    url = f"sqlite:///{path}"
+    if mode == "default":
+        engine = create_engine(url)
+        return engine, engine
+    return _create_engine(url, sqlite_begin="BEGIN IMMEDIATE"), _create_engine(url)
+
+
+def prefill(engine, count: int):
+    Base.metadata.create_all(engine)
+    rows = [
+        {"id": uuid.uuid4(), "ticket_number": f"{i:08d}", "ticket_key": f"{i:08d}", "draw_key": i + 1, "country_code": "TJ"}
+        for i in range(count)
+    ]
+    with engine.begin() as conn:
+        for start in range(0, count, 5000):
+            conn.execute(insert(Ticket), rows[start:start + 5000])
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(mode: str, tickets: int, readers: int, seconds: float) -> dict:
+    path = os.path.join(BENCH_DIR, f"{mode}.db")
+    write_engine, read_engine = make_engines(mode, path)
+    prefill(write_engine, tickets)
+
+    stop = threading.Event()
+    stats = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def writer():
+        number = tickets
+        while not stop.is_set():
+            number += 1
+            try:
+                with Session(write_engine) as db:
+                    db.add(Ticket(ticket_number=f"{number:08d}", country_code="TJ", status="active"))
+                    db.commit()
+                with lock:
+                    stats["writes"] += 1
+            except OperationalError:
+                with lock:
+                    stats["write_errors"] += 1
+
+    def reader(seed: int):
+        step = 0
+        while not stop.is_set():
+            step += 1
+            started = time.perf_counter()
+            try:
+                with Session(read_engine) as db:
+                    db.query(func.count(Ticket.id)).scalar()
+                    db.query(Ticket).filter(Ticket.ticket_key == f"{(seed * 7919 + step) % tickets:08d}").first()
+                    db.query(Ticket).order_by(Ticket.created_at.desc()).limit(50).all()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats["reads"] += 1
+                    latencies.append(elapsed)
+            except OperationalError:
+                with lock:
+                    stats["read_errors"] += 1
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    write_engine.dispose()
+    read_engine.dispose()
+
+    return {
+        "mode": mode,
+        "reads_per_s": stats["reads"] / seconds,
+        "writes_per_s": stats["writes"] / seconds,
+        "read_p50_ms": percentile(latencies, 0.5) * 1000,
+        "read_p99_ms": percentile(latencies, 0.99) * 1000,
+        "read_errors": stats["read_errors"],
+        "write_errors": stats["write_errors"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite read throughput under concurrent writes")
+    parser.add_argument("--tickets", type=int, default=50_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--modes", default="default,tuned")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(","):
+        result = run(mode, args.tickets, args.readers, args.seconds)
+        print(
+            f"{result['mode']:>8}: reads {result['reads_per_s']:8.1f}/s  writes {result['writes_per_s']:7.1f}/s  "
+            f"read p50 {result['read_p50_ms']:6.1f} ms  p99 {result['read_p99_ms']:7.1f} ms  "
+            f"errors r/w {result['read_errors']}/{result['write_errors']}"
+        )
+    print(f"Databases left in {BENCH_DIR}")